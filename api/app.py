@@ -1,22 +1,81 @@
-from flask import Flask, render_template_string, request, jsonify, Response
-import requests
-from bs4 import BeautifulSoup
+from flask import Flask, render_template_string, request, jsonify, Response, stream_with_context, send_from_directory
+import logging
 import os
+import threading
 import time
 from urllib.parse import urljoin, urlparse
-import re
 import csv
 from datetime import datetime
 import io
-try:
-    from universal_scraper import UniversalStoreScraper
-    universal_scraper = UniversalStoreScraper()
-except ImportError:
-    print("Warning: universal_scraper not found, using legacy extraction only")
-    universal_scraper = None
+import record_stream
+from coalescer import RequestCoalescer
+from charset import decode_response
+import concurrency
+from concurrency import HostBlocked, fetch_limiter, host_limiter, parse_limiter
+import metrics
+from metrics import timer
+import fetcher
+from fetcher import FetchAborted, fetch_page, is_binary_url
+import retry
+from retry import CircuitOpen, fetch_with_retry
+from page_limits import parsed_page
+from job_profiler import JobProfiler, profiled_iter
+from scraper_log import get_logger, job_context, with_job_context
+
+logger = get_logger('api')
+
+# コールドスタートを短くするため、requests・bs4・universal_scraper・patterns（正規表現のコンパイル）は
+# 最初に使う時点で読み込む。SCRAPER_LAZY_IMPORTS=0 の場合は起動時にすべて読み込む
+LAZY_IMPORTS = os.environ.get('SCRAPER_LAZY_IMPORTS', '1') != '0'
+
+_universal_scraper_lock = threading.Lock()
+_universal_scraper = None
+_universal_scraper_loaded = False
+
+def get_universal_scraper():
+    """汎用スクレイパーを初回の呼び出し時に生成（universal_scraper がない場合は None）"""
+    global _universal_scraper, _universal_scraper_loaded
+    if _universal_scraper_loaded:
+        return _universal_scraper
+    with _universal_scraper_lock:
+        if not _universal_scraper_loaded:
+            try:
+                from universal_scraper import UniversalStoreScraper
+                _universal_scraper = UniversalStoreScraper()
+            except ImportError:
+                logger.warning("universal_scraper not found, using legacy extraction only")
+            _universal_scraper_loaded = True
+    return _universal_scraper
+
+def preload():
+    """遅延読み込みの対象をすべて読み込む（常駐プロセスで初回リクエストの待ち時間をなくす場合）"""
+    import requests
+    import bs4
+    import patterns
+    get_universal_scraper()
+
+if not LAZY_IMPORTS:
+    preload()
 
 app = Flask(__name__)
 
+# 同一URLの同時リクエストを1回のクロールにまとめる（完了結果は SCRAPE_RESULT_TTL 秒間再利用）
+coalescer = RequestCoalescer()
+
+# profile を指定したリクエストのプロファイルの保存先（Vercel では /tmp のみ書き込み可能）
+PROFILE_DIR = os.environ.get('SCRAPER_PROFILE_DIR', '/tmp')
+
+# 1リクエストの取得（再試行の待ち時間を含む）にかける最大秒数
+# Vercel の実行時間の上限（vercel.json の maxDuration: 30秒）からCSVの作成と応答の分を引いた時間
+REQUEST_BUDGET = float(os.environ.get('SCRAPER_REQUEST_BUDGET', '25'))
+
+# 取得を打ち切った理由ごとのエラーメッセージ
+ABORT_MESSAGES = {
+    fetcher.ABORT_DEADLINE: 'アクセスタイムアウト: ページの受信が時間内に終わりませんでした（サーバーの応答が遅い可能性があります）',
+    fetcher.ABORT_TOO_LARGE: 'ページのサイズが大きすぎるため取得を中止しました',
+    fetcher.ABORT_NOT_HTML: 'HTMLページではありません（PDF・画像などのファイルのURLです）',
+}
+
 @app.route('/')
 def index():
     """メインページ"""
@@ -245,17 +304,18 @@ def extract_clinic_info(soup, url, clinic_name=""):
     domain = urlparse(url).netloc
     
     # デバッグログ
-    print(f"[DEBUG] extract_clinic_info - URL: {url}, Domain: {domain}")
+    logger.debug("extract_clinic_info - URL: %s, Domain: %s", url, domain)
     
     # 特定のサイトの場合はレガシー抽出を使用
     legacy_domains = ['dioclinic', 'eminal-clinic', 'frey-a', 'seishin-biyou', 'rizeclinic', 's-b-c.net', 'aoki-tsuyoshi.com']
     
     for legacy_domain in legacy_domains:
         if legacy_domain in domain:
-            print(f"[DEBUG] Using legacy extraction for {legacy_domain}")
+            logger.debug("Using legacy extraction for %s", legacy_domain)
             return extract_clinic_info_legacy(soup, url, clinic_name)
     
     # それ以外は汎用スクレイパーを使用（利用可能な場合）
+    universal_scraper = get_universal_scraper()
     if universal_scraper:
         result = universal_scraper.extract_store_info(soup, url, clinic_name)
         
@@ -280,6 +340,7 @@ def extract_clinic_info(soup, url, clinic_name=""):
 
 def extract_clinic_info_legacy(soup, url, clinic_name=""):
     """Legacy extraction method (kept for reference)"""
+    import patterns
     clinic_info = {
         'name': clinic_name,
         'address': '',
@@ -290,13 +351,13 @@ def extract_clinic_info_legacy(soup, url, clinic_name=""):
     from urllib.parse import urlparse
     domain = urlparse(url).netloc
     
-    print(f"[DEBUG] extract_clinic_info_legacy - Domain: {domain}, URL: {url}")
+    logger.debug("extract_clinic_info_legacy - Domain: %s, URL: %s", domain, url)
     
     # Log HTML structure for debugging
-    if 'frey-a' in domain:
+    if 'frey-a' in domain and logger.isEnabledFor(logging.DEBUG):
         dl_count = len(soup.find_all('dl'))
         tr_count = len(soup.find_all('tr'))
-        print(f"[DEBUG] Freya page structure - DL elements: {dl_count}, TR elements: {tr_count}")
+        logger.debug("Freya page structure - DL elements: %d, TR elements: %d", dl_count, tr_count)
     
     # DIOクリニック
     if 'dioclinic' in domain:
@@ -332,19 +393,20 @@ def extract_clinic_info_legacy(soup, url, clinic_name=""):
     
     # フレイアクリニック
     elif 'frey-a' in domain:
-        print(f"[DEBUG] Processing Freya clinic - URL: {url}")
-        
-        # デバッグ: ページ全体のテキストを確認
-        page_text = soup.get_text()
-        if '〒' in page_text:
-            print(f"[DEBUG] Postal code found in page text")
-        else:
-            print(f"[DEBUG] No postal code found in page text")
-            # ページタイトルとサンプルテキストを出力
-            title = soup.find('title')
-            if title:
-                print(f"[DEBUG] Page title: {title.get_text()}")
-            print(f"[DEBUG] First 200 chars: {page_text[:200]}")
+        logger.debug("Processing Freya clinic - URL: %s", url)
+        
+        # デバッグ: ページ全体のテキストを確認（DEBUG ログが有効な場合のみ）
+        if logger.isEnabledFor(logging.DEBUG):
+            page_text = soup.get_text()
+            if '〒' in page_text:
+                logger.debug("Postal code found in page text")
+            else:
+                logger.debug("No postal code found in page text")
+                # ページタイトルとサンプルテキストを出力
+                title = soup.find('title')
+                if title:
+                    logger.debug("Page title: %s", title.get_text())
+                logger.debug("First 200 chars: %s", page_text[:200])
         
         # 店舗名 - h1タグから取得し、不要な部分を削除
         h1_elem = soup.find('h1')
@@ -354,11 +416,11 @@ def extract_clinic_info_legacy(soup, url, clinic_name=""):
             if '医療脱毛するなら' in name:
                 name = name.split('医療脱毛するなら')[-1].strip()
             clinic_info['name'] = name
-            print(f"[DEBUG] Freya name found: {clinic_info['name']}")
+            logger.debug("Freya name found: %s", clinic_info['name'])
         
         # dl/dt/dd構造から情報抽出（フレイアクリニックの現在の構造）
         dl_elems = soup.find_all('dl')
-        print(f"[DEBUG] Found {len(dl_elems)} dl elements")
+        logger.debug("Found %d dl elements", len(dl_elems))
         for dl in dl_elems:
             dts = dl.find_all('dt')
             dds = dl.find_all('dd')
@@ -371,7 +433,7 @@ def extract_clinic_info_legacy(soup, url, clinic_name=""):
                     # 住所から余分な情報を削除
                     address = value.split('当院には')[0].strip()
                     clinic_info['address'] = address
-                    print(f"[DEBUG] Freya address found: {clinic_info['address']}")
+                    logger.debug("Freya address found: %s", clinic_info['address'])
                 elif '最寄り駅' in header or 'アクセス' in header:
                     # アクセス情報から最も近い駅を抽出
                     access_text = value.split('出口まで')[0].strip()
@@ -379,7 +441,7 @@ def extract_clinic_info_legacy(soup, url, clinic_name=""):
                     access_lines = access_text.split('\n')
                     if access_lines:
                         clinic_info['access'] = access_lines[0].strip()
-                        print(f"[DEBUG] Freya access found: {clinic_info['access']}")
+                        logger.debug("Freya access found: %s", clinic_info['access'])
         
         # もしdl構造で見つからない場合は、テーブルから情報抽出（旧構造対応）
         if not clinic_info['address']:
@@ -395,36 +457,28 @@ def extract_clinic_info_legacy(soup, url, clinic_name=""):
         
         # 最終的にまだ見つからない場合は正規表現でテキスト全体から抽出
         if not clinic_info['address'] or not clinic_info['access']:
-            print(f"[DEBUG] Freya - Falling back to regex extraction")
+            logger.debug("Freya - Falling back to regex extraction")
             text_content = soup.get_text()
             
             # 住所パターン
             if not clinic_info['address']:
-                address_patterns = [
-                    r'〒\d{3}-\d{4}\s*[^\n]*?(?:市|区|町|村)[^\n]*?(?:ビル|館|[0-9]+階)',
-                    r'〒\d{3}-\d{4}[^\n]*',
-                ]
-                for pattern in address_patterns:
-                    match = re.search(pattern, text_content)
+                for pattern in patterns.FREYA_ADDRESS_PATTERNS:
+                    match = pattern.search(text_content)
                     if match:
                         clinic_info['address'] = match.group(0).strip()
-                        print(f"[DEBUG] Freya address found via regex: {clinic_info['address']}")
+                        logger.debug("Freya address found via regex: %s", clinic_info['address'])
                         break
             
             # アクセスパターン
             if not clinic_info['access']:
-                access_patterns = [
-                    r'([^\s]+駅)[^\n]*?(?:から|より)?[^\n]*?(?:徒歩)?[^\n]*?(\d+)分',
-                    r'([^\s]+線)[^\n]*?「?([^\s]+駅)」?[^\n]*?(?:徒歩)?[^\n]*?(\d+)分',
-                ]
-                for pattern in access_patterns:
-                    matches = re.findall(pattern, text_content)
+                for pattern in patterns.FREYA_ACCESS_PATTERNS:
+                    matches = pattern.findall(text_content)
                     if matches:
                         if len(matches[0]) == 2:
                             clinic_info['access'] = f"{matches[0][0]}から徒歩約{matches[0][1]}分"
                         elif len(matches[0]) == 3:
                             clinic_info['access'] = f"{matches[0][1]}から徒歩約{matches[0][2]}分"
-                        print(f"[DEBUG] Freya access found via regex: {clinic_info['access']}")
+                        logger.debug("Freya access found via regex: %s", clinic_info['access'])
                         break
     
     # 聖心美容クリニック
@@ -438,33 +492,21 @@ def extract_clinic_info_legacy(soup, url, clinic_name=""):
         text_content = soup.get_text()
         
         # 住所パターンの改良
-        address_patterns = [
-            r'〒\d{3}-\d{4}\s*[^\n]*?(?:市|区|町|村)[^\n]*?(?:丁目|番地|[0-9]+F?)',
-            r'〒\d{3}-\d{4}[^\n]*',
-            r'(?:東京都|大阪府|京都府|北海道|.*?県)[^\n]*?(?:市|区|町|村)[^\n]*?[0-9]',
-        ]
-        
-        for pattern in address_patterns:
-            match = re.search(pattern, text_content)
+        for pattern in patterns.CLINIC_ADDRESS_PATTERNS:
+            match = pattern.search(text_content)
             if match:
                 address = match.group(0).strip()
                 # 余分な改行や空白を除去
-                address = re.sub(r'\s+', ' ', address)
+                address = patterns.WHITESPACE.sub(' ', address)
                 clinic_info['address'] = address
                 break
         
         # アクセス情報の抽出 - 聖心美容クリニック専用パターン
-        access_patterns = [
-            r'([^\s]+駅)[^\n]*?(?:から|より)[^\n]*?(?:徒歩|歩いて)[^\n]*?(\d+)分',
-            r'([^\s]+駅)[^\n]*?(?:徒歩|歩いて)[^\n]*?(\d+)分',
-            r'アクセス[^\n]*?([^\s]+駅)[^\n]*?(\d+)分',
-        ]
-        
         found_station = None
         min_minutes = 999
         
-        for pattern in access_patterns:
-            matches = re.findall(pattern, text_content)
+        for pattern in patterns.CLINIC_ACCESS_LABEL_PATTERNS:
+            matches = pattern.findall(text_content)
             for match in matches:
                 if len(match) == 2:
                     station = match[0]
@@ -481,8 +523,7 @@ def extract_clinic_info_legacy(soup, url, clinic_name=""):
         
         # もしアクセス情報が見つからない場合、「○○駅」だけでも検索
         if not clinic_info['access']:
-            simple_station_pattern = r'([^\s]+駅)'
-            matches = re.findall(simple_station_pattern, text_content)
+            matches = patterns.STATION.findall(text_content)
             if matches:
                 # 最初に見つかった駅を使用
                 clinic_info['access'] = f"{matches[0]}最寄り"
@@ -504,32 +545,20 @@ def extract_clinic_info_legacy(soup, url, clinic_name=""):
         
         # 住所の抽出
         text_content = soup.get_text()
-        address_patterns = [
-            r'〒\d{3}-\d{4}\s*[^\n]*?(?:市|区|町|村)[^\n]*?(?:丁目|番地|[0-9]+F?)',
-            r'〒\d{3}-\d{4}[^\n]*',
-            r'(?:東京都|大阪府|京都府|北海道|.*?県)[^\n]*?(?:市|区|町|村)[^\n]*?[0-9]',
-        ]
-        
-        for pattern in address_patterns:
-            match = re.search(pattern, text_content)
+        for pattern in patterns.CLINIC_ADDRESS_PATTERNS:
+            match = pattern.search(text_content)
             if match:
                 address = match.group(0).strip()
-                address = re.sub(r'\s+', ' ', address)
+                address = patterns.WHITESPACE.sub(' ', address)
                 clinic_info['address'] = address
                 break
         
         # アクセス情報の抽出
-        access_patterns = [
-            r'([^\s]+駅)[^\n]*?(?:から|より)[^\n]*?(?:徒歩|歩いて)[^\n]*?(\d+)分',
-            r'([^\s]+駅)[^\n]*?(?:徒歩|歩いて)[^\n]*?(\d+)分',
-            r'アクセス[^\n]*?([^\s]+駅)[^\n]*?(\d+)分',
-        ]
-        
         found_station = None
         min_minutes = 999
         
-        for pattern in access_patterns:
-            matches = re.findall(pattern, text_content)
+        for pattern in patterns.CLINIC_ACCESS_LABEL_PATTERNS:
+            matches = pattern.findall(text_content)
             for match in matches:
                 if len(match) == 2:
                     station = match[0]
@@ -546,8 +575,7 @@ def extract_clinic_info_legacy(soup, url, clinic_name=""):
         
         # アクセス情報が見つからない場合、駅名だけでも検索
         if not clinic_info['access']:
-            simple_station_pattern = r'([^\s]+駅)'
-            matches = re.findall(simple_station_pattern, text_content)
+            matches = patterns.STATION.findall(text_content)
             if matches:
                 clinic_info['access'] = f"{matches[0]}最寄り"
     
@@ -578,13 +606,8 @@ def extract_clinic_info_legacy(soup, url, clinic_name=""):
                     # アクセスパターン（駅から徒歩）
                     if not clinic_info['access']:
                         parent_text = parent.get_text()
-                        access_patterns = [
-                            r'([^\s]+駅)[^\n]*?(?:徒歩|歩いて)[^\n]*?(\d+)分',
-                            r'([^\s]+駅)[^\n]*?(\d+)分',
-                        ]
-                        
-                        for pattern in access_patterns:
-                            matches = re.findall(pattern, parent_text)
+                        for pattern in patterns.TCB_ACCESS_PATTERNS:
+                            matches = pattern.findall(parent_text)
                             if matches:
                                 station = matches[0][0]
                                 minutes = matches[0][1]
@@ -621,19 +644,12 @@ def extract_clinic_info_legacy(soup, url, clinic_name=""):
         
         # アクセス情報は正規表現で抽出
         text_content = soup.get_text()
-        # 複数の駅情報パターンを探す
-        station_patterns = [
-            r'「([^\s]+駅)」[^\n]*?(?:徒歩|歩いて)[^\n]*?(\d+)分',
-            r'「([^\s]+停留場)」[^\n]*?(?:徒歩|歩いて)[^\n]*?(\d+)分',
-            r'([^\s]+駅)[^\n]*?(?:徒歩|歩いて)[^\n]*?(\d+)分',
-        ]
-        
         found_station = None
         min_minutes = 999
         
-        # 最も近い駅を探す
-        for pattern in station_patterns:
-            matches = re.findall(pattern, text_content)
+        # 複数の駅情報パターンから最も近い駅を探す
+        for pattern in patterns.RIZE_STOP_ACCESS_PATTERNS:
+            matches = pattern.findall(text_content)
             for match in matches:
                 if len(match) == 2:
                     station = match[0]
@@ -661,29 +677,19 @@ def extract_clinic_info_legacy(soup, url, clinic_name=""):
                         break
         
         # 住所の抽出（住所っぽいパターン）
-        address_patterns = [
-            r'〒\d{3}-\d{4}.*?(?:都|道|府|県).*?(?:市|区|町|村)',
-            r'(?:東京都|大阪府|京都府|北海道|.*?県).*?(?:市|区|町|村).*?\d+',
-        ]
-        
         text_content = soup.get_text()
-        for pattern in address_patterns:
-            match = re.search(pattern, text_content)
+        for pattern in patterns.GENERIC_ADDRESS_PATTERNS:
+            match = pattern.search(text_content)
             if match:
                 clinic_info['address'] = match.group(0)
                 break
         
         # アクセス情報の抽出（駅名と徒歩分数）
-        access_patterns = [
-            r'([^\s]+駅).*?(?:徒歩|歩いて).*?(\d+)分',
-            r'([^\s]+停留場).*?(?:徒歩|歩いて).*?(\d+)分',
-        ]
-        
         found_station = None
         min_minutes = 999
         
-        for pattern in access_patterns:
-            matches = re.findall(pattern, text_content)
+        for pattern in patterns.GENERIC_ACCESS_PATTERNS:
+            matches = pattern.findall(text_content)
             for match in matches:
                 if len(match) == 2:
                     station = match[0]
@@ -702,29 +708,11 @@ def extract_clinic_info_legacy(soup, url, clinic_name=""):
 
 def find_clinic_links(soup, base_url):
     """店舗一覧ページから各店舗のリンクを取得 - 改良版"""
+    import patterns
     clinic_links = []
     domain = urlparse(base_url).netloc
     base_path = urlparse(base_url).path
     
-    # Enhanced store link patterns
-    link_patterns = [
-        # Common patterns
-        r'/(?:clinic|store|shop|branch|location|office|outlet)[s]?/[^/]+/?$',
-        r'/(?:tenpo|mise)/[^/]+/?$',  # Japanese patterns
-        r'/access/[^/]+/?$',
-        r'/map/[^/]+/?$',
-        
-        # Specific patterns for known sites
-        r'/locations/[^/]+/?$',  # リゼクリニック用
-        r'/clinic/branch/[^/]+/?$',  # SBC湘南美容クリニック用
-        r'/hifuka/[^/]+/?$',  # SBC湘南美容クリニック用
-        r'/clinic/[a-z]+/?$',  # TCB東京中央美容外科用 (e.g., /clinic/shinjuku)
-        
-        # Generic patterns that might be store pages
-        r'/[^/]+[-_](?:store|shop|clinic|branch)/?$',
-        r'/(?:area|region)/[^/]+/[^/]+/?$',  # Area-based URLs
-    ]
-    
     # Keywords that suggest a store/branch link
     store_keywords = [
         '店', '院', 'クリニック', '支店', '営業所', '店舗',
@@ -743,11 +731,14 @@ def find_clinic_links(soup, base_url):
             continue
         if urlparse(absolute_url).netloc != domain:
             continue
+        # PDF・画像などHTMLではないファイルは取得しない
+        if is_binary_url(absolute_url):
+            continue
         
         # Check pattern matching
         pattern_matched = False
-        for pattern in link_patterns:
-            if re.search(pattern, href, re.IGNORECASE):
+        for pattern in patterns.STORE_LINK_PATTERNS:
+            if pattern.search(href):
                 pattern_matched = True
                 break
         
@@ -762,7 +753,7 @@ def find_clinic_links(soup, base_url):
             confidence += 30
         if len(text) < 50:  # Short text is more likely to be a store name
             confidence += 10
-        if re.search(r'[都道府県市区町村]', text):  # Contains location kanji
+        if patterns.LOCATION_KANJI.search(text):  # Contains location kanji
             confidence += 10
         
         if confidence >= 40:  # Threshold for inclusion
@@ -808,115 +799,231 @@ def find_clinic_links(soup, base_url):
         for pattern, links in link_groups.items():
             if len(links) >= 3:  # Found a pattern with multiple links
                 for link in links:
-                    if link['url'] not in seen and link['url'].rstrip('/') != base_url.rstrip('/'):
+                    if (link['url'] not in seen and link['url'].rstrip('/') != base_url.rstrip('/')
+                            and not is_binary_url(link['url'])):
                         seen.add(link['url'])
                         unique_links.append(link)
     
     return unique_links
 
-@app.route('/api/scrape', methods=['POST'])
-def scrape():
-    """店舗情報をスクレイピング"""
-    try:
-        data = request.json
-        url = data.get('url')
-        
-        if not url:
-            return jsonify({'success': False, 'error': 'URLが指定されていません'})
-        
-        # SBCサイトのデバッグ情報
-        if 's-b-c.net' in url:
-            print(f"[DEBUG] SBC site detected: {url}")
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
-            'Accept-Language': 'ja,en-US;q=0.7,en;q=0.3',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1'
-        }
-        
-        # ページを取得（SBCサイト用のタイムアウト調整）
-        timeout_seconds = 5 if 's-b-c.net' in url else 10
-        response = requests.get(url, headers=headers, timeout=timeout_seconds)
-        
+# リクエストヘッダー
+REQUEST_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
+    'Accept-Language': 'ja,en-US;q=0.7,en;q=0.3',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1'
+}
+
+def crawl_clinics(url):
+    """最初のページを取得し、店舗情報を1件ずつ返すジェネレーターを返す
+
+    最初のページの取得エラーはこの関数の呼び出し時に送出されるため、
+    ストリーミング開始前に通常のエラーレスポンスを返せる
+    """
+    # SBCサイトのデバッグ情報
+    if 's-b-c.net' in url:
+        logger.debug("SBC site detected: %s", url)
+    
+    # 同時実行数の公平な配分に使うリクエストの識別子
+    job_key = object()
+    
+    # 再試行の待ち時間も含め、実行時間の上限までに取得を終える
+    budget_deadline = time.monotonic() + REQUEST_BUDGET
+    
+    # ページを取得（SBCサイト用のタイムアウト調整）
+    timeout_seconds = 5 if 's-b-c.net' in url else 10
+    
+    def fetch(page_url, timeout):
+        remaining = budget_deadline - time.monotonic()
+        if remaining <= 0:
+            raise FetchAborted(page_url, fetcher.ABORT_DEADLINE, f"{REQUEST_BUDGET:.0f}秒の実行時間を使い切りました")
+        timeout = min(timeout, remaining)
+        # timeout を1ページの取得全体の上限にする（少しずつ送り続けるサーバーで実行時間を使い切らないよう）
+        # Retry-After でホストが止まっている間は、実行時間内に再開できる場合のみ待つ
+        with host_limiter.slot(page_url, deadline=budget_deadline) as slot, fetch_limiter.slot(job_key), timer('fetch'):
+            response = slot.response = fetch_page(page_url, REQUEST_HEADERS, timeout=timeout, deadline=timeout)
         # デバッグ: レスポンスステータス
-        if 'frey-a' in url:
-            print(f"[DEBUG] Freya response status: {response.status_code}")
-            print(f"[DEBUG] Freya content length: {len(response.content)}")
-        
+        if 'frey-a' in page_url:
+            logger.debug("Freya response status: %s, content length: %d", response.status_code, len(response.content))
         response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        clinic_data = []
-        
+        return response
+    
+    # 一時的な失敗は再試行（ドメインのブレーカーが開いている場合は CircuitOpen）
+    response = fetch_with_retry(lambda: fetch(url, timeout_seconds), url, deadline=budget_deadline)
+    with parse_limiter.slot(job_key), parsed_page(decode_response(response), url, 'list') as soup:
         # 店舗一覧ページかチェック（複数の店舗リンクがある場合）
-        clinic_links = find_clinic_links(soup, url)
+        with timer('find_links'):
+            clinic_links = find_clinic_links(soup, url)
         is_list_page = len(clinic_links) > 3
         
         # まず現在のページから情報を抽出
-        current_page_info = extract_clinic_info(soup, url)
-        
+        with timer('extract'):
+            current_page_info = extract_clinic_info(soup, url)
+    
+    def generate():
         # 一覧ページではない、または個別店舗ページの場合のみ追加
         # 一覧ページの判定: "一覧"、"クリニック一覧"、"店舗一覧" などのタイトル
         is_individual_store = not any(keyword in current_page_info['name'] for keyword in ['一覧', 'リスト', 'List'])
         
         # 店舗情報が取得できた場合は追加
         if current_page_info['name'] and (current_page_info['address'] or current_page_info['access']) and (not is_list_page or is_individual_store):
-            clinic_data.append(current_page_info)
+            yield current_page_info
         
-        if len(clinic_links) > 3:  # 3つ以上のリンクがある場合は一覧ページと判断
+        if is_list_page:  # 3つ以上のリンクがある場合は一覧ページと判断
             # 全店舗を処理
+            deferred = []
             for link in clinic_links:
-                try:
-                    # 各店舗ページを取得（SBCサイト用のタイムアウト調整）
-                    clinic_timeout = 3 if 's-b-c.net' in link['url'] else 10
-                    clinic_response = requests.get(link['url'], headers=headers, timeout=clinic_timeout)
-                    clinic_response.raise_for_status()
-                    clinic_soup = BeautifulSoup(clinic_response.content, 'html.parser')
-                    
-                    # 店舗情報を抽出
-                    clinic_info = extract_clinic_info(clinic_soup, link['url'], link['name'])
-                    if clinic_info['name']:
-                        clinic_data.append(clinic_info)
-                    
-                except Exception:
-                    continue
+                clinic_info = crawl_store(link, deferred)
+                if clinic_info and clinic_info['name']:
+                    yield clinic_info
+            
+            # ブレーカーで取得しなかった店舗は、ブレーカーが既に閉じかけている場合のみ1回だけ取得し直す
+            # （サーバーレスの実行時間内で待機はしない）
+            if deferred and retry.breakers.retry_in(urlparse(url).netloc) == 0:
+                retry_links, deferred = deferred, []
+                for link in retry_links:
+                    clinic_info = crawl_store(link, deferred)
+                    if clinic_info and clinic_info['name']:
+                        yield clinic_info
+            if deferred:
+                logger.warning("%d store pages skipped while the circuit breaker was open: %s", len(deferred), url)
+    
+    def crawl_store(link, deferred):
+        """店舗ページを取得・抽出（取得できなかった場合は None、ブレーカーで飛ばした店舗は deferred に追加）"""
+        try:
+            # 各店舗ページを取得（SBCサイト用のタイムアウト調整）
+            clinic_timeout = 3 if 's-b-c.net' in link['url'] else 10
+            clinic_response = fetch_with_retry(lambda: fetch(link['url'], clinic_timeout), link['url'],
+                                               deadline=budget_deadline)
+            
+            # 店舗情報を抽出
+            with parse_limiter.slot(job_key), \
+                    parsed_page(decode_response(clinic_response), link['url'], 'detail') as clinic_soup:
+                with timer('extract'):
+                    return extract_clinic_info(clinic_soup, link['url'], link['name'])
+        except CircuitOpen:
+            deferred.append(link)
+        except Exception as e:
+            logger.warning("store page failed %s: %s", link['url'], e)
+        return None
+    
+    return generate()
+
+def stream_clinics(url, output_format, job_id, profiler=None):
+    """抽出した店舗情報をNDJSONまたはCSVで逐次返す
+
+    profiler を指定した場合は店舗ページの取得・抽出（最初のページ以降）を計測する
+    """
+    with job_context(job_id):
+        clinics = crawl_clinics(url)
+    clinics = with_job_context(job_id, clinics)
+    headers = {}
+    if profiler:
+        clinics = profiled_iter(profiler, clinics)
+        headers['X-Profile-Id'] = profiler.job_id
+    
+    domain = urlparse(url).netloc
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    
+    if output_format == 'csv':
+        body = record_stream.iter_csv(clinics)
+        content_type = record_stream.CSV_MIMETYPE
+        filename = f"{domain}_clinics_{timestamp}.csv"
+    else:
+        body = record_stream.iter_ndjson(clinics)
+        content_type = record_stream.NDJSON_MIMETYPE
+        filename = f"{domain}_clinics_{timestamp}.ndjson"
+    
+    return Response(
+        stream_with_context(body),
+        content_type=content_type,
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            # プロキシによるバッファリングを無効化
+            'X-Accel-Buffering': 'no',
+            'Cache-Control': 'no-cache',
+            **headers
+        }
+    )
+
+def build_csv(clinic_data):
+    """取得結果をCSV文字列に変換（電話番号・営業時間は値がある場合のみ列を追加）"""
+    output = io.StringIO()
+    
+    # Determine which fields are available
+    has_phone = any('phone' in clinic and clinic['phone'] for clinic in clinic_data)
+    has_hours = any('hours' in clinic and clinic['hours'] for clinic in clinic_data)
+    
+    # Build fieldnames dynamically
+    fieldnames = ['店舗名', '住所', 'アクセス']
+    if has_phone:
+        fieldnames.append('電話番号')
+    if has_hours:
+        fieldnames.append('営業時間')
+    fieldnames.append('URL')
+    
+    writer = csv.DictWriter(output, fieldnames=fieldnames)
+    writer.writeheader()
+    
+    for clinic in clinic_data:
+        row = {
+            '店舗名': clinic['name'],
+            '住所': clinic['address'],
+            'アクセス': clinic['access'],
+            'URL': clinic['url']
+        }
+        if has_phone:
+            row['電話番号'] = clinic.get('phone', '')
+        if has_hours:
+            row['営業時間'] = clinic.get('hours', '')
         
-        # CSVデータを生成
-        output = io.StringIO()
+        writer.writerow(row)
+    
+    return output.getvalue()
+
+@app.route('/api/scrape', methods=['POST'])
+def scrape():
+    """店舗情報をスクレイピング
+
+    format: "json"（デフォルト、完了後にCSV文字列を返す）/ "ndjson" / "csv"（取得しながら逐次返す）
+    json形式のみ同一URLの同時リクエストをまとめる（ストリーミングは接続ごとにクロールする）
+    profile: true の場合はこのリクエストのみ cProfile とサンプリングで計測し、
+    PROFILE_DIR に保存する（結果の共有は行わない）
+    """
+    import requests
+    
+    try:
+        data = request.json
+        url = data.get('url')
+        output_format = (data.get('format') or 'json').lower()
         
-        # Determine which fields are available
-        has_phone = any('phone' in clinic and clinic['phone'] for clinic in clinic_data)
-        has_hours = any('hours' in clinic and clinic['hours'] for clinic in clinic_data)
+        if not url:
+            return jsonify({'success': False, 'error': 'URLが指定されていません'})
         
-        # Build fieldnames dynamically
-        fieldnames = ['店舗名', '住所', 'アクセス']
-        if has_phone:
-            fieldnames.append('電話番号')
-        if has_hours:
-            fieldnames.append('営業時間')
-        fieldnames.append('URL')
-        
-        writer = csv.DictWriter(output, fieldnames=fieldnames)
-        writer.writeheader()
-        
-        for clinic in clinic_data:
-            row = {
-                '店舗名': clinic['name'],
-                '住所': clinic['address'],
-                'アクセス': clinic['access'],
-                'URL': clinic['url']
-            }
-            if has_phone:
-                row['電話番号'] = clinic.get('phone', '')
-            if has_hours:
-                row['営業時間'] = clinic.get('hours', '')
-            
-            writer.writerow(row)
+        if output_format not in ('json', 'ndjson', 'csv'):
+            return jsonify({'success': False, 'error': f'未対応の出力形式です: {output_format}'})
         
-        csv_data = output.getvalue()
+        # ログのサンプリングとプロファイルのファイル名に使うリクエストの識別子
+        job_id = str(int(time.time() * 1000))
+        profiler = JobProfiler(job_id, PROFILE_DIR) if data.get('profile') else None
+        
+        if output_format != 'json':
+            return stream_clinics(url, output_format, job_id, profiler)
+        
+        with job_context(job_id):
+            if profiler:
+                with profiler:
+                    clinic_data = list(crawl_clinics(url))
+                coalesced = False
+            else:
+                # 同じURLのクロールが実行中であれば完了を待って結果を共有
+                clinic_data, coalesced = coalescer.run(url, lambda: list(crawl_clinics(url)))
+        
+        # CSVデータを生成
+        with timer('csv_write'):
+            csv_data = build_csv(clinic_data)
         
         # ファイル名を生成
         domain = urlparse(url).netloc
@@ -932,14 +1039,28 @@ def scrape():
                     needs_client_side = True
                     break
         
-        return jsonify({
+        result = {
             'success': True,
             'clinic_count': len(clinic_data),
             'csv_data': csv_data,
             'filename': filename,
-            'needs_client_side': needs_client_side
-        })
+            'needs_client_side': needs_client_side,
+            'coalesced': coalesced
+        }
+        if profiler:
+            result['profile_files'] = [f'/api/profile/{name}' for name in profiler.files]
+        return jsonify(result)
         
+    except FetchAborted as e:
+        return jsonify({
+            'success': False,
+            'error': ABORT_MESSAGES.get(e.reason, str(e))
+        })
+    except HostBlocked as e:
+        return jsonify({
+            'success': False,
+            'error': f'アクセス制限: サイトから{e.retry_in:.0f}秒後に再アクセスするよう指示されたため、実行時間内に取得できません'
+        })
     except requests.exceptions.Timeout:
         return jsonify({
             'success': False, 
@@ -958,9 +1079,31 @@ def health():
     """ヘルスチェック"""
     return jsonify({'status': 'ok'})
 
+@app.route('/api/profile/<filename>')
+def download_profile(filename):
+    """保存したプロファイル（同じインスタンス上にある間のみ取得可能）"""
+    if not filename.startswith('profile_'):
+        return jsonify({'error': 'ファイルが見つかりません'}), 404
+    return send_from_directory(PROFILE_DIR, filename, as_attachment=True)
+
+@app.route('/api/metrics')
+def metrics_endpoint():
+    """ステージごとの処理時間と同時実行数（Prometheus テキスト形式）"""
+    return Response(metrics.render_prometheus(), content_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
+@app.route('/api/admission')
+def admission():
+    """プロセス全体の同時取得数・解析数とホストごとの同時取得数・ブレーカーの状況"""
+    return jsonify({**concurrency.admission_snapshot(), 'breakers': retry.breakers.snapshot(),
+                    'fetch': fetcher.snapshot()})
+
 @app.route('/api/debug-freya', methods=['GET'])
 def debug_freya():
     """Debug Freya HTML structure"""
+    import requests
+    from bs4 import BeautifulSoup
+    import patterns
+    
     try:
         url = request.args.get('url', 'https://frey-a.jp/clinic/sapporo/')
         headers = {
@@ -992,8 +1135,7 @@ def debug_freya():
         sample_text = soup.get_text()[:500]
         
         # Check for postal code pattern
-        import re
-        postal_match = re.search(r'〒\d{3}-\d{4}', sample_text)
+        postal_match = patterns.POSTAL_CODE.search(sample_text)
         
         return jsonify({
             'url': url,
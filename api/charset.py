@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+HTMLの文字コードの判定とデコード
+BeautifulSoup にバイト列を渡すと UnicodeDammit がページごとに文字コードを推定するため、
+解析の前に1回だけデコードして文字列を渡す。判定は安い順に
+BOM → HTTPヘッダーの charset → <meta charset>（XML宣言） → UTF-8 → 同じドメインで前回判定した文字コード
+→ 日本語の文字コード（cp932 / EUC-JP のうち、デコードできてかなが多い方）
+と試し、いずれも当てはまらない場合のみ UnicodeDammit（chardet / charset_normalizer）で推定する。
+UTF-8 のバイト列の多くは cp932 としてもデコードできてしまうため、ドメインの判定結果は UTF-8 として
+デコードできなかったページにのみ使う（同じドメインに cp932 と UTF-8 のページが混在していても化けない）
+
+宣言された文字コードでもデコードに失敗した場合（宣言の誤り）は次の候補を試す。
+ヘッダー・<meta> の ISO-8859-1 などはどのバイト列でもデコードできてしまい、Shift_JIS のページに誤って
+付いていることが多いため信用しない。Shift_JIS は Windows の拡張文字を含む cp932 として扱う
+"""
+
+import codecs
+import threading
+from collections import Counter
+from urllib.parse import urlparse
+
+import metrics
+from metrics import timer
+
+
+# <meta charset> を探すHTMLの先頭のバイト数
+SNIFF_BYTES = 4096
+
+# ドメインごとの文字コードを覚えておく数（超えたら古いものから捨てる）
+DOMAIN_CACHE_SIZE = 1024
+
+# 宣言の表記 -> Python のコーデック
+_ALIASES = {
+    'shift_jis': 'cp932', 'shift-jis': 'cp932', 'sjis': 'cp932', 'x-sjis': 'cp932', 'ms_kanji': 'cp932',
+    'csshiftjis': 'cp932', 'windows-31j': 'cp932', 'ms932': 'cp932',
+    'x-euc-jp': 'euc_jp',
+    # HTMLの仕様どおり、ASCII互換のバイト列で宣言された UTF-16 は UTF-8 とみなす
+    'utf-16': 'utf-8', 'utf-16le': 'utf-8', 'utf-16be': 'utf-8',
+}
+
+# どのバイト列でもデコードできるため、宣言・判定結果としては信用しない文字コード
+_WEAK = {'latin_1', 'iso8859-1', 'cp1252', 'ascii'}
+
+_BOMS = (
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+# 判定方法
+SOURCE_BOM = 'bom'
+SOURCE_HEADER = 'header'
+SOURCE_META = 'meta'
+SOURCE_CACHE = 'cache'
+SOURCE_UTF8 = 'utf8'
+SOURCE_JAPANESE = 'japanese'
+SOURCE_DETECT = 'detect'
+
+# 宣言のないページで試す日本語の文字コード
+JAPANESE_ENCODINGS = ('cp932', 'euc_jp')
+
+_lock = threading.Lock()
+_domains = {}
+_resolved = Counter()
+
+
+def normalize(label):
+    """宣言の表記をコーデック名に変換（不明な文字コードは None）"""
+    if not label:
+        return None
+    label = label.strip().strip('"\'').lower()
+    label = _ALIASES.get(label, label)
+    try:
+        return codecs.lookup(label).name
+    except LookupError:
+        return None
+
+
+def header_charset(content_type):
+    """Content-Type ヘッダーの charset パラメータ"""
+    for param in (content_type or '').split(';')[1:]:
+        name, _, value = param.partition('=')
+        if name.strip().lower() == 'charset':
+            return value
+    return None
+
+
+def declared_charset(content):
+    """HTMLの先頭の <meta charset> / <meta http-equiv> / XML宣言の文字コード"""
+    # patterns は初回の呼び出し時に読み込む（api/app.py のコールドスタートを短くするため）
+    import patterns
+
+    head = content[:SNIFF_BYTES]
+    match = patterns.XML_ENCODING.search(head) or patterns.META_CHARSET.search(head)
+    return match.group(1).decode('ascii') if match else None
+
+
+def _try_decode(content, encoding):
+    try:
+        return content.decode(encoding)
+    except (UnicodeDecodeError, LookupError):
+        return None
+
+
+def _guess_japanese(content):
+    """cp932 / EUC-JP のうちデコードでき、ひらがな・カタカナが最も多くなる文字コード（なければ None）
+
+    EUC-JP のページは cp932 としてもデコードできることが多いが、その場合かなは半角カナに化けるため数で区別できる
+    """
+    import patterns
+
+    best = None
+    for encoding in JAPANESE_ENCODINGS:
+        text = _try_decode(content, encoding)
+        if text is None:
+            continue
+        score = len(patterns.KANA.findall(text))
+        if score and (best is None or score > best[0]):
+            best = (score, text, encoding)
+    return best[1:] if best else None
+
+
+def _detect(content):
+    """最後の手段として文字コードを推定（BeautifulSoup と同じ UnicodeDammit）"""
+    from bs4 import UnicodeDammit
+
+    dammit = UnicodeDammit(content, is_html=True)
+    if dammit.unicode_markup is None:
+        return content.decode('utf-8', errors='replace'), 'utf-8'
+    return dammit.unicode_markup, normalize(dammit.original_encoding) or 'utf-8'
+
+
+def _remember(domain, encoding):
+    if not domain or encoding in _WEAK:
+        return
+    with _lock:
+        _domains.pop(domain, None)
+        _domains[domain] = encoding
+        if len(_domains) > DOMAIN_CACHE_SIZE:
+            del _domains[next(iter(_domains))]
+
+
+def _resolve(content, domain, content_type):
+    for bom, encoding in _BOMS:
+        if content.startswith(bom):
+            text = _try_decode(content, encoding if encoding != 'utf-8' else 'utf-8-sig')
+            if text is not None:
+                return text, encoding, SOURCE_BOM
+
+    encoding = normalize(header_charset(content_type))
+    if encoding and encoding not in _WEAK:
+        text = _try_decode(content, encoding)
+        if text is not None:
+            return text, encoding, SOURCE_HEADER
+
+    encoding = normalize(declared_charset(content))
+    if encoding and encoding not in _WEAK:
+        text = _try_decode(content, encoding)
+        if text is not None:
+            return text, encoding, SOURCE_META
+
+    # ISO-2022-JP は ASCII の範囲のため UTF-8 としてもデコードできてしまう
+    if b'\x1b$' in content:
+        text = _try_decode(content, 'iso2022_jp')
+        if text is not None:
+            return text, 'iso2022_jp', SOURCE_JAPANESE
+
+    text = _try_decode(content, 'utf-8')
+    if text is not None:
+        return text, 'utf-8', SOURCE_UTF8
+
+    with _lock:
+        encoding = _domains.get(domain)
+    if encoding:
+        text = _try_decode(content, encoding)
+        if text is not None:
+            return text, encoding, SOURCE_CACHE
+
+    guess = _guess_japanese(content)
+    if guess is not None:
+        return guess + (SOURCE_JAPANESE,)
+
+    text, encoding = _detect(content)
+    return text, encoding, SOURCE_DETECT
+
+
+def decode_html(content, domain=None, content_type=None):
+    """HTMLのバイト列を文字列にデコードし、(文字列, 文字コード) を返す
+
+    domain を渡すと判定した文字コードを覚え、宣言のない同じドメインのページで先に試す
+    """
+    if isinstance(content, str):
+        return content, None
+    text, encoding, source = _resolve(content, domain, content_type)
+    if source not in (SOURCE_BOM, SOURCE_CACHE) and (not content.isascii() or encoding == 'iso2022_jp'):
+        _remember(domain, encoding)
+    with _lock:
+        _resolved[source] += 1
+    return text, encoding
+
+
+def decode_response(response):
+    """取得した応答の本文を Content-Type ヘッダーと応答のドメインから判定してデコード"""
+    with timer('decode'):
+        return decode_html(response.content, urlparse(response.url).netloc, response.headers.get('Content-Type'))[0]
+
+
+def snapshot():
+    """判定方法ごとの件数と覚えているドメインの数"""
+    with _lock:
+        return {'resolved': dict(_resolved), 'domains': len(_domains)}
+
+
+def _collect_metrics():
+    with _lock:
+        counts = dict(_resolved)
+    lines = [
+        '# HELP scraper_charset_resolved_total Pages decoded, by how the character encoding was determined',
+        '# TYPE scraper_charset_resolved_total counter',
+    ]
+    for source in (SOURCE_BOM, SOURCE_HEADER, SOURCE_META, SOURCE_CACHE, SOURCE_UTF8, SOURCE_JAPANESE, SOURCE_DETECT):
+        lines.append(f'scraper_charset_resolved_total{{source="{source}"}} {counts.get(source, 0)}')
+    return lines
+
+
+metrics.register_collector(_collect_metrics)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+同一URLへのスクレイピング要求をまとめる（リクエストコアレッシング）
+実行中のURLへの2回目以降の要求は既存ジョブに合流し、
+完了した結果は一定時間（鮮度ウィンドウ）内であれば再利用する。
+非同期ジョブは合流した要求元ごとにトークンを発行し、すべての要求元が外れた（キャンセルした）ときだけジョブを止める
+"""
+
+import os
+import threading
+import time
+import uuid
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+
+
+# 完了結果を再利用する秒数（0で再利用しない）
+DEFAULT_RESULT_TTL = int(os.environ.get('SCRAPE_RESULT_TTL', '300'))
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_url(url):
+    """同一ページを指すURLが同じキーになるよう正規化
+
+    - スキーム・ホストを小文字化し、デフォルトポートを除去
+    - フラグメントを除去し、クエリパラメータを並べ替え
+    - 末尾のスラッシュの有無を区別しない
+    """
+    parsed = urlparse(url.strip())
+    scheme = (parsed.scheme or 'http').lower()
+    host = (parsed.hostname or '').lower()
+    if parsed.port and parsed.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parsed.port}"
+    path = parsed.path.rstrip('/') or '/'
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+    return urlunparse((scheme, host, path, '', query, ''))
+
+
+class _Entry:
+    def __init__(self, key, job_id=None):
+        self.key = key
+        self.job_id = job_id
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.finished_at = None
+        self.requesters = set()
+
+
+class RequestCoalescer:
+    """正規化URLをキーに、実行中・完了済みのジョブを共有する"""
+
+    def __init__(self, ttl=None):
+        self.ttl = DEFAULT_RESULT_TTL if ttl is None else ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def _is_reusable(self, entry, now):
+        if not entry.done.is_set():
+            return True
+        if entry.error is not None or entry.finished_at is None:
+            return False
+        return now - entry.finished_at < self.ttl
+
+    def _lookup(self, key):
+        """再利用できるエントリを返す（期限切れは削除）。ロック内で呼ぶこと"""
+        entry = self._entries.get(key)
+        if entry and not self._is_reusable(entry, time.time()):
+            del self._entries[key]
+            entry = None
+        return entry
+
+    def run(self, url, func):
+        """同期実行用: 同じURLの実行中処理があれば完了を待って結果を共有する
+
+        戻り値は (結果, 合流したかどうか)。先行処理の例外は合流した側にも送出される
+        """
+        key = normalize_url(url)
+        with self._lock:
+            entry = self._lookup(key)
+            is_leader = entry is None
+            if is_leader:
+                entry = _Entry(key)
+                self._entries[key] = entry
+
+        if not is_leader:
+            entry.done.wait()
+            if entry.error is not None:
+                raise entry.error
+            return entry.result, True
+
+        try:
+            entry.result = func()
+        except BaseException as e:
+            entry.error = e
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            raise
+        else:
+            entry.finished_at = time.time()
+        finally:
+            entry.done.set()
+        return entry.result, False
+
+    def attach_or_start(self, url, start, attach=True):
+        """非同期ジョブ用: 実行中または鮮度内のジョブがあればそのIDを返し、なければ start() で開始する
+
+        start() は新しいジョブIDを返すこと。戻り値は (ジョブID, 合流したかどうか, 要求元のトークン)。
+        トークンは detach() で要求元を外すときに渡す。attach=False の場合は要求元として数えない
+        （再起動後の再開など。トークンは None）
+        """
+        key = normalize_url(url)
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                entry = _Entry(key, start())
+                self._entries[key] = entry
+                coalesced = False
+            else:
+                coalesced = True
+            token = None
+            if attach:
+                token = uuid.uuid4().hex
+                entry.requesters.add(token)
+            return entry.job_id, coalesced, token
+
+    def detach(self, job_id, token):
+        """実行中の非同期ジョブから token の要求元を外し、他に要求元が残っていなければ True（ジョブを止めてよい）
+
+        同じトークンで何度呼んでも外すのは1回だけで、外れた後や不明なトークンでは他の要求元が残っている限り False。
+        最後の要求元が外れたジョブは以降の要求に合流させない。合流の対象ではないジョブ（profile 指定など）は True
+        """
+        with self._lock:
+            for key, entry in self._entries.items():
+                if entry.job_id != job_id or entry.done.is_set():
+                    continue
+                entry.requesters.discard(token)
+                if entry.requesters:
+                    return False
+                del self._entries[key]
+                return True
+        return True
+
+    def complete(self, url, job_id, success=True):
+        """非同期ジョブの完了を記録。失敗したジョブは再利用しない"""
+        key = normalize_url(url)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.job_id != job_id:
+                return
+            entry.finished_at = time.time()
+            entry.done.set()
+            if not success or self.ttl <= 0:
+                del self._entries[key]
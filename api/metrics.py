@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+処理ステージごとの計測（取得・解析・リンク探索・各項目の抽出・CSV出力）
+ヒストグラムに集計し、Prometheus のテキスト形式で出力する
+
+SCRAPER_METRICS=0 で無効化すると timer() は共有の空コンテキストを返すだけになる
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+
+STAGE_HISTOGRAM = 'scraper_stage_duration_seconds'
+
+# 秒単位のバケット境界
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_enabled = os.environ.get('SCRAPER_METRICS', '1') != '0'
+_NULL_TIMER = nullcontext()
+
+# capture_stages() の範囲内で記録した (ステージ, 秒) のリスト（スレッドごと）
+_captured = threading.local()
+
+
+class Histogram:
+    """ラベルごとのバケット件数・合計・件数を保持するヒストグラム"""
+
+    def __init__(self, name, help_text, label_name, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_name = label_name
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, label, value):
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                series = self._series[label] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self):
+        """ラベル -> {'count', 'sum'}"""
+        with self._lock:
+            return {label: {'count': series[2], 'sum': series[1]} for label, series in self._series.items()}
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label in sorted(self._series):
+                counts, total, count = self._series[label]
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{self.name}_bucket{{{self.label_name}="{label}",le="{bound}"}} {cumulative}')
+                lines.append(f'{self.name}_bucket{{{self.label_name}="{label}",le="+Inf"}} {count}')
+                lines.append(f'{self.name}_sum{{{self.label_name}="{label}"}} {total:.6f}')
+                lines.append(f'{self.name}_count{{{self.label_name}="{label}"}} {count}')
+        return lines
+
+
+stage_histogram = Histogram(STAGE_HISTOGRAM, 'Time spent in each scraping stage', 'stage')
+
+# render_prometheus() で追加の行を出力する関数（例: 同時実行数の状況）
+_collectors = []
+
+
+class _StageTimer:
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        stage_histogram.observe(self.stage, elapsed)
+        observations = getattr(_captured, 'observations', None)
+        if observations is not None:
+            observations.append((self.stage, elapsed))
+        return False
+
+
+def timer(stage):
+    """with timer('fetch'): ... でステージの処理時間を記録"""
+    if not _enabled:
+        return _NULL_TIMER
+    return _StageTimer(stage)
+
+
+@contextmanager
+def capture_stages():
+    """範囲内で記録したステージの処理時間を [(ステージ, 秒)] として受け取る
+
+    別プロセスで計測した処理時間を親プロセスの record_stages() に渡すために使う
+    """
+    previous = getattr(_captured, 'observations', None)
+    observations = _captured.observations = []
+    try:
+        yield observations
+    finally:
+        _captured.observations = previous
+
+
+def record_stages(observations):
+    """capture_stages() で受け取った処理時間をこのプロセスのヒストグラムに記録"""
+    for stage, seconds in observations:
+        stage_histogram.observe(stage, seconds)
+
+
+def is_enabled():
+    return _enabled
+
+
+def set_enabled(enabled):
+    global _enabled
+    _enabled = bool(enabled)
+
+
+def register_collector(collector):
+    """Prometheus 形式の行のリストを返す関数を登録"""
+    _collectors.append(collector)
+
+
+def render_prometheus():
+    lines = stage_histogram.render()
+    for collector in _collectors:
+        lines.extend(collector())
+    return '\n'.join(lines) + '\n'
+
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
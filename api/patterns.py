@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+抽出に使う正規表現
+すべてのパターンをモジュール読み込み時にまとめてコンパイルし、リクエストごとの初回コンパイルや
+re モジュールのキャッシュ探索を避ける。パターンを追加する場合はここに定義して参照する
+
+regex_profile.profile_modules() はこのモジュールの属性を差し替えて計測するため、
+利用側では `patterns.NAME` の形で呼び出し時に参照する（from patterns import NAME は使わない）
+"""
+
+import re
+
+
+def _compile(patterns, flags=0):
+    return [re.compile(pattern, flags) for pattern in patterns]
+
+
+def _compile_scored(patterns, flags=0):
+    """(パターン, 信頼度) のリストをコンパイル"""
+    return [(re.compile(pattern, flags), confidence) for pattern, confidence in patterns]
+
+
+# 抽出結果の整形
+WHITESPACE = re.compile(r'\s+')
+NON_PHONE_CHARS = re.compile(r'[^\d\-]')
+STATION_NAME = re.compile(r'([^「」\s]+(?:駅|停留場))')
+WALK_MINUTES = re.compile(r'(\d+)\s*分')
+POSTAL_CODE = re.compile(r'〒\d{3}-\d{4}')
+
+# 汎用抽出（universal_scraper.PatternMatcher）: (パターン, 信頼度)
+_SCORED_FLAGS = re.IGNORECASE | re.MULTILINE
+
+ADDRESS_PATTERNS = _compile_scored([
+    # With postal code
+    (r'〒\s*(\d{3}[-ー－]\d{4})\s*([^\n\r]{1,100})', 100),
+    (r'〒\s*(\d{7})\s*([^\n\r]{1,100})', 95),
+
+    # Full address patterns
+    (r'((?:東京都|大阪府|京都府|北海道|[^\s]{2,4}県)[^\n\r]*?(?:市|区|町|村)[^\n\r]*?(?:\d+(?:[-ー－]\d+)*(?:番地?)?|[一二三四五六七八九十]+丁目)[^\n\r]*)', 90),
+    (r'((?:東京都|大阪府|京都府|北海道|[^\s]{2,4}県)[^\n\r]*?[市区町村][^\n\r]*?\d+[-ー－]\d+[-ー－]\d+)', 85),
+
+    # Building/Floor patterns
+    (r'([^\n\r]*?(?:ビル|ビルディング|タワー|センター|プラザ|[^\s]+館)[^\n\r]*?(?:\d+階|[一二三四五六七八九十]+階|B\d+F?|\d+F))', 70),
+], _SCORED_FLAGS)
+
+ACCESS_PATTERNS = _compile_scored([
+    # Station with walking time
+    (r'「?([^「」\s]+(?:駅|停留場))」?\s*(?:から|より)?\s*(?:徒歩|歩いて)?\s*(?:約)?\s*(\d+)\s*分', 100),
+    (r'([^「」\s]+(?:駅|停留場))\s*(?:徒歩|歩いて)\s*(?:約)?\s*(\d+)\s*分', 95),
+    (r'(?:最寄り?駅?[:：]?\s*)([^「」\s]+駅)[^\n\r]*?(\d+)\s*分', 90),
+
+    # Station only patterns
+    (r'(?:最寄り?駅?[:：]?\s*)「?([^「」\s]+駅)」?', 70),
+    (r'(?:アクセス|交通)[^\n\r]*?「?([^「」\s]+駅)」?', 65),
+
+    # Line and station
+    (r'([^「」\s]+線)\s*「?([^「」\s]+駅)」?', 80),
+], _SCORED_FLAGS)
+
+PHONE_PATTERNS = _compile_scored([
+    (r'(?:TEL|Tel|tel|電話|☎|📞)\s*[:：]?\s*([\d\-\(\)]{10,})', 100),
+    (r'(\d{2,4}[-ー－]\d{2,4}[-ー－]\d{3,4})', 90),
+    (r'(\d{10,11})', 70),
+], _SCORED_FLAGS)
+
+HOURS_PATTERNS = _compile_scored([
+    (r'(?:営業時間|受付時間|診療時間)[^\n\r]*?[:：]?\s*([^\n\r]+)', 100),
+    (r'(\d{1,2}[:：]\d{2}\s*[~〜～ー－-]\s*\d{1,2}[:：]\d{2})', 90),
+    (r'(?:平日|月.金)\s*[:：]?\s*(\d{1,2}[:：]\d{2}\s*[~〜～ー－-]\s*\d{1,2}[:：]\d{2})', 85),
+], _SCORED_FLAGS)
+
+# サイト別のレガシー抽出
+STATION_FROM_WALK = re.compile(r'([^\s]+駅)[^\n]*?(?:から|より)[^\n]*?(?:徒歩|歩いて)[^\n]*?(\d+)分')
+STATION_WALK = re.compile(r'([^\s]+駅)[^\n]*?(?:徒歩|歩いて)[^\n]*?(\d+)分')
+STATION_MINUTES = re.compile(r'([^\s]+駅)[^\n]*?(\d+)分')
+ACCESS_LABEL_STATION = re.compile(r'アクセス[^\n]*?([^\s]+駅)[^\n]*?(\d+)分')
+QUOTED_STATION_WALK = re.compile(r'「([^\s]+駅)」[^\n]*?(?:徒歩|歩いて)[^\n]*?(\d+)分')
+QUOTED_STOP_WALK = re.compile(r'「([^\s]+停留場)」[^\n]*?(?:徒歩|歩いて)[^\n]*?(\d+)分')
+STATION = re.compile(r'([^\s]+駅)')
+
+POSTAL_LINE = re.compile(r'〒\d{3}-\d{4}[^\n]*')
+
+# 聖心美容クリニック・SBC湘南美容クリニック
+CLINIC_ADDRESS_PATTERNS = [
+    re.compile(r'〒\d{3}-\d{4}\s*[^\n]*?(?:市|区|町|村)[^\n]*?(?:丁目|番地|[0-9]+F?)'),
+    POSTAL_LINE,
+    re.compile(r'(?:東京都|大阪府|京都府|北海道|.*?県)[^\n]*?(?:市|区|町|村)[^\n]*?[0-9]'),
+]
+CLINIC_ACCESS_PATTERNS = [STATION_FROM_WALK, STATION_WALK]
+CLINIC_ACCESS_LABEL_PATTERNS = [STATION_FROM_WALK, STATION_WALK, ACCESS_LABEL_STATION]
+
+# フレイアクリニック
+FREYA_ADDRESS_PATTERNS = [
+    re.compile(r'〒\d{3}-\d{4}\s*[^\n]*?(?:市|区|町|村)[^\n]*?(?:ビル|館|[0-9]+階)'),
+    POSTAL_LINE,
+]
+FREYA_ACCESS_PATTERNS = _compile([
+    r'([^\s]+駅)[^\n]*?(?:から|より)?[^\n]*?(?:徒歩)?[^\n]*?(\d+)分',
+    r'([^\s]+線)[^\n]*?「?([^\s]+駅)」?[^\n]*?(?:徒歩)?[^\n]*?(\d+)分',
+])
+
+# TCB東京中央美容外科
+TCB_ACCESS_PATTERNS = [STATION_WALK, STATION_MINUTES]
+
+# リゼクリニック
+RIZE_ACCESS_PATTERNS = [QUOTED_STATION_WALK, STATION_WALK]
+RIZE_STOP_ACCESS_PATTERNS = [QUOTED_STATION_WALK, QUOTED_STOP_WALK, STATION_WALK]
+
+# 上記以外のサイト
+GENERIC_ADDRESS_PATTERNS = _compile([
+    r'〒\d{3}-\d{4}.*?(?:都|道|府|県).*?(?:市|区|町|村)',
+    r'(?:東京都|大阪府|京都府|北海道|.*?県).*?(?:市|区|町|村).*?\d+',
+])
+GENERIC_ACCESS_PATTERNS = _compile([
+    r'([^\s]+駅).*?(?:徒歩|歩いて).*?(\d+)分',
+    r'([^\s]+停留場).*?(?:徒歩|歩いて).*?(\d+)分',
+])
+
+# 店舗一覧ページのリンク判定（api/app.py の find_clinic_links）
+STORE_LINK_PATTERNS = _compile([
+    # Common patterns
+    r'/(?:clinic|store|shop|branch|location|office|outlet)[s]?/[^/]+/?$',
+    r'/(?:tenpo|mise)/[^/]+/?$',  # Japanese patterns
+    r'/access/[^/]+/?$',
+    r'/map/[^/]+/?$',
+
+    # Specific patterns for known sites
+    r'/locations/[^/]+/?$',  # リゼクリニック用
+    r'/clinic/branch/[^/]+/?$',  # SBC湘南美容クリニック用
+    r'/hifuka/[^/]+/?$',  # SBC湘南美容クリニック用
+    r'/clinic/[a-z]+/?$',  # TCB東京中央美容外科用 (e.g., /clinic/shinjuku)
+
+    # Generic patterns that might be store pages
+    r'/[^/]+[-_](?:store|shop|clinic|branch)/?$',
+    r'/(?:area|region)/[^/]+/[^/]+/?$',  # Area-based URLs
+], re.IGNORECASE)
+LOCATION_KANJI = re.compile(r'[都道府県市区町村]')
+
+# 文字コードの宣言（charset.py、HTMLの先頭のバイト列に適用）
+META_CHARSET = re.compile(rb'<meta[^>]+?charset\s*=\s*["\']?\s*([A-Za-z0-9_.:-]+)', re.IGNORECASE)
+XML_ENCODING = re.compile(rb'^\s*<\?xml[^>]+?encoding\s*=\s*["\']([A-Za-z0-9_.:-]+)', re.IGNORECASE)
+# ひらがな・全角カタカナ（charset.py で日本語の文字コードの候補を比べる）
+KANA = re.compile('[぀-ヿ]')
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+店舗レコードのストリーミング出力
+固定カラムのCSV行 / NDJSON行を1件ずつ生成する
+"""
+
+import csv
+import io
+import json
+
+
+# ストリーミング時はヘッダーを先に送るため、列は取得結果に関わらず固定
+FIELDNAMES = ['店舗名', '住所', 'アクセス', '電話番号', '営業時間', 'URL']
+
+# NDJSONのキー（FIELDNAMESと同じ順序）
+RECORD_KEYS = ['name', 'address', 'access', 'phone', 'hours', 'url']
+
+CSV_MIMETYPE = 'text/csv; charset=utf-8'
+NDJSON_MIMETYPE = 'application/x-ndjson; charset=utf-8'
+
+
+def to_record(clinic):
+    """店舗情報を固定スキーマの辞書に変換"""
+    return {key: clinic.get(key) or '' for key in RECORD_KEYS}
+
+
+def to_row(clinic):
+    """店舗情報を固定カラムのCSV行（辞書）に変換"""
+    record = to_record(clinic)
+    return {field: record[key] for field, key in zip(FIELDNAMES, RECORD_KEYS)}
+
+
+def _csv_line(values):
+    output = io.StringIO()
+    csv.writer(output).writerow(values)
+    return output.getvalue()
+
+
+def csv_header(bom=True):
+    """CSVヘッダー行（Excel向けにBOM付き）"""
+    return ('\ufeff' if bom else '') + _csv_line(FIELDNAMES)
+
+
+def csv_line(clinic):
+    """店舗情報1件分のCSV行"""
+    row = to_row(clinic)
+    return _csv_line([row[field] for field in FIELDNAMES])
+
+
+def ndjson_line(record):
+    """任意の辞書を1行のJSONに変換"""
+    return json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def iter_csv(clinics, bom=True):
+    """ヘッダーを先に返し、その後店舗ごとにCSV行を返す
+
+    途中で例外が発生した場合は、完全な出力と区別できるよう最後に "# error: ..." 行を返して終了する
+    """
+    yield csv_header(bom)
+    count = 0
+    try:
+        for clinic in clinics:
+            count += 1
+            yield csv_line(clinic)
+    except Exception as e:
+        yield _csv_line([f"# error: {e}（{count}件取得済み）"])
+
+
+def iter_ndjson(clinics):
+    """店舗ごとに {"type": "store", ...} の行を返し、最後に完了行を返す
+
+    途中で例外が発生した場合は {"type": "error"} 行を返して終了する
+    """
+    count = 0
+    try:
+        for clinic in clinics:
+            count += 1
+            yield ndjson_line({'type': 'store', **to_record(clinic)})
+    except Exception as e:
+        yield ndjson_line({'type': 'error', 'error': str(e), 'clinic_count': count})
+        return
+    yield ndjson_line({'type': 'done', 'clinic_count': count})
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+取得の再試行とドメインごとのサーキットブレーカー
+一時的な失敗（タイムアウト・接続エラー・429・5xx）は指数バックオフ（ジッター付き）で再試行し、
+404 などの恒久的な失敗は再試行しない。同じドメインで一時的な失敗が続いた場合はブレーカーを開き、
+一定時間そのドメインへの取得を待たずに失敗させる（CircuitOpen）。時間が経つと1件だけ試し、
+成功すれば閉じる
+
+使い方:
+    response = fetch_with_retry(lambda: requests.get(url, timeout=10), url, cancel_event)
+"""
+
+import os
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import metrics
+from concurrency import AdmissionCancelled
+
+
+# 1ページあたりの取得回数（最初の1回を含む）
+RETRY_ATTEMPTS = int(os.environ.get('SCRAPER_RETRY_ATTEMPTS', '3'))
+
+# 再試行までの待ち時間: 0〜min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2^試行回数) 秒の一様乱数
+RETRY_BASE_DELAY = float(os.environ.get('SCRAPER_RETRY_BASE_DELAY', '0.5'))
+RETRY_MAX_DELAY = float(os.environ.get('SCRAPER_RETRY_MAX_DELAY', '8'))
+
+# 一時的な失敗が何回続いたらブレーカーを開くか
+BREAKER_THRESHOLD = int(os.environ.get('SCRAPER_BREAKER_THRESHOLD', '5'))
+
+# ブレーカーを開いてから1件試すまでの秒数
+BREAKER_RESET_SECONDS = float(os.environ.get('SCRAPER_BREAKER_RESET', '30'))
+
+# ブレーカーで即座に失敗させたページを、ブレーカーが閉じるのを待って取得し直す回数
+BREAKER_RETRY_ROUNDS = int(os.environ.get('SCRAPER_BREAKER_ROUNDS', '1'))
+
+# 再試行するステータスコード
+RETRYABLE_STATUSES = (408, 425, 429, 500, 502, 503, 504)
+
+
+class CircuitOpen(Exception):
+    """ブレーカーが開いているため取得しなかった"""
+
+    def __init__(self, domain, retry_in):
+        super().__init__(f"{domain}: 連続して失敗したため {retry_in:.0f}秒間取得を停止しています")
+        self.domain = domain
+        self.retry_in = retry_in
+
+
+def is_retryable(error):
+    """一時的な失敗か（タイムアウト・接続エラー・再試行するステータスコード）"""
+    if isinstance(error, (AdmissionCancelled, CircuitOpen)):
+        return False
+    # fetcher.FetchAborted など、再試行できるかを持つ例外
+    retryable = getattr(error, 'retryable', None)
+    if retryable is not None:
+        return retryable
+    response = getattr(error, 'response', None)
+    if response is not None:
+        return response.status_code in RETRYABLE_STATUSES
+    # requests は取得時に読み込み済み（api/app.py では遅延読み込みのためここで参照する）
+    import requests
+    return isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError))
+
+
+def backoff_delay(attempt, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY):
+    """attempt 回目（1始まり）の失敗後に待つ秒数（full jitter）"""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class _Breaker:
+    def __init__(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.opens = 0
+        self.fast_failures = 0
+
+
+class CircuitBreakers:
+    """ドメインごとのサーキットブレーカー
+
+    closed: 通常どおり取得。一時的な失敗が threshold 回続くと open
+    open: reset_seconds 秒間は CircuitOpen で即座に失敗させる
+    half-open: reset_seconds 経過後は1件だけ試し、成功すれば closed、失敗すれば再び open
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.threshold = max(1, threshold)
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._breakers = {}
+        self.retries = 0
+
+    def _breaker(self, domain):
+        breaker = self._breakers.get(domain)
+        if breaker is None:
+            breaker = self._breakers[domain] = _Breaker()
+        return breaker
+
+    def before(self, domain):
+        """取得してよければ何もしない。ブレーカーが開いている間は CircuitOpen を送出"""
+        with self._lock:
+            breaker = self._breaker(domain)
+            if breaker.opened_at is None:
+                return
+            retry_in = breaker.opened_at + self.reset_seconds - time.monotonic()
+            if retry_in <= 0 and not breaker.probing:
+                # half-open: この1件で回復したか確かめる
+                breaker.probing = True
+                return
+            breaker.fast_failures += 1
+            raise CircuitOpen(domain, max(0.0, retry_in))
+
+    def success(self, domain):
+        with self._lock:
+            breaker = self._breaker(domain)
+            breaker.failures = 0
+            breaker.opened_at = None
+            breaker.probing = False
+
+    def failure(self, domain, retryable):
+        """取得の失敗を記録（恒久的な失敗はサーバーの不調とみなさず連続回数を数えない）"""
+        with self._lock:
+            breaker = self._breaker(domain)
+            if breaker.probing:
+                breaker.probing = False
+                if retryable:
+                    breaker.opened_at = time.monotonic()
+                    breaker.opens += 1
+                    return
+            if not retryable:
+                return
+            breaker.failures += 1
+            if breaker.opened_at is None and breaker.failures >= self.threshold:
+                breaker.opened_at = time.monotonic()
+                breaker.opens += 1
+
+    def abandon(self, domain):
+        """結果を得られなかった取得（キャンセル）。確認中の1件であれば次の取得で改めて試す"""
+        with self._lock:
+            self._breaker(domain).probing = False
+
+    def count_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def retry_in(self, domain):
+        """次に取得を試せるまでの秒数（閉じている場合は 0）"""
+        with self._lock:
+            breaker = self._breakers.get(domain)
+            if breaker is None or breaker.opened_at is None:
+                return 0.0
+            return max(0.0, breaker.opened_at + self.reset_seconds - time.monotonic())
+
+    def snapshot(self):
+        with self._lock:
+            now = time.monotonic()
+            return {
+                domain: {
+                    'state': ('closed' if breaker.opened_at is None
+                              else 'half-open' if breaker.probing or now >= breaker.opened_at + self.reset_seconds
+                              else 'open'),
+                    'consecutive_failures': breaker.failures,
+                    'opens': breaker.opens,
+                    'fast_failures': breaker.fast_failures
+                }
+                for domain, breaker in self._breakers.items()
+            }
+
+
+breakers = CircuitBreakers()
+
+
+def fetch_with_retry(fetch, url, cancel_event=None, attempts=RETRY_ATTEMPTS, deadline=None):
+    """fetch() を一時的な失敗の間は再試行して実行し、その戻り値を返す
+
+    ブレーカーが開いている場合は CircuitOpen、恒久的な失敗や再試行回数を超えた場合は最後の例外を送出。
+    deadline（time.monotonic() の時刻）を指定した場合は、待ち時間を残り時間の半分までに抑え、
+    残り時間がなくなった時点で再試行をやめる（実行時間に上限のあるサーバーレス環境用）
+    """
+    domain = urlparse(url).netloc
+    attempt = 0
+    while True:
+        attempt += 1
+        breakers.before(domain)
+        try:
+            result = fetch()
+        except Exception as e:
+            if isinstance(e, AdmissionCancelled):
+                breakers.abandon(domain)
+                raise
+            retryable = is_retryable(e)
+            breakers.failure(domain, retryable)
+            if not retryable or attempt >= attempts:
+                raise
+            delay = backoff_delay(attempt)
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise
+                # 残りの半分は次の取得に使う
+                delay = min(delay, remaining / 2)
+            breakers.count_retry()
+            if cancel_event is not None:
+                if cancel_event.wait(delay):
+                    raise AdmissionCancelled(url)
+            else:
+                time.sleep(delay)
+            continue
+        breakers.success(domain)
+        return result
+
+
+def _collect_metrics():
+    states = breakers.snapshot().values()
+    return [
+        '# HELP scraper_fetch_retries_total Fetch attempts retried after a transient failure',
+        '# TYPE scraper_fetch_retries_total counter',
+        f'scraper_fetch_retries_total {breakers.retries}',
+        '# HELP scraper_breaker_opens_total Times a per-domain circuit breaker opened',
+        '# TYPE scraper_breaker_opens_total counter',
+        f'scraper_breaker_opens_total {sum(state["opens"] for state in states)}',
+        '# HELP scraper_breaker_fast_failures_total Fetches failed fast while a breaker was open',
+        '# TYPE scraper_breaker_fast_failures_total counter',
+        f'scraper_breaker_fast_failures_total {sum(state["fast_failures"] for state in states)}',
+        '# HELP scraper_breaker_open Domains whose breaker is currently open',
+        '# TYPE scraper_breaker_open gauge',
+        f'scraper_breaker_open {sum(1 for state in states if state["state"] != "closed")}',
+    ]
+
+
+metrics.register_collector(_collect_metrics)
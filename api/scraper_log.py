@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+スクレイパーのログ出力
+レベル付きのログを別スレッドで書き出し（QueueHandler）、抽出処理のスレッドでは標準出力への書き込みを行わない。
+DEBUG ログはジョブ単位でサンプリングし、選ばれたジョブのみ出力する
+
+使い方:
+    logger = get_logger(__name__)
+    with job_context(job_id):
+        logger.debug("...")   # SCRAPER_LOG_LEVEL=DEBUG かつサンプリング対象のジョブのみ出力
+"""
+
+import atexit
+import contextvars
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import zlib
+from contextlib import contextmanager
+
+
+LOG_LEVEL = os.environ.get('SCRAPER_LOG_LEVEL', 'INFO').upper()
+
+# DEBUG ログを出力するジョブの割合（0〜1）
+DEBUG_SAMPLE_RATE = float(os.environ.get('SCRAPER_LOG_SAMPLE', '1.0'))
+
+# 書き出し待ちのログの上限（超えた分は破棄して件数を数える）
+QUEUE_SIZE = int(os.environ.get('SCRAPER_LOG_QUEUE', '10000'))
+
+LOGGER_NAME = 'scraper'
+
+_current_job = contextvars.ContextVar('scraper_job', default=None)
+_configure_lock = threading.Lock()
+_listener = None
+
+
+def job_sampled(job_id, rate=None):
+    """ジョブIDから決定的に DEBUG ログの出力対象かを判定"""
+    rate = DEBUG_SAMPLE_RATE if rate is None else rate
+    if rate >= 1:
+        return True
+    if rate <= 0:
+        return False
+    return zlib.crc32(str(job_id).encode('utf-8')) % 10000 < rate * 10000
+
+
+@contextmanager
+def job_context(job_id):
+    """範囲内のログにジョブIDを付け、DEBUG ログのサンプリング単位にする"""
+    token = _current_job.set((job_id, job_sampled(job_id)))
+    try:
+        yield
+    finally:
+        _current_job.reset(token)
+
+
+def with_job_context(job_id, iterable):
+    """ジェネレーターの消費中に job_context を適用する（ストリーミング出力用）"""
+    with job_context(job_id):
+        yield from iterable
+
+
+class JobFilter(logging.Filter):
+    """ジョブIDを付与し、サンプリング対象外のジョブの DEBUG ログを除外する"""
+
+    def filter(self, record):
+        job = _current_job.get()
+        record.job_id = job[0] if job else '-'
+        if record.levelno <= logging.DEBUG and job and not job[1]:
+            return False
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """キューが一杯の場合はログを破棄する（抽出処理を待たせない）"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure(level=None, stream=None):
+    """scraper ロガーにキュー経由のハンドラーを設定（2回目以降は何もしない）"""
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            return
+        output = logging.StreamHandler(stream or sys.stderr)
+        output.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s job=%(job_id)s %(message)s'))
+
+        log_queue = queue.Queue(QUEUE_SIZE)
+        handler = DroppingQueueHandler(log_queue)
+        handler.addFilter(JobFilter())
+
+        logger = logging.getLogger(LOGGER_NAME)
+        logger.setLevel(level or LOG_LEVEL)
+        logger.addHandler(handler)
+        logger.propagate = False
+
+        _listener = logging.handlers.QueueListener(log_queue, output)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+
+def get_logger(name):
+    """scraper.<name> のロガーを返す"""
+    configure()
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
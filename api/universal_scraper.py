@@ -4,67 +4,42 @@ Universal Store Information Scraper
 A flexible and intelligent scraping system that can extract store information from any website
 """
 
-import re
 import json
-from typing import Dict, List, Optional, Tuple, Any
+import re
+from re import Pattern
+from typing import Dict, List, Optional, Tuple, Any, Union
 from urllib.parse import urlparse
 from bs4 import BeautifulSoup, Tag
 from collections import Counter
 import unicodedata
 
+import patterns
+from metrics import timer
+
 
 class PatternMatcher:
-    """Pattern matching utilities for information extraction"""
-    
-    # Japanese address patterns
-    ADDRESS_PATTERNS = [
-        # With postal code
-        (r'〒\s*(\d{3}[-ー－]\d{4})\s*([^\n\r]{1,100})', 100),
-        (r'〒\s*(\d{7})\s*([^\n\r]{1,100})', 95),
-        
-        # Full address patterns
-        (r'((?:東京都|大阪府|京都府|北海道|[^\s]{2,4}県)[^\n\r]*?(?:市|区|町|村)[^\n\r]*?(?:\d+(?:[-ー－]\d+)*(?:番地?)?|[一二三四五六七八九十]+丁目)[^\n\r]*)', 90),
-        (r'((?:東京都|大阪府|京都府|北海道|[^\s]{2,4}県)[^\n\r]*?[市区町村][^\n\r]*?\d+[-ー－]\d+[-ー－]\d+)', 85),
-        
-        # Building/Floor patterns
-        (r'([^\n\r]*?(?:ビル|ビルディング|タワー|センター|プラザ|[^\s]+館)[^\n\r]*?(?:\d+階|[一二三四五六七八九十]+階|B\d+F?|\d+F))', 70),
-    ]
-    
-    # Access/Station patterns
-    ACCESS_PATTERNS = [
-        # Station with walking time
-        (r'「?([^「」\s]+(?:駅|停留場))」?\s*(?:から|より)?\s*(?:徒歩|歩いて)?\s*(?:約)?\s*(\d+)\s*分', 100),
-        (r'([^「」\s]+(?:駅|停留場))\s*(?:徒歩|歩いて)\s*(?:約)?\s*(\d+)\s*分', 95),
-        (r'(?:最寄り?駅?[:：]?\s*)([^「」\s]+駅)[^\n\r]*?(\d+)\s*分', 90),
-        
-        # Station only patterns
-        (r'(?:最寄り?駅?[:：]?\s*)「?([^「」\s]+駅)」?', 70),
-        (r'(?:アクセス|交通)[^\n\r]*?「?([^「」\s]+駅)」?', 65),
-        
-        # Line and station
-        (r'([^「」\s]+線)\s*「?([^「」\s]+駅)」?', 80),
-    ]
-    
-    # Phone number patterns
-    PHONE_PATTERNS = [
-        (r'(?:TEL|Tel|tel|電話|☎|📞)\s*[:：]?\s*([\d\-\(\)]{10,})', 100),
-        (r'(\d{2,4}[-ー－]\d{2,4}[-ー－]\d{3,4})', 90),
-        (r'(\d{10,11})', 70),
-    ]
+    """Pattern matching utilities for information extraction
+
+    The patterns themselves are precompiled in the patterns module.
+    """
     
-    # Business hours patterns
-    HOURS_PATTERNS = [
-        (r'(?:営業時間|受付時間|診療時間)[^\n\r]*?[:：]?\s*([^\n\r]+)', 100),
-        (r'(\d{1,2}[:：]\d{2}\s*[~〜～ー－-]\s*\d{1,2}[:：]\d{2})', 90),
-        (r'(?:平日|月.金)\s*[:：]?\s*(\d{1,2}[:：]\d{2}\s*[~〜～ー－-]\s*\d{1,2}[:：]\d{2})', 85),
-    ]
+    # Aliases of the lists in the patterns module (kept for callers that read or extend them)
+    ADDRESS_PATTERNS = patterns.ADDRESS_PATTERNS
+    ACCESS_PATTERNS = patterns.ACCESS_PATTERNS
+    PHONE_PATTERNS = patterns.PHONE_PATTERNS
+    HOURS_PATTERNS = patterns.HOURS_PATTERNS
     
     @classmethod
-    def extract_with_confidence(cls, text: str, patterns: List[Tuple[str, int]]) -> List[Tuple[str, int]]:
-        """Extract information with confidence scores"""
+    def extract_with_confidence(cls, text: str, scored_patterns: List[Tuple[Union[Pattern, str], int]]) -> List[Tuple[str, int]]:
+        """Extract information with confidence scores
+
+        Patterns added as strings are compiled here with the same flags as the patterns module.
+        """
         results = []
-        for pattern, base_confidence in patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE | re.MULTILINE)
+        for pattern, base_confidence in scored_patterns:
+            if isinstance(pattern, str):
+                pattern = re.compile(pattern, re.IGNORECASE | re.MULTILINE)
+            matches = pattern.findall(text)
             for match in matches:
                 if isinstance(match, tuple):
                     match = ' '.join(match).strip()
@@ -219,7 +194,7 @@ class IntelligentExtractor:
         # 1. Pattern matching on full text
         address_matches = self.pattern_matcher.extract_with_confidence(
             text_content, 
-            PatternMatcher.ADDRESS_PATTERNS
+            patterns.ADDRESS_PATTERNS
         )
         candidates.extend(address_matches)
         
@@ -265,7 +240,7 @@ class IntelligentExtractor:
         seen = set()
         for addr, conf in candidates:
             # Clean address
-            addr = re.sub(r'\s+', ' ', addr).strip()
+            addr = patterns.WHITESPACE.sub(' ', addr).strip()
             # Normalize
             addr_normalized = unicodedata.normalize('NFKC', addr)
             
@@ -287,15 +262,15 @@ class IntelligentExtractor:
         # 1. Pattern matching for station access
         access_matches = self.pattern_matcher.extract_with_confidence(
             text_content,
-            PatternMatcher.ACCESS_PATTERNS
+            patterns.ACCESS_PATTERNS
         )
         
         # Process matches to find the best station info
         station_info = {}
         for match, conf in access_matches:
             # Extract station and minutes
-            station_match = re.search(r'([^「」\s]+(?:駅|停留場))', match)
-            minutes_match = re.search(r'(\d+)\s*分', match)
+            station_match = patterns.STATION_NAME.search(match)
+            minutes_match = patterns.WALK_MINUTES.search(match)
             
             if station_match:
                 station = station_match.group(1)
@@ -339,13 +314,13 @@ class IntelligentExtractor:
         # Pattern matching
         phone_matches = self.pattern_matcher.extract_with_confidence(
             text_content,
-            PatternMatcher.PHONE_PATTERNS
+            patterns.PHONE_PATTERNS
         )
         
         # Clean phone numbers
         for phone, conf in phone_matches:
             # Remove common non-digit characters
-            cleaned = re.sub(r'[^\d\-]', '', phone)
+            cleaned = patterns.NON_PHONE_CHARS.sub('', phone)
             if cleaned and len(cleaned) >= 10:
                 candidates.append((phone, conf))
         
@@ -363,7 +338,7 @@ class IntelligentExtractor:
         # Pattern matching
         hours_matches = self.pattern_matcher.extract_with_confidence(
             text_content,
-            PatternMatcher.HOURS_PATTERNS
+            patterns.HOURS_PATTERNS
         )
         candidates.extend(hours_matches)
         
@@ -377,11 +352,16 @@ class IntelligentExtractor:
         """Extract all store information with confidence scores"""
         
         # Extract each piece of information
-        name, name_conf = self.extract_store_name(soup, url)
-        address, addr_conf = self.extract_address(soup)
-        access, access_conf = self.extract_access(soup)
-        phone, phone_conf = self.extract_phone(soup)
-        hours, hours_conf = self.extract_hours(soup)
+        with timer('extract_name'):
+            name, name_conf = self.extract_store_name(soup, url)
+        with timer('extract_address'):
+            address, addr_conf = self.extract_address(soup)
+        with timer('extract_access'):
+            access, access_conf = self.extract_access(soup)
+        with timer('extract_phone'):
+            phone, phone_conf = self.extract_phone(soup)
+        with timer('extract_hours'):
+            hours, hours_conf = self.extract_hours(soup)
         
         # Calculate overall confidence
         total_conf = sum([name_conf, addr_conf, access_conf]) / 3
@@ -428,7 +408,8 @@ class UniversalStoreScraper:
         for pattern, extractor in self.legacy_extractors.items():
             if pattern in domain:
                 # Use legacy extractor
-                legacy_result = extractor(soup, url, store_name)
+                with timer('extract_legacy'):
+                    legacy_result = extractor(soup, url, store_name)
                 # If legacy extractor returns good results, use them
                 if legacy_result.get('name') and (legacy_result.get('address') or legacy_result.get('access')):
                     return legacy_result
@@ -442,10 +423,15 @@ class UniversalStoreScraper:
         
         # If confidence is too low, try to enhance with section analysis
         if result['confidence_scores']['overall'] < 70:
-            sections = self.intelligent_extractor.structural_analyzer.find_info_sections(soup)
+            with timer('find_info_sections'):
+                sections = self.intelligent_extractor.structural_analyzer.find_info_sections(soup)
             for section in sections[:3]:  # Check top 3 sections
                 section_soup = BeautifulSoup(str(section['element']), 'html.parser')
-                section_result = self.intelligent_extractor.extract_all_info(section_soup, url)
+                try:
+                    section_result = self.intelligent_extractor.extract_all_info(section_soup, url)
+                finally:
+                    # Release the re-parsed section right away instead of waiting for GC (also when extraction fails)
+                    section_soup.decompose()
                 
                 # Update with better results
                 for field in ['name', 'address', 'access', 'phone', 'hours']:
@@ -543,31 +529,20 @@ class UniversalStoreScraper:
         text_content = soup.get_text()
         
         # Address extraction
-        address_patterns = [
-            r'〒\d{3}-\d{4}\s*[^\n]*?(?:市|区|町|村)[^\n]*?(?:丁目|番地|[0-9]+F?)',
-            r'〒\d{3}-\d{4}[^\n]*',
-            r'(?:東京都|大阪府|京都府|北海道|.*?県)[^\n]*?(?:市|区|町|村)[^\n]*?[0-9]',
-        ]
-        
-        for pattern in address_patterns:
-            match = re.search(pattern, text_content)
+        for pattern in patterns.CLINIC_ADDRESS_PATTERNS:
+            match = pattern.search(text_content)
             if match:
                 address = match.group(0).strip()
-                address = re.sub(r'\s+', ' ', address)
+                address = patterns.WHITESPACE.sub(' ', address)
                 clinic_info['address'] = address
                 break
         
         # Access extraction
-        access_patterns = [
-            r'([^\s]+駅)[^\n]*?(?:から|より)[^\n]*?(?:徒歩|歩いて)[^\n]*?(\d+)分',
-            r'([^\s]+駅)[^\n]*?(?:徒歩|歩いて)[^\n]*?(\d+)分',
-        ]
-        
         found_station = None
         min_minutes = 999
         
-        for pattern in access_patterns:
-            matches = re.findall(pattern, text_content)
+        for pattern in patterns.CLINIC_ACCESS_PATTERNS:
+            matches = pattern.findall(text_content)
             for match in matches:
                 if len(match) == 2:
                     station = match[0]
@@ -612,16 +587,11 @@ class UniversalStoreScraper:
                         clinic_info['address'] = td.get_text(strip=True)
         
         text_content = soup.get_text()
-        station_patterns = [
-            r'「([^\s]+駅)」[^\n]*?(?:徒歩|歩いて)[^\n]*?(\d+)分',
-            r'([^\s]+駅)[^\n]*?(?:徒歩|歩いて)[^\n]*?(\d+)分',
-        ]
-        
         found_station = None
         min_minutes = 999
         
-        for pattern in station_patterns:
-            matches = re.findall(pattern, text_content)
+        for pattern in patterns.RIZE_ACCESS_PATTERNS:
+            matches = pattern.findall(text_content)
             for match in matches:
                 if len(match) == 2:
                     station = match[0]
@@ -3,19 +3,36 @@
 クリニック店舗情報スクレイパー ウェブアプリケーション
 """
 
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response
 from flask_cors import CORS
 import os
 import threading
+from contextlib import nullcontext
 from clinic_info_scraper import ClinicInfoScraper
+from coalescer import RequestCoalescer
+import concurrency
+import metrics
+import retry
+import fetcher
+from job_store import JobStore, STATUS_COMPLETED, STATUS_FAILED, STATUS_CANCELLED
+from job_profiler import JobProfiler
+from scraper_log import get_logger, job_context
 import time
 
 app = Flask(__name__)
 CORS(app)
 
+logger = get_logger('app')
+
 # スクレイパーインスタンスを保持
 scrapers = {}
 
+# 同一URLの同時実行をまとめる（完了結果は SCRAPE_RESULT_TTL 秒間再利用）
+coalescer = RequestCoalescer()
+
+# ジョブのチェックポイント（再起動後に未完了ジョブを再開する）
+job_store = JobStore()
+
 @app.route('/')
 def index():
     """メインページ"""
@@ -23,15 +40,45 @@ def index():
 
 @app.route('/api/scrape', methods=['POST'])
 def start_scrape():
-    """スクレイピングを開始"""
+    """スクレイピングを開始
+
+    profile: true の場合は既存のセッションに合流せず新しいジョブを開始し、
+    そのジョブのみプロファイルを downloads/ に保存する
+    """
     data = request.json
     url = data.get('url')
     
     if not url:
         return jsonify({'success': False, 'error': 'URLが指定されていません'}), 400
     
-    # セッションID（簡易的にタイムスタンプを使用）
-    session_id = str(int(time.time() * 1000))
+    if data.get('profile'):
+        return jsonify({
+            'success': True,
+            'session_id': start_job(url, profile=True),
+            'coalesced': False
+        })
+    
+    # 同じURLが実行中または完了直後であれば既存のセッションに合流
+    # requester_id はキャンセル時に送り、合流した要求元ごとに1回だけ数える
+    session_id, coalesced, requester_id = coalescer.attach_or_start(url, lambda: start_job(url))
+    
+    return jsonify({
+        'success': True,
+        'session_id': session_id,
+        'coalesced': coalesced,
+        'requester_id': requester_id
+    })
+
+def start_job(url, session_id=None, profile=False):
+    """スクレイピングジョブをバックグラウンドで開始し、セッションIDを返す
+
+    session_id を指定した場合は保存済みのチェックポイントから再開する
+    profile を指定した場合はジョブの実行スレッドを cProfile とサンプリングで計測する
+    """
+    if session_id is None:
+        # セッションID（簡易的にタイムスタンプを使用）
+        session_id = str(int(time.time() * 1000))
+        job_store.create_job(session_id, url)
     
     # スクレイパーインスタンスを作成
     scraper = ClinicInfoScraper()
@@ -39,12 +86,15 @@ def start_scrape():
     
     # バックグラウンドでスクレイピングを実行
     def run_scrape():
+        success = False
+        profiler = JobProfiler(session_id, 'downloads') if profile else None
         try:
-            print(f"Starting scraping for URL: {url}")  # デバッグ用
-            success = scraper.scrape_clinics(url)
-            print(f"Scraping completed. Success: {success}, Clinic count: {len(scraper.clinic_data)}")  # デバッグ用
+            logger.info("Starting scraping for URL: %s", url)
+            with profiler or nullcontext():
+                success = scraper.scrape_clinics(url, job_store=job_store, job_id=session_id)
+            logger.info("Scraping completed. Success: %s, Clinic count: %d", success, len(scraper.clinic_data))
             if success:
-                # CSVファイルを保存
+                # CSVファイルを保存（キャンセル時は取得済みの部分結果を保存）
                 csv_filename = scraper.save_to_csv()
                 # セッション情報にダウンロード情報を追加
                 scrapers[session_id] = {
@@ -53,7 +103,8 @@ def start_scrape():
                         'success': True,
                         'filename': os.path.basename(csv_filename),
                         'download_url': f'/download/{os.path.basename(csv_filename)}',
-                        'clinic_count': len(scraper.clinic_data)
+                        'clinic_count': len(scraper.clinic_data),
+                        'cancelled': scraper.cancelled
                     }
                 }
             else:
@@ -68,6 +119,7 @@ def start_scrape():
                 }
         except Exception as e:
             # 例外をキャッチして記録
+            success = False
             scrapers[session_id] = {
                 'scraper': scraper,
                 'result': {
@@ -76,19 +128,54 @@ def start_scrape():
                     'clinic_count': len(scraper.clinic_data)
                 }
             }
+        finally:
+            session = scrapers[session_id]
+            result = session['result'] if isinstance(session, dict) else None
+            if profiler and result is not None:
+                result['profile_files'] = [f'/download/{name}' for name in profiler.files]
+            if scraper.cancelled:
+                status = STATUS_CANCELLED
+            else:
+                status = STATUS_COMPLETED if success else STATUS_FAILED
+            job_store.finish_job(session_id, status, result)
+            # 成功した結果のみ鮮度ウィンドウ内で再利用する（キャンセルされた部分結果は再利用しない）
+            coalescer.complete(url, session_id, success and not scraper.cancelled)
+    
+    def run_with_context():
+        with job_context(session_id):
+            run_scrape()
     
-    thread = threading.Thread(target=run_scrape)
+    thread = threading.Thread(target=run_with_context)
     thread.start()
     
-    return jsonify({
-        'success': True,
-        'session_id': session_id
-    })
+    return session_id
+
+def resume_incomplete_jobs():
+    """前回のプロセスで完了しなかったジョブをチェックポイントから再開"""
+    for job in job_store.incomplete_jobs():
+        logger.info("Resuming job %s: %s", job['job_id'], job['url'])
+        coalescer.attach_or_start(job['url'], lambda job=job: start_job(job['url'], job['job_id']), attach=False)
+
+# 保存済みのジョブの状態 -> 進捗に表示する状態
+JOB_STATUS_LABELS = {STATUS_COMPLETED: '完了', STATUS_CANCELLED: 'キャンセル', STATUS_FAILED: 'エラー'}
 
 @app.route('/api/progress/<session_id>')
 def get_progress(session_id):
     """進捗状況を取得"""
     if session_id not in scrapers:
+        # 再起動前に完了したジョブは保存済みの結果を返す
+        job = job_store.get_job(session_id)
+        if job and job['result']:
+            return jsonify({
+                'progress': 0,
+                'total': 0,
+                'percentage': 100,
+                'status': JOB_STATUS_LABELS.get(job['status'], 'エラー'),
+                'current_action': '',
+                'clinic_count': job['result'].get('clinic_count', 0),
+                'completed': True,
+                'result': job['result']
+            })
         return jsonify({'error': 'セッションが見つかりません'}), 404
     
     scraper_data = scrapers[session_id]
@@ -107,6 +194,40 @@ def get_progress(session_id):
         progress['clinic_count'] = len(scraper_data.clinic_data) if hasattr(scraper_data, 'clinic_data') else 0
         return jsonify(progress)
 
+@app.route('/api/cancel/<session_id>', methods=['POST'])
+def cancel_scrape(session_id):
+    """実行中のスクレイピングをキャンセル（取得済みの結果は保存される）
+
+    同じURLの要求で合流した他の要求元が残っている場合は、この要求元だけを外してジョブは続ける（detached）。
+    要求元は開始時に返した requester_id（リクエスト本文）で識別する
+    """
+    if session_id not in scrapers:
+        return jsonify({'success': False, 'error': 'セッションが見つかりません'}), 404
+    
+    scraper_data = scrapers[session_id]
+    
+    # 辞書の場合は既に完了している
+    if isinstance(scraper_data, dict):
+        return jsonify({'success': False, 'error': 'このスクレイピングは既に完了しています'}), 409
+    
+    requester_id = (request.get_json(silent=True) or {}).get('requester_id')
+    if not coalescer.detach(session_id, requester_id):
+        return jsonify({'success': True, 'cancelled': False, 'detached': True})
+    
+    scraper_data.cancel()
+    return jsonify({'success': True, 'cancelled': True})
+
+@app.route('/api/metrics')
+def metrics_endpoint():
+    """ステージごとの処理時間と同時実行数（Prometheus テキスト形式）"""
+    return Response(metrics.render_prometheus(), content_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
+@app.route('/api/admission')
+def admission():
+    """プロセス全体の同時取得数・解析数とホストごとの同時取得数・ブレーカーの状況（インスタンスのサイジング用）"""
+    return jsonify({**concurrency.admission_snapshot(), 'breakers': retry.breakers.snapshot(),
+                    'fetch': fetcher.snapshot()})
+
 @app.route('/download/<filename>')
 def download_file(filename):
     """ファイルをダウンロード"""
@@ -119,7 +240,7 @@ def download_file(filename):
         file_path,
         as_attachment=True,
         download_name=filename,
-        mimetype='text/csv'
+        mimetype='text/csv' if filename.endswith('.csv') else 'application/octet-stream'
     )
 
 @app.route('/api/cleanup', methods=['POST'])
@@ -145,5 +266,12 @@ if __name__ == '__main__':
     # テンプレートディレクトリを作成
     os.makedirs('templates', exist_ok=True)
     
+    # デバッグモード（リローダー付き）で起動する。FLASK_DEBUG=0 でリローダーなしで起動
+    debug = os.environ.get('FLASK_DEBUG', '1').lower() not in ('0', 'false', 'no')
+    
+    # 未完了のジョブを再開（リローダーを使う場合は、監視用の親プロセスではなく子プロセスでのみ実行）
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        resume_incomplete_jobs()
+    
     # アプリケーションを起動
-    app.run(debug=True, port=5001, host='127.0.0.1')
\ No newline at end of file
+    app.run(debug=debug, port=5001, host='127.0.0.1')
\ No newline at end of file
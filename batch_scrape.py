@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+URLリストの一括スクレイピング（コマンドライン）
+ファイルまたは標準入力から店舗一覧ページのURLを1行に1つ読み込み、複数のURLを並行して取得し、
+抽出した店舗情報を1件ずつ CSV / NDJSON に追記する（取得途中でも出力ファイルを読める）
+
+同じホストへの同時クロール数は --per-host で制限する。店舗ページの取得はドメインごとの待ち行列を
+順番に回すスケジューラー（scheduler.DomainScheduler）を通し、全体の同時取得数を --max-fetches 以下に保つ。
+店舗数の多いチェーンと少ないチェーンを同時に取得しても、少ないチェーンが待たされ続けることはない。
+--report-interval 秒ごとにドメインごとのスループットとチェーンごとの完了見込みを標準エラー出力に表示する。
+ジョブの進捗は出力ファイルの隣の
+状態DB（<出力ファイル>.state.sqlite3）に保存し、中断後に --resume を付けて同じコマンドを
+実行すると、完了したURLを飛ばし、途中のURLは取得済みの店舗ページを飛ばして再開する。
+出力済みの店舗（URLが同じもの）は再度書き出さない
+
+使い方:
+    python batch_scrape.py --input urls.txt --output stores.ndjson --jobs 8 --per-host 1
+    python batch_scrape.py --input urls.txt --output stores.ndjson --jobs 20 --max-fetches 16 --fetch-workers 4 \
+        --weight www.example.com=2
+    cat urls.txt | python batch_scrape.py --output stores.csv --resume
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from urllib.parse import urlparse
+
+import record_stream
+from clinic_info_scraper import ClinicInfoScraper
+from concurrency import MAX_FETCHES
+from job_store import JobStore, STATUS_COMPLETED, STATUS_FAILED
+from scheduler import DomainScheduler
+from scraper_log import get_logger, job_context
+
+
+FORMATS = ('csv', 'ndjson')
+
+logger = get_logger(__name__)
+
+
+def read_urls(stream):
+    """1行に1つのURLを読み込む（空行・# で始まる行は無視、重複は最初の1つのみ）"""
+    urls = []
+    seen = set()
+    for line in stream:
+        url = line.strip()
+        if not url or url.startswith('#') or url in seen:
+            continue
+        seen.add(url)
+        urls.append(url)
+    return urls
+
+
+def job_id_for(url):
+    """URLごとに固定のジョブID（再実行時に同じチェックポイントを参照する）"""
+    return 'batch-' + hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]
+
+
+def format_for(path, fmt=None):
+    if fmt:
+        return fmt
+    return 'csv' if path.lower().endswith('.csv') else 'ndjson'
+
+
+class RecordWriter:
+    """店舗情報を1件ずつ出力ファイルに追記する（複数スレッドから呼び出せる）
+
+    書き込みごとに flush するため、中断しても書き終えた行は残る。
+    resume=True の場合は既存の出力に追記し、出力済みの店舗URLは書き出さない
+    """
+
+    def __init__(self, path, fmt, resume=False):
+        self.path = path
+        self.fmt = fmt
+        self.written = 0
+        self._lock = threading.Lock()
+        if not resume and os.path.exists(path) and os.path.getsize(path) > 0:
+            raise FileExistsError(f"出力ファイルが既に存在します（再開する場合は --resume）: {path}")
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 途中まで書かれた行の店舗は出力済みとみなさない（削除してから出力済みのURLを読む）
+        self._trim_partial_line()
+        self._seen = self._load_urls() if resume else set()
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'a', encoding='utf-8', newline='')
+        if new_file and fmt == 'csv':
+            self._file.write(record_stream.csv_header())
+            self._file.flush()
+
+    def _load_urls(self):
+        if not os.path.exists(self.path):
+            return set()
+        with open(self.path, encoding='utf-8-sig', newline='') as f:
+            if self.fmt == 'csv':
+                return {row['URL'] for row in csv.DictReader(f) if row.get('URL')}
+            urls = set()
+            for line in f:
+                try:
+                    urls.add(json.loads(line)['url'])
+                except (ValueError, KeyError, TypeError):
+                    # 中断で途中まで書かれた行
+                    continue
+            return urls
+
+    def _trim_partial_line(self):
+        """中断で途中まで書かれた最後の行を削除"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb+') as f:
+            content = f.read()
+            if content and not content.endswith(b'\n'):
+                f.truncate(content.rfind(b'\n') + 1)
+
+    def write(self, clinic, source):
+        """書き出した場合は True（出力済みの店舗は False）"""
+        with self._lock:
+            if clinic['url'] in self._seen:
+                return False
+            self._seen.add(clinic['url'])
+            if self.fmt == 'csv':
+                self._file.write(record_stream.csv_line(clinic))
+            else:
+                self._file.write(record_stream.ndjson_line({**record_stream.to_record(clinic), 'source': source}))
+            self._file.flush()
+            self.written += 1
+            return True
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class HostQueue:
+    """ホストごとの同時クロール数を per_host 以下に保ちながら次のURLを渡す
+
+    ホストは順番に回すため、1つのホストのURLが多くても他のホストが後回しにならない
+    """
+
+    def __init__(self, urls, per_host=1):
+        self.per_host = max(1, per_host)
+        self._pending = OrderedDict()
+        for url in urls:
+            self._pending.setdefault(urlparse(url).netloc, deque()).append(url)
+        self._active = Counter()
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def take(self):
+        """次のURL（残りがない・close() 後は None）。空きのあるホストがなければ待つ"""
+        with self._cond:
+            while True:
+                if self._closed or not self._pending:
+                    return None
+                for host in self._pending:
+                    if self._active[host] < self.per_host:
+                        urls = self._pending.pop(host)
+                        url = urls.popleft()
+                        if urls:
+                            # 末尾に回して次は別のホストを選ぶ
+                            self._pending[host] = urls
+                        self._active[host] += 1
+                        return url
+                self._cond.wait()
+
+    def done(self, url):
+        with self._cond:
+            self._active[urlparse(url).netloc] -= 1
+            self._cond.notify_all()
+
+    def close(self):
+        """残りのURLを渡さない（中断時）"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class BatchRunner:
+    """URLリストを jobs 個のスレッドで取得する"""
+
+    def __init__(self, urls, writer, job_store, jobs=4, per_host=1, interval=None, resume=False, log=sys.stderr,
+                 scheduler=None, fetch_workers=None, report_interval=0):
+        self.urls = urls
+        self.writer = writer
+        self.job_store = job_store
+        self.jobs = max(1, jobs)
+        self.per_host = per_host
+        self.interval = interval
+        self.resume = resume
+        self.log = log
+        self.scheduler = scheduler or DomainScheduler(MAX_FETCHES)
+        self.fetch_workers = fetch_workers
+        self.report_interval = report_interval
+        self.queue = None
+        self.results = {}
+        self.total = 0
+        self._scrapers = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def _print(self, message):
+        with self._lock:
+            print(message, file=self.log, flush=True)
+
+    def pending_urls(self):
+        """今回取得するURL（再開時は完了済みのURLを除く）"""
+        if not self.resume:
+            return list(self.urls)
+        pending = []
+        for url in self.urls:
+            job = self.job_store.get_job(job_id_for(url))
+            if job and job['status'] == STATUS_COMPLETED:
+                self.results[url] = {'skipped': True, **(job['result'] or {})}
+            else:
+                pending.append(url)
+        return pending
+
+    def scrape(self, url):
+        job_id = job_id_for(url)
+        self.job_store.create_job(job_id, url)
+        scraper = ClinicInfoScraper()
+        if self.interval is not None:
+            scraper.request_interval = self.interval
+        if self.fetch_workers:
+            scraper.fetch_workers = self.fetch_workers
+        scraper.scheduler = self.scheduler
+        scraper.on_record = lambda clinic: self.writer.write(clinic, url)
+        # チェックポイントに保存済みで出力に無いレコード（出力前に中断した場合など）を書き出す
+        for clinic in self.job_store.load_records(job_id):
+            self.writer.write(clinic, url)
+        with self._lock:
+            self._scrapers[url] = scraper
+        start = time.perf_counter()
+        try:
+            with job_context(job_id):
+                success = scraper.scrape_clinics(url, job_store=self.job_store, job_id=job_id)
+        finally:
+            with self._lock:
+                self._scrapers.pop(url, None)
+        result = {
+            'success': success,
+            'clinic_count': len(scraper.clinic_data),
+            'cancelled': scraper.cancelled,
+            'elapsed_sec': round(time.perf_counter() - start, 3)
+        }
+        if not success:
+            result['error'] = scraper.current_action
+        # 中断した場合は実行中のまま残し、次回 --resume で続きから取得する
+        if not scraper.cancelled:
+            self.job_store.finish_job(job_id, STATUS_COMPLETED if success else STATUS_FAILED, result)
+        return result
+
+    def _worker(self):
+        while True:
+            url = self.queue.take()
+            if url is None:
+                return
+            try:
+                result = self.scrape(url)
+            except Exception as e:
+                logger.warning("batch url failed %s: %s", url, e)
+                result = {'success': False, 'clinic_count': 0, 'error': str(e)}
+            finally:
+                self.queue.done(url)
+            with self._lock:
+                self.results[url] = result
+                finished = sum(1 for entry in self.results.values() if not entry.get('skipped'))
+            if self._stopping.is_set():
+                continue
+            status = 'OK' if result['success'] else f"NG {result.get('error', '')}"
+            self._print(f"[{finished}/{self.total}] {url} {result['clinic_count']}件 {status}")
+
+    def run(self):
+        pending = self.pending_urls()
+        self.total = len(pending)
+        if self.resume and len(pending) < len(self.urls):
+            self._print(f"完了済みの {len(self.urls) - len(pending)} 件のURLを飛ばします")
+        self.queue = HostQueue(pending, self.per_host)
+        threads = [threading.Thread(target=self._worker, name=f"batch-{number}", daemon=True)
+                   for number in range(min(self.jobs, len(pending)))]
+        for thread in threads:
+            thread.start()
+        next_report = time.monotonic() + self.report_interval
+        try:
+            for thread in threads:
+                # join() をタイムアウト付きで呼び、Ctrl+C を受け取れるようにする
+                while thread.is_alive():
+                    thread.join(0.5)
+                    if self.report_interval and time.monotonic() >= next_report:
+                        next_report = time.monotonic() + self.report_interval
+                        self._print('\n'.join(self.report()))
+        except KeyboardInterrupt:
+            self.stop()
+            for thread in threads:
+                thread.join()
+            raise
+        return self.results
+
+    def chain_progress(self):
+        """取得中のチェーンごとの (URL, ドメイン, 取得済み, 全体) """
+        with self._lock:
+            scrapers = list(self._scrapers.items())
+        return [(url, urlparse(url).netloc, scraper.progress, scraper.total) for url, scraper in scrapers]
+
+    def report(self):
+        """ドメインごとのスループットと、取得中のチェーンごとの完了見込み"""
+        chains = self.chain_progress()
+        remaining = {}
+        for _, domain, done, total in chains:
+            remaining[domain] = remaining.get(domain, 0) + max(0, total - done)
+        snapshot = self.scheduler.snapshot(remaining)
+        lines = [f"--- {len(self.results)}/{len(self.urls)} 件のURLが完了、取得中 {len(chains)} 件"]
+        lines += ['  ' + line for line in self.scheduler.format_report(remaining)]
+        for url, domain, done, total in chains:
+            rate = snapshot.get(domain, {}).get('pages_per_sec', 0)
+            left = max(0, total - done)
+            eta = f"約{left / rate:.0f}秒" if rate > 0 else '不明'
+            lines.append(f"  {url} {done}/{total} 完了見込み {eta}")
+        return lines
+
+    def stop(self):
+        """新しいURLの取得をやめ、実行中のスクレイピングをキャンセル"""
+        self._stopping.set()
+        self.queue.close()
+        with self._lock:
+            scrapers = list(self._scrapers.values())
+        for scraper in scrapers:
+            scraper.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='URLリストの一括スクレイピング（CSV / NDJSON に逐次出力）')
+    parser.add_argument('--input', default='-', help='URLリストのファイル（1行に1つ、- で標準入力）')
+    parser.add_argument('--output', required=True, help='出力ファイル（.csv または .ndjson）')
+    parser.add_argument('--format', choices=FORMATS, help='出力形式（省略時は拡張子から判定、.csv 以外は ndjson）')
+    parser.add_argument('--jobs', type=int, default=4, help='同時に取得するURLの数')
+    parser.add_argument('--per-host', type=int, default=1, help='同じホストのURLを同時に取得する数の上限')
+    parser.add_argument('--interval', type=float, help='1つのURL内での店舗ページ取得の間隔（秒、デフォルト1）')
+    parser.add_argument('--max-fetches', type=int, default=MAX_FETCHES, help='全チェーン合計の同時取得数の上限')
+    parser.add_argument('--fetch-workers', type=int, help='1つのチェーンで同時に店舗ページを取得する数（デフォルト: SCRAPER_FETCH_WORKERS）')
+    parser.add_argument('--weight', action='append', default=[], metavar='HOST=W',
+                        help='ドメインの重み（1回りで取得できるページ数、デフォルト1。複数指定可）')
+    parser.add_argument('--report-interval', type=float, default=30,
+                        help='ドメインごとのスループットと完了見込みを表示する間隔（秒、0 で表示しない）')
+    parser.add_argument('--state', help='進捗を保存するDB（デフォルト: <出力ファイル>.state.sqlite3）')
+    parser.add_argument('--resume', action='store_true', help='中断したバッチを再開（既存の出力ファイルに追記）')
+    args = parser.parse_args()
+
+    if args.input == '-':
+        urls = read_urls(sys.stdin)
+    else:
+        with open(args.input, encoding='utf-8') as f:
+            urls = read_urls(f)
+    if not urls:
+        parser.error('URLがありません')
+
+    scheduler = DomainScheduler(args.max_fetches)
+    for weight in args.weight:
+        host, _, value = weight.partition('=')
+        try:
+            scheduler.set_weight(host, float(value))
+        except ValueError:
+            parser.error(f"--weight は HOST=数値 の形式で指定してください: {weight}")
+
+    state_path = args.state or f"{args.output}.state.sqlite3"
+    if not args.resume and os.path.exists(state_path):
+        parser.error(f"状態DBが既に存在します（再開する場合は --resume）: {state_path}")
+    fmt = format_for(args.output, args.format)
+    try:
+        writer = RecordWriter(args.output, fmt, resume=args.resume)
+    except FileExistsError as e:
+        parser.error(str(e))
+    job_store = JobStore(state_path)
+    runner = BatchRunner(urls, writer, job_store, args.jobs, args.per_host, args.interval, args.resume,
+                         scheduler=scheduler, fetch_workers=args.fetch_workers, report_interval=args.report_interval)
+
+    start = time.perf_counter()
+    interrupted = False
+    try:
+        results = runner.run()
+    except KeyboardInterrupt:
+        interrupted = True
+        results = runner.results
+    finally:
+        writer.close()
+        job_store.close()
+
+    finished = {url: result for url, result in results.items() if not result.get('cancelled')}
+    failed = [url for url, result in finished.items() if not result.get('success')]
+    print(f"\n{len(finished)}/{len(urls)} 件のURLを処理、{writer.written} 件の店舗を出力"
+          f"（失敗 {len(failed)} 件、{time.perf_counter() - start:.1f}秒）: {args.output}", file=sys.stderr)
+    for line in scheduler.format_report():
+        print(f"  {line}", file=sys.stderr)
+    if interrupted:
+        print("中断しました。--resume を付けて同じコマンドを実行すると続きから再開します", file=sys.stderr)
+        sys.exit(130)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+抽出パイプラインのオフラインベンチマーク
+保存済みコーパス（benchmarks/corpus）を再生し、ステージごとの
+処理速度（pages/sec）、p50/p95/p99 レイテンシ、ピークメモリを計測する
+
+使い方:
+    python benchmarks/bench_extraction.py
+    python benchmarks/bench_extraction.py --repeat 20 --compare benchmarks/results/baseline.json --max-regression 15
+    python benchmarks/bench_extraction.py --regex-profile   # 正規表現ごとのコストも集計
+"""
+
+import argparse
+import contextlib
+import io
+import sys
+import time
+import tracemalloc
+
+from common import load_corpus, summarize_latencies, run_metadata, save_results, load_results, compare_stages
+
+from bs4 import BeautifulSoup
+from universal_scraper import UniversalStoreScraper
+from clinic_info_scraper import ClinicInfoScraper
+from regex_profile import RegexProfiler, profile_modules, format_report
+
+
+LEGACY_DOMAINS = ['dioclinic', 'eminal-clinic', 'frey-a', 'seishin-biyou', 'rizeclinic', 's-b-c.net', 'aoki-tsuyoshi.com']
+
+
+def parse(page):
+    return BeautifulSoup(page['content'], 'html.parser')
+
+
+def build_stages():
+    """ステージ名 -> (対象ページの条件, 計測する処理)
+
+    処理は (page, soup) を受け取る。parse 以外のステージは解析済みの soup を使い、解析時間を含めない
+    """
+    universal = UniversalStoreScraper()
+    clinic_scraper = ClinicInfoScraper()
+    return {
+        'parse': (
+            lambda page: True,
+            lambda page, soup: parse(page)
+        ),
+        'find_clinic_links': (
+            lambda page: page['kind'] == 'list',
+            lambda page, soup: clinic_scraper.find_clinic_links(soup, page['url'])
+        ),
+        'extract_store_info': (
+            lambda page: page['kind'] == 'detail',
+            lambda page, soup: universal.extract_store_info(soup, page['url'])
+        ),
+        'legacy_extract': (
+            lambda page: page['kind'] == 'detail' and any(domain in page['url'] for domain in LEGACY_DOMAINS),
+            lambda page, soup: clinic_scraper.extract_clinic_info_legacy(soup, page['url'])
+        ),
+    }
+
+
+def time_stage(pages, func, repeat):
+    """各ページの処理時間を repeat 回計測"""
+    samples = []
+    elapsed = 0.0
+    for _ in range(repeat):
+        for page in pages:
+            soup = parse(page)
+            start = time.perf_counter()
+            func(page, soup)
+            duration = time.perf_counter() - start
+            samples.append(duration)
+            elapsed += duration
+    return samples, elapsed
+
+
+def measure_memory(pages, func):
+    """tracemalloc でステージのピーク割り当て量を計測（時間計測とは別に1回だけ実行）"""
+    peak_per_page = []
+    tracemalloc.start()
+    try:
+        for page in pages:
+            soup = parse(page)
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+            func(page, soup)
+            _, peak = tracemalloc.get_traced_memory()
+            peak_per_page.append(peak - baseline)
+            del soup
+    finally:
+        tracemalloc.stop()
+    return {
+        'peak_kb': round(max(peak_per_page) / 1024, 1) if peak_per_page else 0.0,
+        'mean_peak_kb': round(sum(peak_per_page) / len(peak_per_page) / 1024, 1) if peak_per_page else 0.0
+    }
+
+
+def profile_regex(pages, func, profiler):
+    """正規表現ごとのコストを集計（計測のオーバーヘッドがあるため時間計測とは別に1回だけ実行）"""
+    for page in pages:
+        soup = parse(page)
+        with profile_modules(profiler):
+            func(page, soup)
+
+
+def run(repeat=10, warmup=1, stage_names=None, chain=None, memory=True, regex_profile=False):
+    corpus = load_corpus(chain=chain)
+    stages = build_stages()
+    results = {
+        'meta': run_metadata(repeat=repeat, corpus_pages=len(corpus), chain=chain),
+        'stages': {}
+    }
+    profiler = RegexProfiler() if regex_profile else None
+
+    # 抽出処理の標準出力は計測結果に含めない
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name, (selector, func) in stages.items():
+            if stage_names and name not in stage_names:
+                continue
+            pages = [page for page in corpus if selector(page)]
+            if not pages:
+                continue
+            time_stage(pages, func, warmup)
+            samples, elapsed = time_stage(pages, func, repeat)
+            stats = summarize_latencies(samples, elapsed)
+            stats['pages'] = len(pages)
+            if memory:
+                stats.update(measure_memory(pages, func))
+            if profiler:
+                profile_regex(pages, func, profiler)
+            results['stages'][name] = stats
+    if profiler:
+        results['regex_profile'] = profiler.report()
+    return results
+
+
+def print_results(results):
+    print(f"\n{'stage':<24}{'pages':>6}{'pages/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak KB':>10}")
+    for name, stats in results['stages'].items():
+        print(f"{name:<24}{stats['pages']:>6}{stats['pages_per_sec']:>10.1f}{stats['p50_ms']:>10.2f}"
+              f"{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats.get('peak_kb', 0):>10.1f}")
+    if 'regex_profile' in results:
+        print(f"\n{format_report(results['regex_profile'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='抽出パイプラインのオフラインベンチマーク')
+    parser.add_argument('--repeat', type=int, default=10, help='各ページの計測回数')
+    parser.add_argument('--warmup', type=int, default=1, help='計測前のウォームアップ回数')
+    parser.add_argument('--stage', action='append', help='計測するステージ（複数指定可）')
+    parser.add_argument('--chain', help='特定のチェーンのページのみ計測')
+    parser.add_argument('--no-memory', action='store_true', help='ピークメモリの計測を省略')
+    parser.add_argument('--regex-profile', action='store_true', help='正規表現ごとの呼び出し回数・時間・マッチ数も集計')
+    parser.add_argument('--output', help='結果JSONの保存先（デフォルト: benchmarks/results/）')
+    parser.add_argument('--compare', help='比較対象の結果JSON')
+    parser.add_argument('--max-regression', type=float, help='比較時に許容する悪化率（%%）。超えた場合は終了コード1')
+    args = parser.parse_args()
+
+    results = run(args.repeat, args.warmup, args.stage, args.chain, not args.no_memory, args.regex_profile)
+    print_results(results)
+    path = save_results(results, args.output, prefix='extraction')
+    print(f"\n結果を保存しました: {path}")
+
+    if args.compare:
+        regressions = compare_stages(load_results(args.compare), results, args.max_regression)
+        if regressions:
+            print(f"\n性能が悪化したステージ: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+api/app.py のコールドスタート計測
+毎回新しいPythonプロセスで api/app.py を読み込み、プロセス起動から
+import 完了・最初の GET /・最初の店舗ページの抽出までの時間を計測する。
+SCRAPER_LAZY_IMPORTS=1（遅延読み込み、デフォルト）と 0（起動時にすべて読み込む）を比較できる
+
+--importtime を指定すると `python -X importtime` の結果から、api/app.py が直接読み込む
+モジュールを累積時間の順に表示する
+
+使い方:
+    python benchmarks/cold_start.py --runs 10 --importtime 15
+    python benchmarks/cold_start.py --compare benchmarks/results/cold_start_20250101_120000.json --max-regression 20
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from common import CORPUS_DIR, REPO_ROOT, compare_stages, load_corpus, load_results, run_metadata, save_results, summarize_latencies
+
+
+API_DIR = os.path.join(REPO_ROOT, 'api')
+
+# 子プロセスで実行する計測（api/ をカレントディレクトリにして Vercel と同じ import 解決にする）
+CHILD_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.app.test_client().get('/')
+indexed = time.perf_counter()
+from page_limits import parsed_page
+with open(sys.argv[1], 'rb') as f:
+    content = f.read()
+with parsed_page(content, sys.argv[2]) as soup:
+    app.extract_clinic_info(soup, sys.argv[2])
+extracted = time.perf_counter()
+print(json.dumps({'import': imported - start, 'first_index': indexed - imported, 'first_extract': extracted - indexed}))
+'''
+
+MODES = {'lazy': '1', 'eager': '0'}
+
+DEFAULT_PAGE = 'unknown-dental-shinjuku'
+
+
+def find_page(page_id):
+    for entry in load_corpus(kind='detail'):
+        if entry['id'] == page_id:
+            return os.path.join(CORPUS_DIR, entry['file']), entry['url']
+    raise SystemExit(f"コーパスにページがありません: {page_id}")
+
+
+def run_child(mode, page_path, page_url, importtime=False):
+    """子プロセスを1回実行し、(区間ごとの秒数, 標準エラー出力) を返す"""
+    env = {**os.environ, 'SCRAPER_LAZY_IMPORTS': MODES[mode], 'SCRAPER_LOG_LEVEL': 'WARNING'}
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', CHILD_SCRIPT, page_path, page_url]
+    start = time.perf_counter()
+    completed = subprocess.run(command, cwd=API_DIR, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(f"子プロセスが失敗しました（{mode}）:\n{completed.stderr[-2000:]}")
+    timings = json.loads(completed.stdout.strip().splitlines()[-1])
+    timings['process'] = elapsed
+    return timings, completed.stderr
+
+
+def parse_importtime(stderr, module='app'):
+    """-X importtime の出力から module の合計時間と直接読み込むモジュールの一覧を取り出す（マイクロ秒）"""
+    total = None
+    children = []
+    pending = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        # "import time:  self | cumulative |   name"（名前の字下げが読み込みの深さ）
+        head, cumulative_us, name = line.split('|')
+        self_us = head.split(':', 1)[1]
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        name = name.strip()
+        if depth == 1:
+            pending.append({'module': name, 'self_us': int(self_us), 'cumulative_us': int(cumulative_us)})
+        elif depth == 0:
+            if name == module:
+                total = int(cumulative_us)
+                children = pending
+            pending = []
+    children.sort(key=lambda child: child['cumulative_us'], reverse=True)
+    return total, children
+
+
+def run(runs=5, modes=('lazy', 'eager'), page_id=DEFAULT_PAGE, importtime_top=0):
+    page_path, page_url = find_page(page_id)
+    results = {'meta': run_metadata(runs=runs, page=page_id), 'stages': {}, 'importtime': {}}
+    for mode in modes:
+        samples = {}
+        for _ in range(runs):
+            timings, _ = run_child(mode, page_path, page_url)
+            for phase, seconds in timings.items():
+                samples.setdefault(phase, []).append(seconds)
+        for phase in ('process', 'import', 'first_index', 'first_extract'):
+            results['stages'][f"{mode}:{phase}"] = summarize_latencies(samples[phase])
+        if importtime_top:
+            _, stderr = run_child(mode, page_path, page_url, importtime=True)
+            total, children = parse_importtime(stderr)
+            results['importtime'][mode] = {'app_us': total, 'children': children[:importtime_top]}
+    return results
+
+
+def print_results(results):
+    print(f"{'stage':<24}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}")
+    for stage, stats in results['stages'].items():
+        print(f"{stage:<24}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['mean_ms']:>10.1f}")
+    for mode, entry in results['importtime'].items():
+        print(f"\n[-X importtime: {mode}] import app 合計 {entry['app_us'] / 1000:.1f}ms")
+        print(f"{'module':<32}{'cumulative ms':>15}{'self ms':>10}")
+        for child in entry['children']:
+            print(f"{child['module']:<32}{child['cumulative_us'] / 1000:>15.1f}{child['self_us'] / 1000:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='api/app.py のコールドスタート計測')
+    parser.add_argument('--runs', type=int, default=5, help='モードごとのプロセス起動回数')
+    parser.add_argument('--mode', action='append', choices=list(MODES),
+                        help='lazy: 遅延読み込み / eager: 起動時にすべて読み込む（複数指定可、デフォルトは両方）')
+    parser.add_argument('--page', default=DEFAULT_PAGE, help='最初の抽出に使うコーパスの店舗ページID')
+    parser.add_argument('--importtime', type=int, default=0, metavar='N',
+                        help='-X importtime で api/app.py が直接読み込むモジュールの上位N件を表示')
+    parser.add_argument('--output', help='結果JSONの保存先（デフォルト: benchmarks/results/）')
+    parser.add_argument('--compare', help='比較対象の結果JSON（前回の cold_start.py の結果）')
+    parser.add_argument('--max-regression', type=float,
+                        help='比較時に許容する悪化率（%%）。超えた場合は終了コード1')
+    args = parser.parse_args()
+
+    results = run(args.runs, args.mode or list(MODES), args.page, args.importtime)
+    print_results(results)
+    path = save_results(results, args.output, prefix='cold_start')
+    print(f"\n結果を保存しました: {path}")
+
+    if args.compare:
+        regressions = compare_stages(load_results(args.compare), results, args.max_regression)
+        if regressions:
+            print(f"\n悪化した区間: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+ベンチマーク共通処理
+コーパスの読み込み、レイテンシの集計、結果JSONの保存と比較
+"""
+
+import importlib.util
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+CORPUS_DIR = os.path.join(BENCH_DIR, 'corpus')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+# リポジトリ直下のモジュール（clinic_info_scraper など）を import できるようにする
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+
+def load_corpus(corpus_dir=CORPUS_DIR, kind=None, chain=None):
+    """manifest.json に登録されたページを読み込む
+
+    各ページは manifest のエントリに生のバイト列 'content' を加えた辞書
+    """
+    with open(os.path.join(corpus_dir, 'manifest.json'), encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    pages = []
+    for entry in manifest['pages']:
+        if kind and entry['kind'] != kind:
+            continue
+        if chain and entry['chain'] != chain:
+            continue
+        with open(os.path.join(corpus_dir, entry['file']), 'rb') as f:
+            pages.append({**entry, 'content': f.read()})
+    return pages
+
+
+def load_api_app():
+    """api/app.py を（ルートの app.py と区別して）読み込む"""
+    path = os.path.join(REPO_ROOT, 'api', 'app.py')
+    spec = importlib.util.spec_from_file_location('api_app', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def percentile(samples, pct):
+    """最近傍法によるパーセンタイル（samples はソート不要）"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def summarize_latencies(samples, elapsed=None):
+    """秒単位のレイテンシ一覧を集計（ミリ秒で返す）"""
+    elapsed = sum(samples) if elapsed is None else elapsed
+    return {
+        'count': len(samples),
+        'pages_per_sec': round(len(samples) / elapsed, 2) if elapsed > 0 else 0.0,
+        'mean_ms': round(sum(samples) / len(samples) * 1000, 3) if samples else 0.0,
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+        'max_ms': round(max(samples) * 1000, 3) if samples else 0.0
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_metadata(**extra):
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        **extra
+    }
+
+
+def save_results(results, output=None, prefix='bench'):
+    """結果をJSONで保存してパスを返す"""
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        output = os.path.join(RESULTS_DIR, f"{prefix}_{timestamp}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    return output
+
+
+def load_results(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare_stages(baseline, current, max_regression=None):
+    """ステージごとの p50 / p95 / pages_per_sec を比較して表示
+
+    max_regression（%）を超えて悪化したステージ名のリストを返す
+    """
+    regressions = []
+    print(f"\n{'stage':<24}{'metric':<16}{'baseline':>12}{'current':>12}{'delta':>10}")
+    for stage, stats in current['stages'].items():
+        base = baseline.get('stages', {}).get(stage)
+        if not base:
+            print(f"{stage:<24}{'(new stage)':<16}")
+            continue
+        for metric, higher_is_better in (('pages_per_sec', True), ('p50_ms', False), ('p95_ms', False)):
+            old, new = base.get(metric, 0), stats.get(metric, 0)
+            delta = ((new - old) / old * 100) if old else 0.0
+            print(f"{stage:<24}{metric:<16}{old:>12.3f}{new:>12.3f}{delta:>+9.1f}%")
+            worse = -delta if higher_is_better else delta
+            if max_regression is not None and worse > max_regression and stage not in regressions:
+                regressions.append(stage)
+    return regressions
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+抽出精度と処理時間の回帰チェック
+コーパスの各ページについて、golden.json の期待値（人手で確認した正解）と抽出結果を項目ごとに比較し、
+前回の結果と並べて精度の変化と処理時間の変化を表示する
+
+使い方:
+    python benchmarks/golden_check.py
+    python benchmarks/golden_check.py --compare benchmarks/results/golden_20250101_120000.json --max-regression 15
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import unicodedata
+
+from common import BENCH_DIR, load_corpus, load_api_app, percentile, run_metadata, save_results, load_results
+
+from bs4 import BeautifulSoup
+from clinic_info_scraper import ClinicInfoScraper
+
+
+GOLDEN_PATH = os.path.join(BENCH_DIR, 'golden.json')
+
+FIELDS = ['name', 'address', 'access', 'phone', 'hours']
+
+
+def load_golden(path=GOLDEN_PATH):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def normalize(value):
+    """表記ゆれ（全角・半角、空白、先頭の〒）を除いて比較する"""
+    value = unicodedata.normalize('NFKC', value or '')
+    value = ''.join(value.split())
+    return value[1:] if value.startswith('〒') else value
+
+
+def build_targets():
+    """比較対象 -> (店舗情報の抽出, 店舗リンクの抽出)"""
+    scraper = ClinicInfoScraper()
+    api_app = load_api_app()
+    return {
+        'scraper': (scraper.extract_clinic_info, scraper.find_clinic_links),
+        'api': (api_app.extract_clinic_info, api_app.find_clinic_links),
+    }
+
+
+def time_call(page, func, repeat):
+    """解析を除いた処理時間の中央値（ミリ秒）と最後の結果"""
+    samples = []
+    result = None
+    for _ in range(repeat):
+        soup = BeautifulSoup(page['content'], 'html.parser')
+        start = time.perf_counter()
+        result = func(soup, page['url'])
+        samples.append(time.perf_counter() - start)
+    return round(percentile(samples, 50) * 1000, 3), result
+
+
+def check_record(expected, actual):
+    """期待値のある項目ごとの一致"""
+    return {field: normalize(expected[field]) == normalize(actual.get(field, '')) for field in FIELDS if field in expected}
+
+
+def check_links(expected, actual):
+    found = {link['url'] for link in actual}
+    expected = set(expected)
+    return {
+        'missing': sorted(expected - found),
+        'unexpected': sorted(found - expected)
+    }
+
+
+def run(golden, repeat=5, target_names=None, chain=None):
+    corpus = load_corpus(chain=chain)
+    results = {'meta': run_metadata(repeat=repeat, corpus_pages=len(corpus), chain=chain), 'targets': {}}
+
+    # 抽出処理の標準出力は結果に含めない
+    with contextlib.redirect_stdout(io.StringIO()):
+        targets = build_targets()
+        for name, (extract, find_links) in targets.items():
+            if target_names and name not in target_names:
+                continue
+            pages = {}
+            for page in corpus:
+                if page['id'] in golden['records']:
+                    ms, actual = time_call(page, extract, repeat)
+                    pages[page['id']] = {
+                        'ms': ms,
+                        'fields': check_record(golden['records'][page['id']], actual),
+                        'actual': {field: actual.get(field, '') for field in FIELDS}
+                    }
+                elif page['id'] in golden['links']:
+                    ms, actual = time_call(page, find_links, repeat)
+                    links = check_links(golden['links'][page['id']], actual)
+                    pages[page['id']] = {'ms': ms, 'fields': {'links': not links['missing'] and not links['unexpected']},
+                                         'links': links}
+            results['targets'][name] = {'pages': pages, 'accuracy': summarize_accuracy(pages)}
+    return results
+
+
+def summarize_accuracy(pages):
+    """項目ごとの正解数 / 期待値のある件数"""
+    totals = {}
+    for page in pages.values():
+        for field, ok in page['fields'].items():
+            correct, total = totals.get(field, (0, 0))
+            totals[field] = (correct + ok, total + 1)
+    return {field: {'correct': correct, 'total': total} for field, (correct, total) in totals.items()}
+
+
+def field_regressions(baseline, current):
+    """前回は正解で今回は不正解になった（ページ, 項目）"""
+    regressions = []
+    for target, result in current['targets'].items():
+        base_pages = baseline.get('targets', {}).get(target, {}).get('pages', {})
+        for page_id, page in result['pages'].items():
+            base_fields = base_pages.get(page_id, {}).get('fields', {})
+            for field, ok in page['fields'].items():
+                if base_fields.get(field) and not ok:
+                    regressions.append(f"{target}:{page_id}:{field}")
+    return regressions
+
+
+def timing_regressions(baseline, current, max_regression):
+    """対象ごとの合計処理時間が max_regression %を超えて悪化したもの"""
+    regressions = []
+    for target, result in current['targets'].items():
+        base_pages = baseline.get('targets', {}).get(target, {}).get('pages', {})
+        shared = [page_id for page_id in result['pages'] if page_id in base_pages]
+        base_total = sum(base_pages[page_id]['ms'] for page_id in shared)
+        total = sum(result['pages'][page_id]['ms'] for page_id in shared)
+        if base_total and (total - base_total) / base_total * 100 > max_regression:
+            regressions.append(target)
+    return regressions
+
+
+def print_results(golden, results, baseline=None):
+    for target, result in results['targets'].items():
+        base_pages = (baseline or {}).get('targets', {}).get(target, {}).get('pages', {})
+        print(f"\n[{target}]")
+        print(f"{'page':<30}{'fields':<48}{'base ms':>10}{'now ms':>10}{'delta':>9}")
+        for page_id, page in result['pages'].items():
+            marks = ' '.join(f"{field}:{'ok' if ok else 'NG'}" for field, ok in page['fields'].items())
+            base = base_pages.get(page_id)
+            if base:
+                delta = (page['ms'] - base['ms']) / base['ms'] * 100 if base['ms'] else 0.0
+                print(f"{page_id:<30}{marks:<48}{base['ms']:>10.2f}{page['ms']:>10.2f}{delta:>8.1f}%")
+            else:
+                print(f"{page_id:<30}{marks:<48}{'-':>10}{page['ms']:>10.2f}{'-':>9}")
+            for field, ok in page['fields'].items():
+                if ok:
+                    continue
+                if field == 'links':
+                    print(f"    links: 不足 {page['links']['missing']} / 余分 {page['links']['unexpected']}")
+                else:
+                    print(f"    {field}: 期待値 {golden['records'][page_id][field]!r} / 結果 {page['actual'][field]!r}")
+
+        base_accuracy = (baseline or {}).get('targets', {}).get(target, {}).get('accuracy', {})
+        summary = []
+        for field, counts in result['accuracy'].items():
+            text = f"{field} {counts['correct']}/{counts['total']}"
+            if field in base_accuracy:
+                text += f"（前回 {base_accuracy[field]['correct']}/{base_accuracy[field]['total']}）"
+            summary.append(text)
+        print(f"精度: {', '.join(summary)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='抽出精度と処理時間の回帰チェック')
+    parser.add_argument('--repeat', type=int, default=5, help='各ページの計測回数（中央値を使用）')
+    parser.add_argument('--target', action='append', choices=['scraper', 'api'],
+                        help='scraper: ClinicInfoScraper / api: api/app.py（複数指定可、デフォルトは両方）')
+    parser.add_argument('--chain', help='特定のチェーンのページのみ確認')
+    parser.add_argument('--golden', default=GOLDEN_PATH, help='期待値のJSON')
+    parser.add_argument('--output', help='結果JSONの保存先（デフォルト: benchmarks/results/）')
+    parser.add_argument('--compare', help='比較対象の結果JSON（前回の golden_check.py の結果）')
+    parser.add_argument('--max-regression', type=float,
+                        help='比較時に許容する処理時間の悪化率（%%）。超えた場合は終了コード1')
+    args = parser.parse_args()
+
+    golden = load_golden(args.golden)
+    results = run(golden, args.repeat, args.target, args.chain)
+    baseline = load_results(args.compare) if args.compare else None
+    print_results(golden, results, baseline)
+    path = save_results(results, args.output, prefix='golden')
+    print(f"\n結果を保存しました: {path}")
+
+    if baseline:
+        failed = False
+        regressions = field_regressions(baseline, results)
+        if regressions:
+            print(f"\n精度が低下した項目: {', '.join(regressions)}")
+            failed = True
+        if args.max_regression is not None:
+            slower = timing_regressions(baseline, results, args.max_regression)
+            if slower:
+                print(f"\n処理時間が悪化した対象: {', '.join(slower)}")
+                failed = True
+        if failed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
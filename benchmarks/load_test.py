@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+エンドツーエンドの負荷試験
+スタブ・チェーンサイト（stub_site.py）に対して scrape_clinics または api/app.py の scrape() を
+同時に複数実行し、stores/sec、店舗ごとのレイテンシ（p50/p95/p99）、ジョブ所要時間を計測する。
+一覧ページの取得・解析は店舗ごとのレイテンシに含めず、一覧ページの所要時間として別に集計する
+
+使い方:
+    python benchmarks/load_test.py --target scraper --jobs 4 --branches 100 --latency 30 --jitter 20
+    python benchmarks/load_test.py --target api --jobs 8 --branches 50 --error-rate 0.05
+    python benchmarks/load_test.py --target scraper --url http://127.0.0.1:8900/clinic/   # 起動済みのスタブを使用
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import threading
+import time
+
+from common import load_api_app, summarize_latencies, run_metadata, save_results
+from stub_site import StubChainSite, add_stub_arguments, config_from_args
+
+from clinic_info_scraper import ClinicInfoScraper
+from parse_pool import parse_pool
+
+
+class TimedScraper(ClinicInfoScraper):
+    """一覧ページの解析が終わった時刻と、店舗ページから店舗情報が1件抽出されるごとの時刻を記録する"""
+
+    def __init__(self):
+        super().__init__()
+        self.request_interval = 0
+        self.list_time = None
+        self.record_times = []
+
+    def process_page(self, content, url, kind, job_key, link_name=""):
+        # 子プロセスで抽出する場合も結果を受け取った時点を記録する
+        page = super().process_page(content, url, kind, job_key, link_name)
+        if kind == 'list':
+            self.list_time = time.perf_counter()
+        else:
+            self.record_times.append(time.perf_counter())
+        return page
+
+
+def run_scraper_job(url, interval):
+    scraper = TimedScraper()
+    scraper.request_interval = interval
+    start = time.perf_counter()
+    scraper.scrape_clinics(url)
+    return start, scraper.list_time, scraper.record_times, len(scraper.clinic_data)
+
+
+def run_api_job(client, url):
+    """NDJSONストリーミングで1行受信するごとに時刻を記録する
+
+    応答はストリーミング開始前に一覧ページを取得・解析してから返るため、応答を受け取った時点を一覧ページの時刻とする
+    """
+    start = time.perf_counter()
+    record_times = []
+    stores = 0
+    response = client.post('/api/scrape', json={'url': url, 'format': 'ndjson'}, buffered=False)
+    list_time = time.perf_counter()
+    for line in response.response:
+        for row in line.decode('utf-8').splitlines():
+            if row and json.loads(row).get('type') == 'store':
+                record_times.append(time.perf_counter())
+                stores += 1
+    response.close()
+    return start, list_time, record_times, stores
+
+
+def run_load(url, target, jobs, interval=0):
+    results = [None] * jobs
+    client = load_api_app().app.test_client() if target == 'api' else None
+
+    def worker(index):
+        if target == 'api':
+            results[index] = run_api_job(client, url)
+        else:
+            results[index] = run_scraper_job(url, interval)
+
+    start = time.perf_counter()
+    # 抽出処理の標準出力は計測結果に含めない
+    with contextlib.redirect_stdout(io.StringIO()):
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(jobs)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - start
+
+    store_latencies = []
+    list_durations = []
+    job_durations = []
+    total_stores = 0
+    for job_start, list_time, record_times, stores in results:
+        previous = job_start
+        if list_time is not None:
+            list_durations.append(list_time - job_start)
+            previous = list_time
+        for recorded in record_times:
+            store_latencies.append(recorded - previous)
+            previous = recorded
+        job_durations.append((record_times[-1] if record_times else time.perf_counter()) - job_start)
+        total_stores += stores
+
+    store_stats = summarize_latencies(store_latencies, elapsed)
+    return {
+        'elapsed_sec': round(elapsed, 3),
+        'jobs': jobs,
+        'stores': total_stores,
+        'stores_per_sec': round(total_stores / elapsed, 2) if elapsed > 0 else 0.0,
+        'store_latency': {key: value for key, value in store_stats.items() if key.endswith('_ms')},
+        'list_page': {key: value for key, value in summarize_latencies(list_durations).items() if key.endswith('_ms')},
+        'job_duration': {key: value for key, value in summarize_latencies(job_durations).items() if key.endswith('_ms')}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='スタブサイトに対するエンドツーエンドの負荷試験')
+    parser.add_argument('--target', choices=['scraper', 'api'], default='scraper',
+                        help='scraper: ClinicInfoScraper.scrape_clinics / api: api/app.py の /api/scrape（NDJSON）')
+    parser.add_argument('--jobs', type=int, default=1, help='同時に実行するクロール数')
+    parser.add_argument('--interval', type=float, default=0, help='scrape_clinics の店舗ページ取得間隔（秒）')
+    parser.add_argument('--parse-processes', type=int,
+                        help='scrape_clinics の解析・抽出に使う子プロセス数（省略時は SCRAPER_PARSE_PROCESSES、0 でスレッド内）')
+    parser.add_argument('--url', help='起動済みのスタブサイトの一覧ページURL（省略時は内部で起動）')
+    parser.add_argument('--output', help='結果JSONの保存先（デフォルト: benchmarks/results/）')
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    if args.parse_processes is not None:
+        parse_pool.resize(args.parse_processes)
+
+    server = None
+    url = args.url
+    if not url:
+        server = StubChainSite(config_from_args(args)).start()
+        url = server.list_url
+
+    try:
+        results = run_load(url, args.target, args.jobs, args.interval)
+    finally:
+        parse_pool.shutdown()
+        if server:
+            results_stub = server.stats()
+            server.stop()
+        else:
+            results_stub = None
+
+    results['meta'] = run_metadata(target=args.target, url=url, parse_processes=parse_pool.processes,
+                                   branches=args.branches, layout=args.layout,
+                                   latency_ms=args.latency, jitter_ms=args.jitter, error_rate=args.error_rate,
+                                   slow_body_rate=args.slow_body_rate)
+    results['stub_stats'] = results_stub
+
+    print(f"\n対象: {args.target}  ジョブ数: {args.jobs}  所要時間: {results['elapsed_sec']}秒")
+    print(f"取得店舗数: {results['stores']}  stores/sec: {results['stores_per_sec']}")
+    latency = results['store_latency']
+    print(f"店舗ごとのレイテンシ  p50: {latency['p50_ms']:.1f}ms  p95: {latency['p95_ms']:.1f}ms  "
+          f"p99: {latency['p99_ms']:.1f}ms  max: {latency['max_ms']:.1f}ms")
+    list_page = results['list_page']
+    print(f"一覧ページ            p50: {list_page['p50_ms']:.1f}ms  p95: {list_page['p95_ms']:.1f}ms  "
+          f"max: {list_page['max_ms']:.1f}ms")
+    duration = results['job_duration']
+    print(f"ジョブ所要時間        p50: {duration['p50_ms']:.0f}ms  p95: {duration['p95_ms']:.0f}ms  max: {duration['max_ms']:.0f}ms")
+    if results_stub:
+        print(f"スタブサイト: {results_stub}")
+
+    path = save_results(results, args.output, prefix=f'load_{args.target}')
+    print(f"\n結果を保存しました: {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+ベンチマーク用コーパスの記録
+店舗一覧ページと、そこから見つかった店舗ページを取得して benchmarks/corpus に保存し、
+manifest.json に登録する（同じURLのエントリは上書き）
+
+使い方:
+    python benchmarks/record_corpus.py https://dioclinic.jp/clinic/ --chain dioclinic --details 5
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+from urllib.parse import urlparse
+
+from common import CORPUS_DIR
+
+import requests
+from bs4 import BeautifulSoup
+from clinic_info_scraper import ClinicInfoScraper
+
+
+def slugify(url):
+    path = urlparse(url).path.strip('/') or 'index'
+    return re.sub(r'[^A-Za-z0-9_-]+', '_', path)[:80]
+
+
+def load_manifest():
+    path = os.path.join(CORPUS_DIR, 'manifest.json')
+    if not os.path.exists(path):
+        return {'pages': []}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest):
+    with open(os.path.join(CORPUS_DIR, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+
+
+def record_page(manifest, scraper, url, chain, kind):
+    """ページを取得して保存し、レスポンスを返す"""
+    response = requests.get(url, headers=scraper.headers, timeout=10)
+    response.raise_for_status()
+
+    filename = f"{kind}_{slugify(url)}.html"
+    os.makedirs(os.path.join(CORPUS_DIR, chain), exist_ok=True)
+    with open(os.path.join(CORPUS_DIR, chain, filename), 'wb') as f:
+        f.write(response.content)
+
+    entry = {
+        'id': f"{chain}-{kind}-{slugify(url)}",
+        'file': f"{chain}/{filename}",
+        'url': url,
+        'kind': kind,
+        'chain': chain,
+        'source': 'recorded',
+        'content_type': response.headers.get('Content-Type', ''),
+        'recorded_at': time.strftime('%Y-%m-%d')
+    }
+    manifest['pages'] = [page for page in manifest['pages'] if page['url'] != url] + [entry]
+    print(f"保存しました: {entry['file']} ({len(response.content)} bytes)")
+    return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ベンチマーク用コーパスの記録')
+    parser.add_argument('url', help='店舗一覧ページまたは店舗ページのURL')
+    parser.add_argument('--chain', help='チェーン名（デフォルト: ドメイン名）')
+    parser.add_argument('--details', type=int, default=3, help='記録する店舗ページ数')
+    parser.add_argument('--interval', type=float, default=1.0, help='ページ取得の間隔（秒）')
+    args = parser.parse_args()
+
+    chain = args.chain or urlparse(args.url).netloc
+    scraper = ClinicInfoScraper()
+    manifest = load_manifest()
+
+    response = record_page(manifest, scraper, args.url, chain, 'list')
+    links = scraper.find_clinic_links(BeautifulSoup(response.content, 'html.parser'), args.url)
+    if len(links) <= 3:
+        # 一覧ページでなければ個別店舗ページとして登録し直す
+        manifest['pages'][-1]['kind'] = 'detail'
+        links = []
+
+    for link in links[:args.details]:
+        time.sleep(args.interval)
+        try:
+            record_page(manifest, scraper, link['url'], chain, 'detail')
+        except requests.exceptions.RequestException as e:
+            print(f"取得エラー: {link['url']} - {str(e)}")
+
+    save_manifest(manifest)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+抽出処理の最悪ケース計測用の敵対的なページ
+改行のない数MBのテキスト、1万段のdivの入れ子、数千のテーブル、巨大なインラインスクリプト、
+住所・電話番号の正規表現に一致しかける文字列の繰り返しなどを生成する
+
+scale で大きさを調整する（1 で数MB程度）。ページは決定的に生成されるため保存しない
+
+使い方:
+    python benchmarks/stress_pages.py --write /tmp/stress   # 確認用にファイルへ書き出す
+"""
+
+import argparse
+import os
+
+
+def page(body, head=''):
+    return f'<!DOCTYPE html><html lang="ja"><head><meta charset="utf-8"><title>ストレステスト</title>{head}</head><body>{body}</body></html>'
+
+
+def single_line_text(scale=1):
+    """改行のない巨大なテキスト（住所・建物名らしい語を含む）"""
+    sentence = '東京都新宿区のクリニックビルのご案内です。大阪府大阪市北区の梅田センター館では施術を行っています。'
+    return page(f'<h1>店舗のご案内</h1><p>{sentence * int(40000 * scale)}</p>')
+
+
+def nested_divs(scale=1):
+    """1万段のdivの入れ子"""
+    depth = int(10000 * scale)
+    return page('<div class="wrap">' * depth + '<p>〒160-0022 東京都新宿区新宿3-1-1 新宿ビル5F</p>' + '</div>' * depth)
+
+
+def many_tables(scale=1):
+    """数千のテーブル（見出しはすべて住所・アクセスらしい）"""
+    table = ('<table class="info"><tr><th>住所</th><td>東京都新宿区新宿{i}丁目</td></tr>'
+             '<tr><th>アクセス</th><td>新宿駅から徒歩{i}分</td></tr>'
+             '<tr><th>電話番号</th><td>03-0000-{i:04d}</td></tr>'
+             '<tr><th>営業時間</th><td>10:00〜19:00</td></tr></table>\n')
+    return page(''.join(table.format(i=i % 10000) for i in range(int(3000 * scale))))
+
+
+def huge_inline_script(scale=1):
+    """数MBのインラインスクリプト（住所・電話番号らしい文字列を含む）"""
+    line = 'var shop_{i}={{"address":"東京都新宿区新宿3-1-{i}","tel":"03-1234-{i:04d}","open":"10:00-19:00"}};'
+    script = ''.join(line.format(i=i % 10000) for i in range(int(40000 * scale)))
+    return page(f'<h1>店舗のご案内</h1><p>〒160-0022 東京都新宿区新宿3-1-1</p>', head=f'<script>{script}</script>')
+
+
+def address_near_miss(scale=1):
+    """住所の正規表現に一致しかけて失敗する行の繰り返し（番地・階数がない、郵便番号の桁不足など）"""
+    lines = [
+        '〒160-002 東京都新宿区新宿',
+        '東京都新宿区新宿の新宿ビルディング',
+        '大阪府大阪市北区梅田の梅田センタービル地下',
+        '北海道札幌市中央区北五条西 札幌館',
+        '神奈川県横浜市西区 横浜タワー 上層階',
+    ]
+    return page('<div class="access">' + '\n'.join(f'<p>{lines[i % len(lines)]}</p>' for i in range(int(20000 * scale))) + '</div>')
+
+
+def phone_near_miss(scale=1):
+    """電話番号の正規表現に一致しかける数字列（桁不足のハイフン区切り、長い数字の連続）"""
+    chunks = ['TEL: 03-12-', '電話 0120-', '☎ ' + '0' * 9, '12345678901234567890', '03－1234－', '(03)1234-']
+    return page('<p>' + ' '.join(chunks[i % len(chunks)] for i in range(int(50000 * scale))) + '</p>')
+
+
+def many_links(scale=1):
+    """店舗リンクらしいURLが大量にある一覧ページ"""
+    anchors = ''.join(f'<li><a href="/clinic/branch{i}/">クリニック{i}院</a></li>\n' for i in range(int(20000 * scale)))
+    return page(f'<ul class="clinic-list">{anchors}</ul>')
+
+
+CASES = {
+    'single_line_text': single_line_text,
+    'nested_divs': nested_divs,
+    'many_tables': many_tables,
+    'huge_inline_script': huge_inline_script,
+    'address_near_miss': address_near_miss,
+    'phone_near_miss': phone_near_miss,
+    'many_links': many_links,
+}
+
+
+def generate(case, scale=1):
+    return CASES[case](scale)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='最悪ケース計測用の敵対的なページの生成')
+    parser.add_argument('--write', required=True, help='書き出し先のディレクトリ')
+    parser.add_argument('--scale', type=float, default=1.0, help='ページの大きさの倍率')
+    args = parser.parse_args()
+
+    os.makedirs(args.write, exist_ok=True)
+    for case in CASES:
+        html = generate(case, args.scale)
+        path = os.path.join(args.write, f"{case}.html")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(html)
+        print(f"{path}: {len(html.encode('utf-8'))} bytes")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+敵対的なページに対する抽出処理の最悪ケース計測
+stress_pages.py のページごとに find_clinic_links と extract_store_info を別プロセスで実行し、
+処理時間とピークメモリ（RSS）を計測して、レイテンシのSLOを超えたものを報告する
+
+正規表現のバックトラックは中断できないため、各計測は --timeout 秒で打ち切る。
+page_limits の上限で解析前に除外されるページは、--ignore-caps を指定しない限りSLOの対象外とする
+
+使い方:
+    python benchmarks/stress_test.py --slo-ms 2000
+    python benchmarks/stress_test.py --case single_line_text --scale 0.01 --timeout 30
+"""
+
+import argparse
+import contextlib
+import io
+import multiprocessing
+import resource
+import sys
+import time
+
+from common import run_metadata, save_results
+from stress_pages import CASES, generate
+
+from page_limits import PageTooLarge, check_page, estimate_nodes
+
+
+FUNCTIONS = ['find_clinic_links', 'extract_store_info']
+
+STRESS_URL = 'https://stress.example.jp/clinic/'
+
+
+def _peak_rss_mb():
+    # Linux の ru_maxrss はKB単位
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _measure(case, scale, function, conn):
+    """子プロセスで1ページを解析し、function の処理時間とピークRSSを返す"""
+    try:
+        from bs4 import BeautifulSoup
+        from clinic_info_scraper import ClinicInfoScraper
+        from universal_scraper import UniversalStoreScraper
+
+        funcs = {
+            'find_clinic_links': ClinicInfoScraper().find_clinic_links,
+            'extract_store_info': UniversalStoreScraper().extract_store_info,
+        }
+        content = generate(case, scale).encode('utf-8')
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            soup = BeautifulSoup(content, 'html.parser')
+            parse_ms = (time.perf_counter() - start) * 1000
+            parsed_rss = _peak_rss_mb()
+            start = time.perf_counter()
+            funcs[function](soup, STRESS_URL)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+        conn.send({
+            'parse_ms': round(parse_ms, 1),
+            'ms': round(elapsed_ms, 1),
+            'parse_rss_mb': round(parsed_rss, 1),
+            'peak_rss_mb': round(_peak_rss_mb(), 1)
+        })
+    except BaseException as e:
+        conn.send({'error': f"{type(e).__name__}: {e}"[:200]})
+    finally:
+        conn.close()
+
+
+def run_one(case, scale, function, timeout):
+    ctx = multiprocessing.get_context('spawn')
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_measure, args=(case, scale, function, child_conn))
+    process.start()
+    child_conn.close()
+    if parent_conn.poll(timeout):
+        result = parent_conn.recv()
+    else:
+        process.kill()
+        result = {'timeout': True}
+    process.join()
+    return result
+
+
+def run(cases=None, scale=1.0, timeout=60, slo_ms=2000, max_rss_mb=512, ignore_caps=False):
+    results = {
+        'meta': run_metadata(scale=scale, timeout=timeout, slo_ms=slo_ms, max_rss_mb=max_rss_mb, ignore_caps=ignore_caps),
+        'cases': {},
+        'violations': []
+    }
+    for case in cases or CASES:
+        content = generate(case, scale).encode('utf-8')
+        try:
+            check_page(content, STRESS_URL)
+            capped = None
+        except PageTooLarge as e:
+            capped = str(e)
+        entry = {'bytes': len(content), 'nodes_estimate': estimate_nodes(content), 'capped': capped, 'functions': {}}
+        for function in FUNCTIONS:
+            result = run_one(case, scale, function, timeout)
+            entry['functions'][function] = result
+            if capped and not ignore_caps:
+                continue
+            if result.get('timeout'):
+                results['violations'].append(f"{case}:{function}: {timeout}秒で打ち切り")
+            elif 'error' in result:
+                results['violations'].append(f"{case}:{function}: {result['error']}")
+            else:
+                if result['ms'] > slo_ms:
+                    results['violations'].append(f"{case}:{function}: {result['ms']:.0f}ms > {slo_ms}ms")
+                if result['peak_rss_mb'] > max_rss_mb:
+                    results['violations'].append(f"{case}:{function}: {result['peak_rss_mb']:.0f}MB > {max_rss_mb}MB")
+        results['cases'][case] = entry
+        print_case(case, entry, timeout)
+    return results
+
+
+def print_case(case, entry, timeout):
+    for function, result in entry['functions'].items():
+        if result.get('timeout'):
+            status = f"TIMEOUT（>{timeout}秒）"
+        elif 'error' in result:
+            status = result['error']
+        else:
+            status = (f"parse {result['parse_ms']:>9.1f}ms  {result['ms']:>10.1f}ms  "
+                      f"RSS {result['peak_rss_mb']:>7.1f}MB")
+        cap = '上限超過' if entry['capped'] else ''
+        print(f"{case:<20}{entry['bytes']:>10}{entry['nodes_estimate']:>9}  {cap:<6}{function:<20}{status}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='敵対的なページに対する抽出処理の最悪ケース計測')
+    parser.add_argument('--case', action='append', choices=list(CASES), help='計測するページ（複数指定可）')
+    parser.add_argument('--scale', type=float, default=1.0, help='ページの大きさの倍率')
+    parser.add_argument('--timeout', type=float, default=60, help='1回の計測の打ち切り時間（秒）')
+    parser.add_argument('--slo-ms', type=float, default=2000, help='1ページあたりの処理時間の上限（ミリ秒）')
+    parser.add_argument('--max-rss-mb', type=float, default=512, help='ピークRSSの上限（MB）')
+    parser.add_argument('--ignore-caps', action='store_true', help='page_limits の上限で除外されるページもSLOの対象にする')
+    parser.add_argument('--output', help='結果JSONの保存先（デフォルト: benchmarks/results/）')
+    args = parser.parse_args()
+
+    print(f"{'case':<20}{'bytes':>10}{'nodes':>9}  {'':<6}{'function':<20}")
+    results = run(args.case, args.scale, args.timeout, args.slo_ms, args.max_rss_mb, args.ignore_caps)
+    path = save_results(results, args.output, prefix='stress')
+    print(f"\n結果を保存しました: {path}")
+
+    if results['violations']:
+        print("\nSLO違反:")
+        for violation in results['violations']:
+            print(f"  {violation}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
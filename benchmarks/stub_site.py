@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+負荷試験用のスタブ・チェーンサイト
+店舗一覧ページと店舗ページを生成して返すローカルHTTPサーバー。
+店舗数、一覧ページのURL形式、遅延・ゆらぎ、429/503の発生率、低速レスポンスを設定できる
+
+使い方:
+    python benchmarks/stub_site.py --branches 300 --layout mixed --latency 50 --jitter 30 --error-rate 0.02
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+CITIES = [
+    ('shinjuku', '新宿', '東京都新宿区新宿3-1-1', '新宿'),
+    ('shibuya', '渋谷', '東京都渋谷区道玄坂2-10-7', '渋谷'),
+    ('ikebukuro', '池袋', '東京都豊島区南池袋1-20-3', '池袋'),
+    ('ginza', '銀座', '東京都中央区銀座4-6-16', '銀座'),
+    ('umeda', '梅田', '大阪府大阪市北区梅田1-2-2', '梅田'),
+    ('namba', '難波', '大阪府大阪市中央区難波5-1-60', '難波'),
+    ('sapporo', '札幌', '北海道札幌市中央区北5条西2-5', '札幌'),
+    ('sendai', '仙台', '宮城県仙台市青葉区中央1-1-1', '仙台'),
+    ('nagoya', '名古屋', '愛知県名古屋市中村区名駅4-6-23', '名古屋'),
+    ('kyoto', '京都', '京都府京都市下京区烏丸通塩小路下ル', '京都'),
+    ('hakata', '博多', '福岡県福岡市博多区博多駅中央街1-1', '博多'),
+    ('yokohama', '横浜', '神奈川県横浜市西区南幸1-5-1', '横浜'),
+]
+
+# find_clinic_links が対象とする一覧ページのURL形式
+LAYOUTS = {
+    'clinic': '/clinic/{slug}/',
+    'store': '/stores/{slug}/',
+    'locations': '/locations/{slug}/',
+    'branch': '/clinic/branch/{slug}/',
+    'tcb': '/clinic/{slug}',
+    'tenpo': '/tenpo/{slug}/',
+    'area': '/area/{region}/{slug}/',
+}
+
+
+class StubConfig:
+    """スタブサイトの設定"""
+
+    def __init__(self, branches=50, layout='clinic', latency_ms=0, jitter_ms=0,
+                 error_rate=0.0, retry_after=1, slow_body_rate=0.0, slow_body_seconds=5.0,
+                 chain_name='スタブクリニック', seed=None):
+        self.branches = branches
+        self.layout = layout
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.slow_body_rate = slow_body_rate
+        self.slow_body_seconds = slow_body_seconds
+        self.chain_name = chain_name
+        self.random = random.Random(seed)
+
+
+def branch_info(index):
+    slug, city, address, station = CITIES[index % len(CITIES)]
+    number = index // len(CITIES) + 1
+    return {
+        'slug': f"{slug}{number}",
+        'name': f"{city}{number}号院" if number > 1 else f"{city}院",
+        'address': f"〒100-{index:04d} {address}-{number}",
+        'station': f"{station}駅",
+        'minutes': index % 9 + 1,
+        'tel': f"03-{1000 + index % 9000:04d}-{index % 10000:04d}",
+    }
+
+
+def branch_path(layout, index):
+    if layout == 'mixed':
+        layout = list(LAYOUTS)[index % len(LAYOUTS)]
+    info = branch_info(index)
+    return LAYOUTS[layout].format(slug=info['slug'], region=info['slug'][:3])
+
+
+def render_page(title, body):
+    return (
+        '<!DOCTYPE html>\n<html lang="ja">\n<head>\n<meta charset="utf-8">\n'
+        f'<title>{title}</title>\n</head>\n<body>\n'
+        '<header>\n<nav>\n<a href="/">トップ</a>\n<a href="/about/">会社概要</a>\n<a href="/recruit/">採用情報</a>\n</nav>\n</header>\n'
+        f'<main>\n{body}\n</main>\n'
+        '<footer>\n<p>Copyright (C) stub chain</p>\n</footer>\n</body>\n</html>\n'
+    )
+
+
+def render_list(config):
+    items = '\n'.join(
+        f'<li><a href="{branch_path(config.layout, i)}">{config.chain_name}{branch_info(i)["name"]}</a></li>'
+        for i in range(config.branches)
+    )
+    return render_page(f'{config.chain_name} 院一覧', f'<h1>院一覧</h1>\n<ul class="clinic-list">\n{items}\n</ul>')
+
+
+def render_detail(config, index):
+    info = branch_info(index)
+    name = f"{config.chain_name}{info['name']}"
+    body = (
+        f'<h1>{name}</h1>\n'
+        '<table class="clinic-info">\n'
+        f'<tr><th>住所</th><td>{info["address"]}</td></tr>\n'
+        f'<tr><th>アクセス</th><td>{info["station"]}から徒歩{info["minutes"]}分</td></tr>\n'
+        f'<tr><th>電話番号</th><td>{info["tel"]}</td></tr>\n'
+        '<tr><th>診療時間</th><td>10:00〜19:00</td></tr>\n'
+        '</table>'
+    )
+    return render_page(f'{name}｜{config.chain_name}', body)
+
+
+class StubSiteHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, headers=None, slow=False, content_type='text/html; charset=utf-8'):
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if not slow:
+            self.wfile.write(data)
+            return
+        # 低速レスポンス: 本文を少しずつ送る
+        chunks = 10
+        size = max(1, len(data) // chunks)
+        for offset in range(0, len(data), size):
+            self.wfile.write(data[offset:offset + size])
+            self.wfile.flush()
+            time.sleep(self.server.config.slow_body_seconds / chunks)
+
+    def do_GET(self):
+        server = self.server
+        config = server.config
+        server.count('requests')
+
+        if self.path == '/__stats':
+            self._send(200, json.dumps(server.stats()), content_type='application/json')
+            return
+
+        delay = config.latency_ms + config.random.uniform(-config.jitter_ms, config.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+        if config.error_rate and config.random.random() < config.error_rate:
+            status = config.random.choice([429, 503])
+            server.count(str(status))
+            self._send(status, render_page('Error', f'<h1>{status}</h1>'), {'Retry-After': str(config.retry_after)})
+            return
+
+        slow = bool(config.slow_body_rate) and config.random.random() < config.slow_body_rate
+        if slow:
+            server.count('slow')
+
+        path = self.path.split('?')[0]
+        if path in ('/', '/clinic/', '/list/'):
+            self._send(200, render_list(config), slow=slow)
+            return
+        index = server.paths.get(path)
+        if index is None:
+            server.count('404')
+            self._send(404, render_page('Not Found', '<h1>404</h1>'))
+            return
+        server.count('detail')
+        self._send(200, render_detail(config, index), slow=slow)
+
+
+class StubChainSite(ThreadingHTTPServer):
+    """スタブサイトのサーバー。start() でバックグラウンド起動する"""
+
+    daemon_threads = True
+
+    def __init__(self, config=None, host='127.0.0.1', port=0):
+        self.config = config or StubConfig()
+        self.paths = {branch_path(self.config.layout, i): i for i in range(self.config.branches)}
+        self._counts = {}
+        self._counts_lock = threading.Lock()
+        self._thread = None
+        super().__init__((host, port), StubSiteHandler)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def list_url(self):
+        return f"{self.base_url}/clinic/"
+
+    def count(self, key):
+        with self._counts_lock:
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+    def stats(self):
+        with self._counts_lock:
+            return dict(self._counts)
+
+    def handle_error(self, request, client_address):
+        # 締め切りで打ち切ったクライアントの切断はトレースバックを出さずに無視する
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def add_stub_arguments(parser):
+    """スタブサイトの設定用の引数を追加（load_test.py と共通）"""
+    parser.add_argument('--branches', type=int, default=50, help='店舗数')
+    parser.add_argument('--layout', default='clinic', choices=list(LAYOUTS) + ['mixed'], help='店舗ページのURL形式')
+    parser.add_argument('--latency', type=float, default=0, help='レスポンスの遅延（ミリ秒）')
+    parser.add_argument('--jitter', type=float, default=0, help='遅延のゆらぎ（±ミリ秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='429/503を返す確率（0〜1）')
+    parser.add_argument('--retry-after', type=int, default=1, help='429/503の Retry-After（秒）')
+    parser.add_argument('--slow-body-rate', type=float, default=0.0, help='本文を低速で返す確率（0〜1）')
+    parser.add_argument('--slow-body-seconds', type=float, default=5.0, help='低速レスポンスで本文を送り終えるまでの秒数')
+    parser.add_argument('--seed', type=int, help='乱数シード')
+
+
+def config_from_args(args):
+    return StubConfig(
+        branches=args.branches,
+        layout=args.layout,
+        latency_ms=args.latency,
+        jitter_ms=args.jitter,
+        error_rate=args.error_rate,
+        retry_after=args.retry_after,
+        slow_body_rate=args.slow_body_rate,
+        slow_body_seconds=args.slow_body_seconds,
+        seed=args.seed
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='負荷試験用のスタブ・チェーンサイト')
+    add_stub_arguments(parser)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    args = parser.parse_args()
+
+    server = StubChainSite(config_from_args(args), args.host, args.port)
+    print(f"スタブサイトを起動しました: {server.list_url} （店舗数: {args.branches}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
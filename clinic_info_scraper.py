@@ -4,16 +4,28 @@
 店舗名、住所、アクセス情報を取得してCSV出力
 """
 
-import requests
-from bs4 import BeautifulSoup
 import os
+import threading
 import time
 from urllib.parse import urljoin, urlparse
 import re
 import csv
 from datetime import datetime
 import json
+from contextlib import nullcontext
 from universal_scraper import UniversalStoreScraper
+from job_store import LINK_FAILED
+from charset import decode_response
+from concurrency import AdmissionCancelled, fetch_limiter, host_limiter, parse_limiter
+from fetcher import fetch_page, is_binary_url
+from metrics import timer
+from parse_pool import parse_pool
+from pipeline import EXTRACT_WORKERS, FETCH_WORKERS, Pipeline
+from retry import BREAKER_RETRY_ROUNDS, CircuitOpen, breakers, fetch_with_retry
+from scraper_log import get_logger
+
+
+logger = get_logger(__name__)
 
 
 class ClinicInfoScraper:
@@ -27,7 +39,29 @@ class ClinicInfoScraper:
         self.current_action = ""
         self.clinic_data = []
         self.universal_scraper = UniversalStoreScraper()
+        # キャンセル要求（ページ間および待機中に確認する）
+        self.cancel_event = threading.Event()
+        # 店舗ページ取得の間隔（秒）
+        self.request_interval = 1
+        # 店舗ページの取得・抽出のワーカー数と、実行中のパイプライン（ステージごとの状況）
+        self.fetch_workers = FETCH_WORKERS
+        self.extract_workers = EXTRACT_WORKERS
+        self.pipeline = None
+        # 抽出したレコードごとに呼び出す関数（バッチ出力などで逐次書き出す場合）
+        self.on_record = None
+        # ドメインごとの取得スケジューラー（scheduler.DomainScheduler、複数チェーンの一括取得で共有する）
+        self.scheduler = None
         
+    def cancel(self):
+        """実行中のスクレイピングにキャンセルを要求"""
+        self.cancel_event.set()
+        if self.status != "完了":
+            self.status = "キャンセル中..."
+    
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+    
     def get_progress(self):
         """進捗状況を取得"""
         return {
@@ -36,7 +70,9 @@ class ClinicInfoScraper:
             'percentage': int((self.progress / self.total * 100) if self.total > 0 else 0),
             'status': self.status,
             'current_action': self.current_action,
-            'clinic_count': len(self.clinic_data)
+            'clinic_count': len(self.clinic_data),
+            'cancelled': self.cancelled,
+            'pipeline': self.pipeline.snapshot() if self.pipeline else None
         }
     
     def extract_clinic_info(self, soup, url, clinic_name=""):
@@ -69,11 +105,9 @@ class ClinicInfoScraper:
         
         # Log confidence scores for debugging
         if 'confidence_scores' in result:
-            print(f"[DEBUG] Confidence scores for {url}:")
-            print(f"  - Name: {result['confidence_scores']['name']}%")
-            print(f"  - Address: {result['confidence_scores']['address']}%")
-            print(f"  - Access: {result['confidence_scores']['access']}%")
-            print(f"  - Overall: {result['confidence_scores']['overall']}%")
+            scores = result['confidence_scores']
+            logger.debug("confidence url=%s name=%s address=%s access=%s overall=%s",
+                         url, scores['name'], scores['address'], scores['access'], scores['overall'])
         
         return clinic_info
     
@@ -481,6 +515,9 @@ class ClinicInfoScraper:
                 continue
             if urlparse(absolute_url).netloc != domain:
                 continue
+            # PDF・画像などHTMLではないファイルは取得しない
+            if is_binary_url(absolute_url):
+                continue
             
             # Check pattern matching
             pattern_matched = False
@@ -546,76 +583,215 @@ class ClinicInfoScraper:
             for pattern, links in link_groups.items():
                 if len(links) >= 3:  # Found a pattern with multiple links
                     for link in links:
-                        if link['url'] not in seen and link['url'].rstrip('/') != base_url.rstrip('/'):
+                        if (link['url'] not in seen and link['url'].rstrip('/') != base_url.rstrip('/')
+                                and not is_binary_url(link['url'])):
                             seen.add(link['url'])
                             unique_links.append(link)
         
         return unique_links
     
-    def scrape_clinics(self, url):
-        """メイン処理"""
+    def fetch(self, url, job_key):
+        """ページを取得（プロセス全体の同時取得数の上限内で実行）
+
+        一時的な失敗は間隔を空けて再試行し、ドメインのブレーカーが開いている場合は CircuitOpen を送出する。
+        scheduler を設定した場合は、ホストの枠を確保してからそのドメインの順番を待つ（再試行ごとに並び直す）
+        """
+        return fetch_with_retry(lambda: self._request(url, job_key), url, self.cancel_event)
+    
+    def _scheduled(self, url):
+        if self.scheduler is None:
+            return nullcontext()
+        return self.scheduler.slot(urlparse(url).netloc, self.cancel_event)
+    
+    def _request(self, url, job_key):
+        # ホストの枠（Retry-After の待機を含む）を先に確保し、待機中はスケジューラーと全体の枠を使わない
+        # （止まっているホストが枠を持ったまま待ち、他のドメインの順番を止めないように）
+        with host_limiter.slot(url, self.cancel_event) as slot, self._scheduled(url), \
+                fetch_limiter.slot(job_key, self.cancel_event), timer('fetch'):
+            slot.response = fetch_page(url, self.headers, timeout=10)
+            slot.response.raise_for_status()
+            return slot.response
+    
+    def process_page(self, content, url, kind, job_key, link_name=""):
+        """取得したHTMLを解析・抽出（プロセス全体の同時解析数の上限内で実行）
+
+        SCRAPER_PARSE_PROCESSES を指定した場合は子プロセスで実行し、抽出結果の辞書のみを受け取る
+        """
+        with parse_limiter.slot(job_key, self.cancel_event):
+            return parse_pool.process(self, content, url, kind, link_name)
+    
+    def split_list_page(self, page):
+        """最初のページの抽出結果から (店舗リンク, ページ自体の店舗情報または None) を返す"""
+        clinic_links = page['links']
+        current_page_info = page['info']
+        # 店舗一覧ページかチェック（複数の店舗リンクがある場合）
+        is_list_page = len(clinic_links) > 3
+        
+        # 一覧ページではない、または個別店舗ページの場合のみ追加
+        # 一覧ページの判定: "一覧"、"クリニック一覧"、"店舗一覧" などのタイトル
+        is_individual_store = not any(keyword in current_page_info['name'] for keyword in ['一覧', 'リスト', 'List'])
+        
+        if not (current_page_info['name'] and (current_page_info['address'] or current_page_info['access']) and (not is_list_page or is_individual_store)):
+            current_page_info = None
+        # 3つ以上のリンクがある場合は一覧ページと判断
+        if not is_list_page:
+            clinic_links = []
+        return clinic_links, current_page_info
+    
+    def crawl_links(self, clinic_links, job_key, job_store=None, job_id=None):
+        """店舗ページを fetch → extract のパイプラインで取得・抽出し、結果を順に clinic_data に追加
+
+        ステージごとのワーカー数は fetch_workers / extract_workers、取得間隔はワーカー数によらず
+        ジョブ全体で request_interval 秒に1回。ドメインのブレーカーが開いていたため取得しなかった
+        ページは、ブレーカーが閉じるのを待って BREAKER_RETRY_ROUNDS 回まで取得し直す
+        """
+        progress_lock = threading.Lock()
+        throttle_lock = threading.Lock()
+        next_fetch = [time.monotonic()]
+        
+        def advance():
+            with progress_lock:
+                self.progress += 1
+                self.status = f"店舗情報を取得中... ({self.progress}/{self.total})"
+        
+        def fetch_link(link):
+            # サーバー負荷軽減（キャンセル時は待機を打ち切る）
+            with throttle_lock:
+                delay = next_fetch[0] - time.monotonic()
+                if delay > 0 and self.cancel_event.wait(delay):
+                    raise AdmissionCancelled(link['url'])
+                next_fetch[0] = time.monotonic() + self.request_interval
+            self.current_action = f"取得中: {link['name']}"
+            return link, decode_response(self.fetch(link['url'], job_key))
+        
+        def extract_link(item):
+            link, content = item
+            return link, self.process_page(content, link['url'], 'detail', job_key, link['name'])['info']
+        
+        deferred = []
+        
+        def link_failed(item, e):
+            link = item[0] if isinstance(item, tuple) else item
+            if isinstance(e, CircuitOpen):
+                with progress_lock:
+                    deferred.append(link)
+                return
+            if not isinstance(e, AdmissionCancelled):
+                logger.warning("店舗ページ取得エラー: %s - %s", link['url'], e)
+                if job_store is not None:
+                    job_store.complete_link(job_id, link['url'], state=LINK_FAILED)
+            advance()
+        
+        def record(item):
+            link, clinic_info = item
+            if clinic_info['name']:
+                self.clinic_data.append(clinic_info)
+                # チェックポイントより先に書き出す（中断時は再取得した分が重複する側に倒す）
+                if self.on_record:
+                    self.on_record(clinic_info)
+            else:
+                clinic_info = None
+            if job_store is not None:
+                job_store.complete_link(job_id, link['url'], clinic_info)
+            advance()
+        
+        def run(links):
+            self.pipeline = Pipeline(f"job-{job_key}", self.cancel_event)
+            self.pipeline.add_stage('fetch', fetch_link, self.fetch_workers, on_error=link_failed)
+            self.pipeline.add_stage('extract', extract_link, self.extract_workers, on_error=link_failed)
+            self.pipeline.run(links, sink=record)
+        
+        run(clinic_links)
+        for _ in range(BREAKER_RETRY_ROUNDS):
+            if not deferred or self.cancelled:
+                break
+            links = list(deferred)
+            deferred.clear()
+            wait = max(breakers.retry_in(urlparse(link['url']).netloc) for link in links)
+            self.current_action = f"サイトの応答がないため {len(links)}件を{wait:.0f}秒後に再取得します"
+            if wait > 0 and self.cancel_event.wait(wait):
+                deferred.extend(links)
+                break
+            run(links)
+        if self.cancelled:
+            return
+        for link in deferred:
+            logger.warning("店舗ページ取得エラー: %s - ブレーカーが開いたままのため取得できませんでした", link['url'])
+            if job_store is not None:
+                job_store.complete_link(job_id, link['url'], state=LINK_FAILED)
+            advance()
+    
+    def scrape_clinics(self, url, job_store=None, job_id=None):
+        """メイン処理
+
+        job_store と job_id を渡すと、店舗リンクと抽出結果をページごとに保存し、
+        同じ job_id で再実行した場合は取得済みのページを飛ばして再開する
+        """
+        checkpoint = job_store is not None and job_id is not None
+        # 同時実行数の公平な配分に使うジョブの識別子
+        job_key = job_id or id(self)
         try:
-            self.status = "ページを取得中..."
-            self.current_action = f"URL: {url}"
-            
-            # ページ取得
-            response = requests.get(url, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # 店舗一覧ページかチェック（複数の店舗リンクがある場合）
-            clinic_links = self.find_clinic_links(soup, url)
-            is_list_page = len(clinic_links) > 3
-            
-            # まず現在のページから情報を抽出
-            self.status = "店舗情報を抽出中..."
-            current_page_info = self.extract_clinic_info(soup, url)
-            
-            # 一覧ページではない、または個別店舗ページの場合のみ追加
-            # 一覧ページの判定: "一覧"、"クリニック一覧"、"店舗一覧" などのタイトル
-            is_individual_store = not any(keyword in current_page_info['name'] for keyword in ['一覧', 'リスト', 'List'])
-            
-            if current_page_info['name'] and (current_page_info['address'] or current_page_info['access']) and (not is_list_page or is_individual_store):
-                self.clinic_data.append(current_page_info)
-                self.progress = 1
-                self.total = 1
-            
-            if len(clinic_links) > 3:  # 3つ以上のリンクがある場合は一覧ページと判断
-                self.total = len(clinic_links)
-                self.progress = 0
+            if checkpoint and job_store.has_frontier(job_id):
+                # 前回のチェックポイントから再開
+                self.status = "前回の続きから再開中..."
+                self.current_action = f"URL: {url}"
+                self.clinic_data = job_store.load_records(job_id)
+                clinic_links = job_store.pending_links(job_id)
+                self.total = job_store.frontier_size(job_id) or len(self.clinic_data)
+                done_count = self.total - len(clinic_links)
+                self.progress = done_count
+            else:
+                self.status = "ページを取得中..."
+                self.current_action = f"URL: {url}"
                 
-                for i, link in enumerate(clinic_links):
-                    self.progress = i + 1
-                    self.status = f"店舗情報を取得中... ({self.progress}/{self.total})"
-                    self.current_action = f"取得中: {link['name']}"
-                    
-                    try:
-                        # 各店舗ページを取得
-                        clinic_response = requests.get(link['url'], headers=self.headers, timeout=10)
-                        clinic_response.raise_for_status()
-                        clinic_soup = BeautifulSoup(clinic_response.content, 'html.parser')
-                        
-                        # 店舗情報を抽出
-                        clinic_info = self.extract_clinic_info(clinic_soup, link['url'], link['name'])
-                        if clinic_info['name']:
-                            self.clinic_data.append(clinic_info)
-                        
-                        time.sleep(1)  # サーバー負荷軽減
-                        
-                    except Exception as e:
-                        print(f"店舗ページ取得エラー: {link['url']} - {str(e)}")
-                        continue
+                # ページ取得
+                response = self.fetch(url, job_key)
+                
+                self.status = "店舗情報を抽出中..."
+                # 店舗リンクの探索と現在のページからの情報抽出
+                page = self.process_page(decode_response(response), url, 'list', job_key)
+                clinic_links, current_page_info = self.split_list_page(page)
+                
+                if current_page_info:
+                    self.clinic_data.append(current_page_info)
+                    if self.on_record:
+                        self.on_record(current_page_info)
+                    self.progress = 1
+                    self.total = 1
+                    if checkpoint:
+                        job_store.save_record(job_id, current_page_info)
+                
+                if checkpoint:
+                    job_store.save_frontier(job_id, clinic_links)
+                if clinic_links:
+                    self.total = len(clinic_links)
+                done_count = 0
+            
+            if clinic_links:
+                self.progress = done_count
+                self.crawl_links(clinic_links, job_key, job_store if checkpoint else None, job_id)
+            
+            if self.cancelled:
+                return self._finish_cancelled()
             
             self.status = "完了"
             self.current_action = f"{len(self.clinic_data)}件の店舗情報を取得しました"
             
             return True
             
+        except AdmissionCancelled:
+            # 最初のページの取得・解析を待っている間にキャンセルされた
+            return self._finish_cancelled()
         except Exception as e:
             self.status = "エラー"
             self.current_action = str(e)
             return False
     
+    def _finish_cancelled(self):
+        self.status = "キャンセル"
+        self.current_action = f"キャンセルしました（{len(self.clinic_data)}件取得済み）"
+        return True
+    
     def save_to_csv(self, filename=None):
         """取得したデータをCSVに保存"""
         if not filename:
@@ -637,7 +813,7 @@ class ClinicInfoScraper:
             fieldnames.append('営業時間')
         fieldnames.append('URL')
         
-        with open(filename, 'w', newline='', encoding='utf-8-sig') as csvfile:
+        with timer('csv_write'), open(filename, 'w', newline='', encoding='utf-8-sig') as csvfile:
             writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
             
             writer.writeheader()
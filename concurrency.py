@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+プロセス全体の同時実行数制御（アドミッション制御）
+全ジョブ合計の同時取得数（ソケット）と同時解析数（CPU）に上限を設け、
+実行中のジョブ間で枠を公平に分け合う
+
+ホストごとの同時取得数は応答から調整する（AIMD）。応答時間が平常の間は少しずつ増やし、
+429 / 503・タイムアウト・応答時間の急増で半分に減らす。Retry-After を受け取った場合は
+指定された時刻までそのホストへの取得を待たせる
+"""
+
+import math
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import metrics
+
+
+# 全ジョブ合計の同時取得数
+MAX_FETCHES = int(os.environ.get('SCRAPER_MAX_FETCHES', '16'))
+
+# 全ジョブ合計の同時解析・抽出数（CPUバウンド）
+MAX_PARSES = int(os.environ.get('SCRAPER_MAX_PARSES', str(os.cpu_count() or 2)))
+
+# ホストごとの同時取得数（初期値・上限）
+HOST_INITIAL = float(os.environ.get('SCRAPER_HOST_INITIAL', '2'))
+HOST_MAX = int(os.environ.get('SCRAPER_HOST_MAX', '8'))
+
+# 応答時間が平常時の何倍を超えたら混雑とみなすか（短い応答のゆらぎは HOST_SPIKE_MIN_SECONDS 未満なら無視）
+HOST_LATENCY_FACTOR = float(os.environ.get('SCRAPER_HOST_LATENCY_FACTOR', '3'))
+HOST_SPIKE_MIN_SECONDS = 0.5
+
+# Retry-After で待つ最大秒数
+MAX_RETRY_AFTER = float(os.environ.get('SCRAPER_MAX_RETRY_AFTER', '120'))
+
+# 混雑とみなすステータスコード
+BACKOFF_STATUSES = (429, 503)
+
+
+class AdmissionCancelled(Exception):
+    """待機中にジョブがキャンセルされた"""
+
+
+class HostBlocked(Exception):
+    """締め切りまでにホストの枠を確保できない（Retry-After で止まっている間など）。待っても間に合わないため再試行しない"""
+
+    retryable = False
+
+    def __init__(self, host, retry_in):
+        super().__init__(f"{host}: {retry_in:.0f}秒間取得を停止しています（Retry-After）")
+        self.host = host
+        self.retry_in = retry_in
+
+
+class FairLimiter:
+    """同時実行数の上限付きセマフォ。枠が不足している間は各ジョブの使用数を公平な割当以下に抑える"""
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = max(1, limit)
+        self._cond = threading.Condition()
+        self._in_flight = Counter()
+        self._waiting = Counter()
+        self.acquired_total = 0
+        self.wait_seconds_total = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _fair_share(self):
+        active = set(self._in_flight) | set(self._waiting)
+        return max(1, math.ceil(self.limit / max(1, len(active))))
+
+    def _can_acquire(self, job_id):
+        if sum(self._in_flight.values()) >= self.limit:
+            return False
+        # 他のジョブが待っている場合のみ公平な割当を適用
+        others_waiting = any(job != job_id for job in self._waiting)
+        return not others_waiting or self._in_flight[job_id] < self._fair_share()
+
+    def acquire(self, job_id, cancel_event=None):
+        start = time.monotonic()
+        with self._cond:
+            self._waiting[job_id] += 1
+            try:
+                while not self._can_acquire(job_id):
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise AdmissionCancelled(job_id)
+                    self._cond.wait(0.5)
+            finally:
+                self._waiting[job_id] -= 1
+                if self._waiting[job_id] <= 0:
+                    del self._waiting[job_id]
+            self._in_flight[job_id] += 1
+            waited = time.monotonic() - start
+            self.acquired_total += 1
+            self.wait_seconds_total += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def release(self, job_id):
+        with self._cond:
+            self._in_flight[job_id] -= 1
+            if self._in_flight[job_id] <= 0:
+                del self._in_flight[job_id]
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, job_id, cancel_event=None):
+        """枠を1つ確保して処理を実行"""
+        self.acquire(job_id, cancel_event)
+        try:
+            yield
+        finally:
+            self.release(job_id)
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                'limit': self.limit,
+                'in_flight': sum(self._in_flight.values()),
+                'waiting': sum(self._waiting.values()),
+                'active_jobs': len(set(self._in_flight) | set(self._waiting)),
+                'acquired_total': self.acquired_total,
+                'wait_seconds_total': round(self.wait_seconds_total, 3),
+                'max_wait_seconds': round(self.max_wait_seconds, 3)
+            }
+
+
+def parse_retry_after(value, now=None):
+    """Retry-After（秒数またはHTTP日付）を待つ秒数に変換（解釈できない場合は None）"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if moment is None:
+        return None
+    return max(0.0, moment.timestamp() - (now if now is not None else time.time()))
+
+
+class _HostState:
+    def __init__(self, initial):
+        self.limit = initial
+        self.in_flight = 0
+        self.baseline = None
+        self.blocked_until = 0.0
+        self.last_decrease = 0.0
+        self.increases = 0
+        self.decreases = 0
+        self.retry_after_total = 0.0
+
+
+class HostSlot:
+    """slot() の中で取得した応答を設定する（response または status / retry_after）"""
+
+    def __init__(self, host):
+        self.host = host
+        self.started = time.monotonic()
+        self.response = None
+
+    @property
+    def status(self):
+        return self.response.status_code if self.response is not None else None
+
+    @property
+    def latency(self):
+        """本文を受信し終えるまでの秒数（全体の同時取得数の枠を待った時間は含めない）
+
+        fetcher.fetch_page の応答は本文の受信を含む fetch_seconds、それ以外は応答のヘッダーまでの elapsed を使う
+        """
+        fetch_seconds = getattr(self.response, 'fetch_seconds', None)
+        if fetch_seconds is not None:
+            return fetch_seconds
+        elapsed = getattr(self.response, 'elapsed', None)
+        if elapsed is not None:
+            return elapsed.total_seconds()
+        return time.monotonic() - self.started
+
+    @property
+    def retry_after(self):
+        if self.response is None:
+            return None
+        return parse_retry_after(self.response.headers.get('Retry-After'))
+
+
+class AdaptiveHostLimiter:
+    """ホストごとの同時取得数を応答時間と 429 / 503 から調整する（AIMD）
+
+    成功した応答の時間が平常時（指数移動平均）の HOST_LATENCY_FACTOR 倍以内なら上限を 1/上限 ずつ増やし
+    （上限の数だけ応答が返るごとに +1）、混雑の兆候があれば半分にする。減らした後に開始した取得の
+    応答でのみ再び減らすため、同じ混雑で返ってきた複数の応答で何度も半分にはしない
+    """
+
+    def __init__(self, initial=HOST_INITIAL, maximum=HOST_MAX, latency_factor=HOST_LATENCY_FACTOR):
+        self.initial = max(1.0, initial)
+        self.maximum = max(1, maximum)
+        self.latency_factor = latency_factor
+        self._cond = threading.Condition()
+        self._hosts = {}
+
+    def _host(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostState(min(self.initial, self.maximum))
+        return state
+
+    def acquire(self, host, cancel_event=None, deadline=None):
+        """ホストの枠を1つ確保（deadline は time.monotonic() の時刻。それまでに確保できない場合は HostBlocked）"""
+        with self._cond:
+            state = self._host(host)
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise AdmissionCancelled(host)
+                now = time.monotonic()
+                wait = state.blocked_until - now
+                if wait <= 0 and state.in_flight < int(state.limit):
+                    break
+                if deadline is not None and (state.blocked_until >= deadline or now >= deadline):
+                    raise HostBlocked(host, max(0.0, wait))
+                self._cond.wait(min(max(wait, 0.05), 0.5) if wait > 0 else 0.5)
+            state.in_flight += 1
+        return HostSlot(host)
+
+    def release(self, slot, error=None):
+        """取得の結果から上限を調整（error はタイムアウト・接続エラーなどの例外）"""
+        now = time.monotonic()
+        latency = slot.latency
+        with self._cond:
+            state = self._hosts[slot.host]
+            state.in_flight -= 1
+            status = slot.status
+            congested = error is not None or status in BACKOFF_STATUSES
+            if not congested and status is not None and status < 500:
+                if state.baseline is not None and latency > max(state.baseline * self.latency_factor,
+                                                                HOST_SPIKE_MIN_SECONDS):
+                    congested = True
+                else:
+                    state.baseline = latency if state.baseline is None else 0.9 * state.baseline + 0.1 * latency
+                    if state.limit < self.maximum:
+                        state.limit = min(self.maximum, state.limit + 1 / state.limit)
+                        state.increases += 1
+            if congested and slot.started >= state.last_decrease:
+                state.limit = max(1.0, state.limit / 2)
+                state.last_decrease = now
+                state.decreases += 1
+            if status in BACKOFF_STATUSES:
+                retry_after = slot.retry_after
+                if retry_after:
+                    retry_after = min(retry_after, MAX_RETRY_AFTER)
+                    state.blocked_until = max(state.blocked_until, now + retry_after)
+                    state.retry_after_total += retry_after
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, url, cancel_event=None, deadline=None):
+        """URLのホストの枠を1つ確保して取得を実行。取得した応答は yield した HostSlot の response に設定する"""
+        slot = self.acquire(urlparse(url).netloc, cancel_event, deadline)
+        try:
+            yield slot
+        except AdmissionCancelled:
+            self.release(slot)
+            raise
+        except Exception as e:
+            # raise_for_status() による例外や、応答を受け取ってから打ち切った取得は応答のステータスで判定する
+            if slot.response is None:
+                slot.response = getattr(e, 'response', None)
+            self.release(slot, None if slot.response is not None else e)
+            raise
+        self.release(slot)
+
+    def snapshot(self):
+        with self._cond:
+            now = time.monotonic()
+            return {
+                host: {
+                    'limit': round(state.limit, 2),
+                    'in_flight': state.in_flight,
+                    'baseline_ms': round(state.baseline * 1000, 1) if state.baseline is not None else None,
+                    'blocked_sec': round(max(0.0, state.blocked_until - now), 1),
+                    'increases': state.increases,
+                    'decreases': state.decreases,
+                    'retry_after_sec_total': round(state.retry_after_total, 1)
+                }
+                for host, state in self._hosts.items()
+            }
+
+
+fetch_limiter = FairLimiter('fetch', MAX_FETCHES)
+parse_limiter = FairLimiter('parse', MAX_PARSES)
+host_limiter = AdaptiveHostLimiter()
+
+
+def snapshot():
+    """全リミッターの現在の状態"""
+    return {limiter.name: limiter.snapshot() for limiter in (fetch_limiter, parse_limiter)}
+
+
+def admission_snapshot():
+    """全リミッターとホストごとの同時取得数の状態（/api/admission）"""
+    return {**snapshot(), 'hosts': host_limiter.snapshot()}
+
+
+def _collect_metrics():
+    """Prometheus 形式のゲージ・カウンター"""
+    gauges = [
+        ('scraper_admission_limit', 'gauge', 'Process-wide concurrency limit', 'limit'),
+        ('scraper_admission_in_flight', 'gauge', 'Slots currently held', 'in_flight'),
+        ('scraper_admission_waiting', 'gauge', 'Callers waiting for a slot', 'waiting'),
+        ('scraper_admission_active_jobs', 'gauge', 'Jobs holding or waiting for a slot', 'active_jobs'),
+        ('scraper_admission_acquired_total', 'counter', 'Slots acquired', 'acquired_total'),
+        ('scraper_admission_wait_seconds_total', 'counter', 'Time spent waiting for a slot', 'wait_seconds_total'),
+    ]
+    states = snapshot()
+    lines = []
+    for name, kind, help_text, key in gauges:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for limiter, state in states.items():
+            lines.append(f'{name}{{limiter="{limiter}"}} {state[key]}')
+    # ホストごとの値はラベルが増え続けるため合計のみ出力
+    hosts = host_limiter.snapshot().values()
+    lines.append('# HELP scraper_host_backoffs_total Per-host concurrency decreases (429/503, timeouts, latency spikes)')
+    lines.append('# TYPE scraper_host_backoffs_total counter')
+    lines.append(f'scraper_host_backoffs_total {sum(host["decreases"] for host in hosts)}')
+    lines.append('# HELP scraper_host_retry_after_seconds_total Time hosts were paused by Retry-After')
+    lines.append('# TYPE scraper_host_retry_after_seconds_total counter')
+    lines.append(f'scraper_host_retry_after_seconds_total {sum(host["retry_after_sec_total"] for host in hosts)}')
+    return lines
+
+
+metrics.register_collector(_collect_metrics)
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+共有の作業キュー（work_queue.WorkQueue）を使った複数プロセス・複数ノードでのクロール
+一覧ページのURLをキューに登録し、任意の数のワーカープロセスがタスクを借りて取得・抽出する。
+一覧ページのタスクを処理したワーカーは find_clinic_links で見つかった店舗ページをタスクとして
+キューに追加し、店舗ページのタスクは他のワーカーにも配られる。抽出結果はキューと同じDBの
+records テーブル（店舗URLが主キー）に保存し、最後に export で CSV / NDJSON に書き出す
+
+処理中のタスクはリースの期限の1/3ごとに期限を延長するため、取得が長引いても他のワーカーには渡らない。
+ワーカーが異常終了した場合、借りていたタスクは期限（--visibility）が切れると他のワーカーが処理する。
+ドメインのブレーカーが開いていて取得しなかったタスクは、試行回数を使わずにブレーカーが閉じる頃まで待たせる
+
+使い方:
+    python distributed_crawl.py seed --queue data/queue.sqlite3 --input urls.txt
+    python distributed_crawl.py work --queue data/queue.sqlite3 --threads 4     # ノード・プロセスごとに起動
+    python distributed_crawl.py status --queue data/queue.sqlite3
+    python distributed_crawl.py export --queue data/queue.sqlite3 --output stores.csv
+"""
+
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import record_stream
+from batch_scrape import format_for, read_urls
+from charset import decode_response
+from clinic_info_scraper import ClinicInfoScraper
+from concurrency import AdmissionCancelled
+from retry import CircuitOpen, breakers
+from scheduler import DomainScheduler
+from scraper_log import get_logger
+from work_queue import DEFAULT_QUEUE_PATH, KIND_LIST, MAX_ATTEMPTS, VISIBILITY_TIMEOUT, WorkQueue
+
+
+# タスクがない間にキューを確認する間隔（秒）
+POLL_SECONDS = 2.0
+
+logger = get_logger(__name__)
+
+
+class Worker:
+    """キューからタスクを借りて取得・抽出するスレッドの集まり（1プロセスに1つ）"""
+
+    def __init__(self, queue, threads=4, interval=1.0, wait=False, owner=None):
+        self.queue = queue
+        self.threads = max(1, threads)
+        self.interval = interval
+        self.wait = wait
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        # このプロセス内の取得はドメインごとに順番に回す
+        self.scheduler = DomainScheduler(self.threads)
+        self.stop_event = threading.Event()
+        self.processed = 0
+        self.failed = 0
+        self.records = 0
+        self.lost = 0
+        self.deferred = 0
+        self._lock = threading.Lock()
+
+    def process(self, scraper, task):
+        """1タスクを取得・抽出し、(店舗情報のリスト, 追加するタスクのリスト) を返す"""
+        job_key = self.owner
+        content = decode_response(scraper.fetch(task['url'], job_key))
+        if task['kind'] == KIND_LIST:
+            page = scraper.process_page(content, task['url'], 'list', job_key)
+            links, info = scraper.split_list_page(page)
+            return [info] if info else [], links
+        info = scraper.process_page(content, task['url'], 'detail', job_key, task['name'])['info']
+        return [info] if info['name'] else [], []
+
+    @contextmanager
+    def _heartbeat(self, task):
+        """処理中のタスクのリースを期限の1/3ごとに延長（リースを失った場合はやめる）"""
+        done = threading.Event()
+
+        def beat():
+            while not done.wait(self.queue.visibility_timeout / 3):
+                if not self.queue.extend(task):
+                    return
+
+        thread = threading.Thread(target=beat, name=f"{threading.current_thread().name}-heartbeat", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            done.set()
+            thread.join()
+
+    def _count(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def _run(self, number):
+        owner = f"{self.owner}:{number}"
+        scraper = ClinicInfoScraper()
+        scraper.cancel_event = self.stop_event
+        scraper.scheduler = self.scheduler
+        while not self.stop_event.is_set():
+            tasks = self.queue.lease(owner)
+            if not tasks:
+                if not self.wait and self.queue.drained():
+                    return
+                # 他のワーカーの処理中のタスク（一覧ページから店舗ページが追加される場合がある）を待つ
+                self.stop_event.wait(POLL_SECONDS)
+                continue
+            task = tasks[0]
+            try:
+                with self._heartbeat(task):
+                    records, new_tasks = self.process(scraper, task)
+            except AdmissionCancelled:
+                # 停止要求。リースは期限切れ後に他のワーカーが処理する
+                return
+            except CircuitOpen as e:
+                # 失敗として数えず、ブレーカーが閉じる頃まで他のワーカーにも渡さない
+                self.queue.defer(task, max(POLL_SECONDS, breakers.retry_in(e.domain)))
+                self._count(deferred=1)
+                continue
+            except Exception as e:
+                logger.warning("task failed %s (attempt %d/%d): %s", task['url'], task['attempts'],
+                               self.queue.max_attempts, e)
+                self.queue.fail(task, e)
+                self._count(failed=1)
+            else:
+                if self.queue.complete(task, records, new_tasks, worker=owner):
+                    self._count(processed=1, records=len(records))
+                else:
+                    logger.warning("lease lost %s (visibility timeout exceeded)", task['url'])
+                    self._count(lost=1)
+            if self.interval:
+                self.stop_event.wait(self.interval)
+
+    def run(self):
+        threads = [threading.Thread(target=self._run, args=(number,), name=f"worker-{number}", daemon=True)
+                   for number in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            self.stop_event.set()
+            for thread in threads:
+                thread.join()
+            raise
+
+
+def seed(args, queue):
+    if args.input == '-':
+        urls = read_urls(sys.stdin)
+    else:
+        with open(args.input, encoding='utf-8') as f:
+            urls = read_urls(f)
+    added = queue.enqueue([{'url': url, 'kind': KIND_LIST, 'source': url} for url in urls])
+    print(f"{added}/{len(urls)} 件の一覧ページを登録しました: {queue.path}")
+
+
+def work(args, queue):
+    worker = Worker(queue, args.threads, args.interval, args.wait)
+    start = time.perf_counter()
+    interrupted = False
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        interrupted = True
+    elapsed = time.perf_counter() - start
+    rate = worker.processed / elapsed if elapsed > 0 else 0.0
+    print(f"{worker.owner}: {worker.processed} 件のタスクを処理、{worker.records} 件の店舗を保存"
+          f"（失敗 {worker.failed} 件、リース切れ {worker.lost} 件、ブレーカーで延期 {worker.deferred} 件、"
+          f"{elapsed:.1f}秒、{rate:.2f}タスク/秒）",
+          file=sys.stderr)
+    if interrupted:
+        sys.exit(130)
+
+
+def status(args, queue):
+    counts = queue.counts()
+    print(' '.join(f"{state}={count}" for state, count in counts.items()))
+    print(f"{'source':<60}{'pending':>9}{'leased':>8}{'done':>8}{'failed':>8}{'records':>9}")
+    for source, entry in sorted(queue.source_counts().items()):
+        print(f"{source:<60}{entry.get('pending', 0):>9}{entry.get('leased', 0):>8}{entry.get('done', 0):>8}"
+              f"{entry.get('failed', 0):>8}{entry['records']:>9}")
+    if args.failed:
+        for task in queue.failed_tasks():
+            print(f"  {task['url']} ({task['kind']}, {task['attempts']}回): {task['error']}")
+
+
+def retry(args, queue):
+    print(f"{queue.retry_failed()} 件の失敗したタスクを未処理に戻しました")
+
+
+def export(args, queue):
+    fmt = format_for(args.output, args.format)
+    # 書き終えてから置き換える（書き出し中に読まれても途中のファイルにならない）
+    temp_path = f"{args.output}.tmp"
+    count = 0
+    with open(temp_path, 'w', encoding='utf-8', newline='') as f:
+        if fmt == 'csv':
+            f.write(record_stream.csv_header())
+        for source, clinic in queue.iter_records():
+            if fmt == 'csv':
+                f.write(record_stream.csv_line(clinic))
+            else:
+                f.write(record_stream.ndjson_line({**record_stream.to_record(clinic), 'source': source}))
+            count += 1
+    os.replace(temp_path, args.output)
+    counts = queue.counts()
+    note = '' if queue.drained() else f"（未完了のタスク {counts['pending'] + counts['leased']} 件）"
+    print(f"{count} 件の店舗を書き出しました: {args.output}{note}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='共有の作業キューを使った複数プロセス・複数ノードでのクロール')
+    parser.add_argument('--queue', default=DEFAULT_QUEUE_PATH, help='作業キューのDB（全ワーカーで共有）')
+    parser.add_argument('--visibility', type=float, default=VISIBILITY_TIMEOUT,
+                        help='タスクのリース期限（秒）。超えると他のワーカーが処理する')
+    parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS, help='タスクを失敗とするまでの試行回数')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('seed', help='一覧ページのURLを登録')
+    command.add_argument('--input', default='-', help='URLリストのファイル（1行に1つ、- で標準入力）')
+    command.set_defaults(func=seed)
+
+    command = commands.add_parser('work', help='タスクを取得・抽出する（キューが空になると終了）')
+    command.add_argument('--threads', type=int, default=4, help='このプロセスで同時に処理するタスクの数')
+    command.add_argument('--interval', type=float, default=1.0, help='スレッドごとのタスクの間隔（秒）')
+    command.add_argument('--wait', action='store_true', help='キューが空になっても終了せず新しいタスクを待つ')
+    command.set_defaults(func=work)
+
+    command = commands.add_parser('status', help='タスクの状態を一覧ページごとに表示')
+    command.add_argument('--failed', action='store_true', help='失敗したタスクとエラーを表示')
+    command.set_defaults(func=status)
+
+    command = commands.add_parser('retry', help='失敗したタスクを未処理に戻す')
+    command.set_defaults(func=retry)
+
+    command = commands.add_parser('export', help='抽出結果を CSV / NDJSON に書き出す')
+    command.add_argument('--output', required=True, help='出力ファイル（.csv または .ndjson）')
+    command.add_argument('--format', choices=('csv', 'ndjson'), help='出力形式（省略時は拡張子から判定）')
+    command.set_defaults(func=export)
+
+    args = parser.parse_args()
+    queue = WorkQueue(args.queue, args.visibility, args.max_attempts)
+    try:
+        args.func(args, queue)
+    finally:
+        queue.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+ページ取得（レスポンス全体の制限時間と本文サイズの上限）
+requests の timeout は接続と1回の読み込みごとの上限のため、少しずつ送り続けるサーバーでは
+1ページの取得がいくらでも長くなる。ここでは本文をストリーミングで読み込み、
+開始からの経過時間（deadline）と受信したバイト数（max_bytes）を確認して上限を超えた時点で打ち切る。
+読み込みを待つ間も締め切りを超えないよう、読み込みごとにソケットのタイムアウトを残り時間に合わせ、
+届いた分だけを返す read1()（urllib3 2.x）で読み込む
+
+本文はヘッダーを確認してから読み込み、Content-Type がHTML以外（PDF・画像など）の応答は本文を受信せずに
+打ち切る。拡張子から明らかにHTMLではないURL（is_binary_url）は店舗リンクの時点で除外する
+
+打ち切った取得は FetchAborted を送出し、理由ごとの件数と直近の打ち切りを snapshot() で取得できる
+"""
+
+import os
+import threading
+import time
+from collections import Counter, deque
+from urllib.parse import urlparse
+
+import metrics
+from page_limits import MAX_HTML_BYTES
+from scraper_log import get_logger
+
+
+# 1ページの取得にかける最大秒数（接続から本文の受信完了まで）
+FETCH_DEADLINE = float(os.environ.get('SCRAPER_FETCH_DEADLINE', '20'))
+
+# 受信する本文の最大サイズ（バイト、デフォルトは解析するHTMLの上限と同じ。0で無制限）
+MAX_BODY_BYTES = int(os.environ.get('SCRAPER_MAX_BODY_BYTES', str(MAX_HTML_BYTES)))
+
+CHUNK_SIZE = 16 * 1024
+
+# 本文を読み込む Content-Type（ヘッダーがない場合も読み込む）
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+
+# HTMLではないファイルの拡張子（店舗リンクから除外し、取得しない）
+BINARY_EXTENSIONS = frozenset([
+    '.pdf', '.jpg', '.jpeg', '.png', '.gif', '.webp', '.avif', '.svg', '.bmp', '.ico', '.tif', '.tiff', '.heic',
+    '.mp4', '.m4v', '.mov', '.avi', '.wmv', '.webm', '.mp3', '.m4a', '.wav',
+    '.zip', '.lzh', '.rar', '.7z', '.gz', '.tar',
+    '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx', '.csv',
+    '.kml', '.kmz', '.ics', '.vcf', '.exe', '.dmg', '.apk',
+    '.css', '.js', '.json', '.xml',
+])
+
+# 打ち切りの理由
+ABORT_DEADLINE = 'deadline'
+ABORT_TOO_LARGE = 'too_large'
+ABORT_NOT_HTML = 'not_html'
+
+logger = get_logger(__name__)
+
+_lock = threading.Lock()
+_aborted = Counter()
+_recent = deque(maxlen=50)
+
+
+class FetchAborted(Exception):
+    """取得を途中で打ち切った（reason に理由）
+
+    retryable: 時間を置けば取得できる可能性があるか（制限時間超過のみ）
+    response: 本文を読まずに打ち切った場合の応答（ステータスとヘッダーのみ）
+    """
+
+    def __init__(self, url, reason, message, retryable=False, response=None):
+        super().__init__(f"{message}: {url}")
+        self.url = url
+        self.reason = reason
+        self.retryable = retryable
+        self.response = response
+
+
+def _abort(url, reason, message, retryable=False, response=None):
+    with _lock:
+        _aborted[reason] += 1
+        _recent.append({'url': url, 'reason': reason, 'message': message, 'at': round(time.time(), 1)})
+    logger.warning("fetch aborted (%s) %s: %s", reason, url, message)
+    return FetchAborted(url, reason, message, retryable, response)
+
+
+def _set_read_timeout(response, seconds):
+    """ストリーミング中の接続のソケットに読み込みのタイムアウトを設定（取得できない場合は何もしない）"""
+    connection = getattr(response.raw, '_connection', None)
+    sock = getattr(connection, 'sock', None)
+    if sock is not None:
+        try:
+            sock.settimeout(max(0.01, seconds))
+        except OSError:
+            pass
+
+
+def _read(raw):
+    """届いている分の本文を読み込む（urllib3 1.x では CHUNK_SIZE まで待つ）"""
+    if hasattr(raw, 'read1'):
+        return raw.read1(CHUNK_SIZE, decode_content=True)
+    return raw.read(CHUNK_SIZE, decode_content=True)
+
+
+def is_binary_url(url):
+    """URLのパスの拡張子から明らかにHTMLではないファイル（PDF・画像など）か"""
+    return os.path.splitext(urlparse(url).path)[1].lower() in BINARY_EXTENSIONS
+
+
+def fetch_page(url, headers=None, timeout=10, deadline=FETCH_DEADLINE, max_bytes=MAX_BODY_BYTES):
+    """url を取得して requests.Response を返す（response.content に本文を読み込み済み）
+
+    timeout は接続・1回の読み込みの上限、deadline は取得全体の上限（秒）。
+    制限時間・本文サイズの上限を超えた場合や、Content-Type がHTMLではない場合は FetchAborted を送出する。
+    ステータスが 400 以上の場合は本文を読まずに返す（呼び出し側で raise_for_status() する）。
+    response.fetch_seconds に本文の受信まで（打ち切った場合は打ち切るまで）の秒数を設定する
+    （stream=True の response.elapsed はヘッダーを受け取るまでの時間のため、少しずつ送るサーバーを捉えられない）
+    """
+    import requests
+    from urllib3.exceptions import ProtocolError, ReadTimeoutError
+
+    started = time.monotonic()
+    deadline_at = started + deadline if deadline else None
+    read_timeout = min(timeout, deadline) if deadline else timeout
+    response = requests.get(url, headers=headers, timeout=(read_timeout, read_timeout), stream=True)
+    try:
+        if response.status_code >= 400:
+            response._content = b''
+            response._content_consumed = True
+            return response
+
+        content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type and content_type not in HTML_CONTENT_TYPES:
+            raise _abort(url, ABORT_NOT_HTML, f"Content-Type {content_type}", response=response)
+
+        length = response.headers.get('Content-Length', '')
+        if max_bytes and length.isdigit() and int(length) > max_bytes:
+            raise _abort(url, ABORT_TOO_LARGE, f"Content-Length {length} > {max_bytes} bytes", response=response)
+
+        body = bytearray()
+        while True:
+            if deadline_at is not None:
+                remaining = deadline_at - time.monotonic()
+                if remaining <= 0:
+                    raise _abort(url, ABORT_DEADLINE, f"{deadline:.0f}秒以内に受信が終わりませんでした（{len(body)} bytes 受信）",
+                                 retryable=True)
+                _set_read_timeout(response, min(read_timeout, remaining))
+            try:
+                chunk = _read(response.raw)
+            except (ReadTimeoutError, ProtocolError) as e:
+                if deadline_at is not None and time.monotonic() >= deadline_at:
+                    raise _abort(url, ABORT_DEADLINE, f"{deadline:.0f}秒以内に受信が終わりませんでした（{len(body)} bytes 受信）",
+                                 retryable=True)
+                # requests の iter_content と同じ例外に変換（再試行の判定に使う）
+                if isinstance(e, ReadTimeoutError):
+                    raise requests.exceptions.ConnectionError(e, request=response.request)
+                raise requests.exceptions.ChunkedEncodingError(e)
+            if not chunk:
+                break
+            body += chunk
+            if max_bytes and len(body) > max_bytes:
+                raise _abort(url, ABORT_TOO_LARGE, f"本文が {max_bytes} bytes を超えました", response=response)
+
+        response._content = bytes(body)
+        response._content_consumed = True
+        return response
+    finally:
+        response.fetch_seconds = time.monotonic() - started
+        response.close()
+
+
+def snapshot():
+    """打ち切った取得の理由ごとの件数と直近の打ち切り"""
+    with _lock:
+        return {'aborted': dict(_aborted), 'recent': list(_recent)}
+
+
+def _collect_metrics():
+    with _lock:
+        counts = dict(_aborted)
+    lines = [
+        '# HELP scraper_fetch_aborted_total Fetches aborted by the response deadline, body size limit or content type',
+        '# TYPE scraper_fetch_aborted_total counter',
+    ]
+    for reason in sorted(set(counts) | {ABORT_DEADLINE, ABORT_TOO_LARGE, ABORT_NOT_HTML}):
+        lines.append(f'scraper_fetch_aborted_total{{reason="{reason}"}} {counts.get(reason, 0)}')
+    return lines
+
+
+metrics.register_collector(_collect_metrics)
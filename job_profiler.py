@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+ジョブ単位のプロファイル取得
+/api/scrape で profile を指定したジョブだけを、そのジョブを実行するスレッド上で計測し、
+cProfile の pstats とサンプリングによる collapsed stack（flamegraph.pl / speedscope 用）を保存する。
+ジョブが起動したスレッド（pipeline.Pipeline のワーカーなど）は JobProfiler.thread() の範囲で
+スレッドごとに計測し、終了時にジョブのプロファイルにまとめる
+
+指定のないジョブでは何も実行しない
+"""
+
+import cProfile
+import os
+import pstats
+import re
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+
+# サンプリング間隔（秒）
+SAMPLE_INTERVAL = float(os.environ.get('SCRAPER_PROFILE_INTERVAL', '0.005'))
+
+# スレッドごとの計測中の JobProfiler
+_local = threading.local()
+
+
+def current():
+    """このスレッドで計測中の JobProfiler（計測していない場合は None）"""
+    return getattr(_local, 'profiler', None)
+
+
+class SamplingProfiler:
+    """対象スレッドのスタックを一定間隔で取得し、collapsed stack 形式で集計する
+
+    add_thread() / remove_thread() で対象のスレッドを増減できる
+    """
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_ids = {thread_id}
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def add_thread(self, thread_id):
+        self.thread_ids = self.thread_ids | {thread_id}
+
+    def remove_thread(self, thread_id):
+        self.thread_ids = self.thread_ids - {thread_id}
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in self.thread_ids:
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(names))] += 1
+                self.samples += 1
+
+    def write_collapsed(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class JobProfiler:
+    """with JobProfiler(job_id, output_dir) as profiler: ... の範囲を計測して保存する
+
+    終了後の files に保存したファイル名（output_dir からの相対パス）が入る
+    """
+
+    def __init__(self, job_id, output_dir, interval=SAMPLE_INTERVAL):
+        self.job_id = re.sub(r'[^A-Za-z0-9_.-]+', '_', str(job_id))
+        self.output_dir = output_dir
+        self.interval = interval
+        self.files = []
+        self._profile = None
+        self._sampler = None
+        self._previous = None
+        self._lock = threading.Lock()
+        self._thread_profiles = []
+
+    def __enter__(self):
+        self._sampler = SamplingProfiler(threading.get_ident(), self.interval)
+        self._sampler.start()
+        self._profile = cProfile.Profile()
+        try:
+            self._profile.enable()
+        except ValueError:
+            # Python 3.12 以降は同時に1つしか有効にできないため、サンプリングのみ取得
+            self._profile = None
+        self._previous = current()
+        _local.profiler = self
+        return self
+
+    @contextmanager
+    def thread(self):
+        """ジョブが起動したスレッドの処理を計測する（ワーカースレッドの中で使う）"""
+        thread_id = threading.get_ident()
+        previous = current()
+        _local.profiler = self
+        self._sampler.add_thread(thread_id)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12 以降はジョブのプロファイルが全スレッドを計測する
+            profile = None
+        try:
+            yield
+        finally:
+            if profile:
+                profile.disable()
+                with self._lock:
+                    self._thread_profiles.append(profile)
+            self._sampler.remove_thread(thread_id)
+            _local.profiler = previous
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._profile:
+            self._profile.disable()
+        self._sampler.stop()
+        _local.profiler = self._previous
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        prefix = f"profile_{self.job_id}"
+        if self._profile:
+            stats = pstats.Stats(self._profile)
+            with self._lock:
+                for profile in self._thread_profiles:
+                    stats.add(profile)
+            stats.dump_stats(os.path.join(self.output_dir, f"{prefix}.pstats"))
+            self.files.append(f"{prefix}.pstats")
+        self._sampler.write_collapsed(os.path.join(self.output_dir, f"{prefix}.collapsed"))
+        self.files.append(f"{prefix}.collapsed")
+        return False
+
+
+def profiled_iter(profiler, iterable):
+    """ジェネレーターの消費中だけ計測する（ストリーミング出力用）"""
+    with profiler:
+        yield from iterable
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+スクレイピングジョブの永続化（SQLite）
+ジョブ情報、未取得の店舗リンク（フロンティア）、抽出済みレコードを保存し、
+再起動後に未完了のジョブを最後のチェックポイントから再開できるようにする
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+DEFAULT_DB_PATH = os.environ.get('SCRAPER_JOB_DB', os.path.join('data', 'jobs.sqlite3'))
+
+# ジョブの状態
+STATUS_RUNNING = 'running'
+STATUS_COMPLETED = 'completed'
+STATUS_FAILED = 'failed'
+STATUS_CANCELLED = 'cancelled'
+
+# フロンティアの各リンクの状態
+LINK_PENDING = 'pending'
+LINK_DONE = 'done'
+LINK_FAILED = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status TEXT NOT NULL,
+    frontier_saved INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS frontier (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    name TEXT NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (job_id, url)
+);
+CREATE TABLE IF NOT EXISTS records (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (job_id, url)
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status);
+"""
+
+
+class JobStore:
+    """SQLiteによるジョブのチェックポイント保存"""
+
+    def __init__(self, path=None):
+        self.path = path or DEFAULT_DB_PATH
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(SCHEMA)
+
+    def _execute(self, sql, params=()):
+        with self._lock, self._conn:
+            return self._conn.execute(sql, params).fetchall()
+
+    # ジョブ
+    def create_job(self, job_id, url):
+        """ジョブを登録（既に存在する場合は何もしない）"""
+        now = time.time()
+        self._execute(
+            'INSERT OR IGNORE INTO jobs (job_id, url, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+            (job_id, url, STATUS_RUNNING, now, now)
+        )
+
+    def finish_job(self, job_id, status, result=None):
+        """ジョブの最終状態と結果を保存"""
+        self._execute(
+            'UPDATE jobs SET status = ?, result = ?, updated_at = ? WHERE job_id = ?',
+            (status, json.dumps(result, ensure_ascii=False) if result is not None else None, time.time(), job_id)
+        )
+
+    def get_job(self, job_id):
+        rows = self._execute('SELECT * FROM jobs WHERE job_id = ?', (job_id,))
+        if not rows:
+            return None
+        job = dict(rows[0])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def incomplete_jobs(self):
+        """実行中のまま終了したジョブを古い順に返す"""
+        rows = self._execute('SELECT job_id, url FROM jobs WHERE status = ? ORDER BY created_at', (STATUS_RUNNING,))
+        return [dict(row) for row in rows]
+
+    # フロンティア
+    def has_frontier(self, job_id):
+        """一覧ページの解析が済んでいるか（リンクが0件の場合も含む）"""
+        rows = self._execute('SELECT frontier_saved FROM jobs WHERE job_id = ?', (job_id,))
+        return bool(rows and rows[0]['frontier_saved'])
+
+    def save_frontier(self, job_id, links):
+        """一覧ページから見つかった店舗リンクを保存"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO frontier (job_id, seq, url, name, state) VALUES (?, ?, ?, ?, ?)',
+                [(job_id, i, link['url'], link.get('name', ''), LINK_PENDING) for i, link in enumerate(links)]
+            )
+            self._conn.execute(
+                'UPDATE jobs SET frontier_saved = 1, updated_at = ? WHERE job_id = ?',
+                (time.time(), job_id)
+            )
+
+    def pending_links(self, job_id):
+        rows = self._execute(
+            'SELECT url, name FROM frontier WHERE job_id = ? AND state = ? ORDER BY seq',
+            (job_id, LINK_PENDING)
+        )
+        return [dict(row) for row in rows]
+
+    def frontier_size(self, job_id):
+        rows = self._execute('SELECT COUNT(*) AS n FROM frontier WHERE job_id = ?', (job_id,))
+        return rows[0]['n']
+
+    # レコード
+    def save_record(self, job_id, record):
+        """抽出したレコードを保存"""
+        with self._lock, self._conn:
+            self._save_record(job_id, record)
+
+    def _save_record(self, job_id, record):
+        seq = self._conn.execute('SELECT COUNT(*) FROM records WHERE job_id = ?', (job_id,)).fetchone()[0]
+        self._conn.execute(
+            'INSERT OR REPLACE INTO records (job_id, seq, url, data) VALUES (?, ?, ?, ?)',
+            (job_id, seq, record['url'], json.dumps(record, ensure_ascii=False))
+        )
+
+    def complete_link(self, job_id, url, record=None, state=LINK_DONE):
+        """リンクを処理済みにし、抽出結果があれば同じトランザクションで保存"""
+        with self._lock, self._conn:
+            if record is not None:
+                self._save_record(job_id, record)
+            self._conn.execute(
+                'UPDATE frontier SET state = ? WHERE job_id = ? AND url = ?',
+                (state, job_id, url)
+            )
+            self._conn.execute('UPDATE jobs SET updated_at = ? WHERE job_id = ?', (time.time(), job_id))
+
+    def load_records(self, job_id):
+        rows = self._execute('SELECT data FROM records WHERE job_id = ? ORDER BY seq', (job_id,))
+        return [json.loads(row['data']) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
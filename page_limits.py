@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+ページ単位のメモリ管理
+HTMLのサイズと要素数に上限を設け、巨大なページは解析せずに飛ばす。
+バイト列は charset.decode_html で文字列にしてから解析する（BeautifulSoup に文字コードを推定させない）。
+解析したツリーは抽出が終わった時点で decompose() し、GCを待たずに解放する
+
+SCRAPER_MEMORY_DIAGNOSTICS=1 の場合は tracemalloc でページごとのピーク割り当て量を記録する
+（tracemalloc の計測はプロセス全体のため、正確な値は1ジョブずつ実行して確認する）
+"""
+
+import os
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import metrics
+from charset import decode_html
+from metrics import timer
+from scraper_log import get_logger
+
+
+# 解析するHTMLの最大サイズ（バイト）
+MAX_HTML_BYTES = int(os.environ.get('SCRAPER_MAX_HTML_BYTES', str(5 * 1024 * 1024)))
+
+# 解析するHTMLの最大要素数（開始タグ数で見積もる）
+MAX_NODES = int(os.environ.get('SCRAPER_MAX_NODES', '50000'))
+
+MEMORY_DIAGNOSTICS = os.environ.get('SCRAPER_MEMORY_DIAGNOSTICS') == '1'
+
+# ページごとのピーク割り当て量のバケット境界（バイト）
+PEAK_BUCKETS = tuple(kb * 1024 for kb in (64, 256, 1024, 4096, 16384, 65536, 262144))
+
+logger = get_logger(__name__)
+
+page_peak_histogram = metrics.Histogram(
+    'scraper_page_peak_bytes', 'Peak traced allocation while parsing and extracting a page', 'stage', PEAK_BUCKETS)
+
+_skipped_lock = threading.Lock()
+_skipped = {'bytes': 0, 'nodes': 0}
+
+
+class PageTooLarge(Exception):
+    """HTMLのサイズまたは要素数が上限を超えている"""
+
+
+def estimate_nodes(content):
+    """開始タグの数から要素数を見積もる（解析せずに数える）"""
+    if isinstance(content, str):
+        return content.count('<') - content.count('</') - content.count('<!')
+    return content.count(b'<') - content.count(b'</') - content.count(b'<!')
+
+
+def check_page(content, url):
+    """上限を超えるページは PageTooLarge を送出する（文字列の場合は文字数をサイズとみなす）"""
+    reason = None
+    if MAX_HTML_BYTES and len(content) > MAX_HTML_BYTES:
+        reason = 'bytes'
+        message = f"HTMLのサイズが上限を超えています（{len(content)} > {MAX_HTML_BYTES} bytes）: {url}"
+    elif MAX_NODES:
+        nodes = estimate_nodes(content)
+        if nodes > MAX_NODES:
+            reason = 'nodes'
+            message = f"HTMLの要素数が上限を超えています（約{nodes} > {MAX_NODES}）: {url}"
+    if reason:
+        with _skipped_lock:
+            _skipped[reason] += 1
+        raise PageTooLarge(message)
+
+
+@contextmanager
+def parsed_page(content, url, stage='page'):
+    """上限を確認してから解析し、範囲を抜けたらツリーを解放する
+
+    with parsed_page(decode_response(response), url) as soup:
+        info = extract(soup)
+    """
+    # bs4 は初回の解析時に読み込む（api/app.py のコールドスタートを短くするため）
+    from bs4 import BeautifulSoup
+
+    check_page(content, url)
+    if isinstance(content, bytes):
+        with timer('decode'):
+            content = decode_html(content, urlparse(url).netloc)[0]
+    baseline = _start_tracking() if MEMORY_DIAGNOSTICS else None
+    soup = None
+    try:
+        with timer('parse'):
+            soup = BeautifulSoup(content, 'html.parser')
+        yield soup
+    finally:
+        if soup is not None:
+            soup.decompose()
+        if baseline is not None:
+            _record_peak(baseline, url, stage)
+
+
+def _start_tracking():
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def _record_peak(baseline, url, stage):
+    peak = max(0, tracemalloc.get_traced_memory()[1] - baseline)
+    page_peak_histogram.observe(stage, peak)
+    logger.info("page memory stage=%s peak_kb=%.1f url=%s", stage, peak / 1024, url)
+
+
+def skipped_counts():
+    with _skipped_lock:
+        return dict(_skipped)
+
+
+def _collect_metrics():
+    lines = [
+        "# HELP scraper_pages_skipped_total Pages skipped because they exceeded the size or node cap",
+        "# TYPE scraper_pages_skipped_total counter"
+    ]
+    for reason, count in skipped_counts().items():
+        lines.append(f'scraper_pages_skipped_total{{reason="{reason}"}} {count}')
+    if MEMORY_DIAGNOSTICS:
+        lines.extend(page_peak_histogram.render())
+    return lines
+
+
+metrics.register_collector(_collect_metrics)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+解析・抽出のプロセスプール
+BeautifulSoup の解析と抽出はCPU処理でGILを保持するため、同じプロセス内では取得スレッドを増やしても
+同時に解析できるページは増えない。SCRAPER_PARSE_PROCESSES を指定すると、取得スレッドはHTMLのバイト列を
+子プロセスに渡し、子プロセスで解析・抽出した結果の辞書（店舗情報・店舗リンク）と処理時間だけを受け取る。
+解析ツリーはプロセス間で受け渡さない
+
+SCRAPER_PARSE_PROCESSES=0（デフォルト）の場合は呼び出したスレッドで解析・抽出する
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+from metrics import timer
+from page_limits import check_page, parsed_page
+from scraper_log import get_logger
+
+
+def _processes_from_env():
+    value = os.environ.get('SCRAPER_PARSE_PROCESSES', '0')
+    if value == 'auto':
+        return os.cpu_count() or 2
+    return int(value)
+
+
+# 解析・抽出に使う子プロセス数（0 で呼び出したスレッドで実行、auto でCPUコア数）
+PARSE_PROCESSES = _processes_from_env()
+
+logger = get_logger(__name__)
+
+
+def process_page(scraper, content, url, kind, link_name=''):
+    """HTMLを解析して抽出結果だけを返す
+
+    kind='list' の場合は {'info': 店舗情報, 'links': 店舗リンク}、'detail' の場合は {'info': 店舗情報}
+    """
+    with parsed_page(content, url, kind) as soup:
+        result = {}
+        if kind == 'list':
+            with timer('find_links'):
+                result['links'] = scraper.find_clinic_links(soup, url)
+        with timer('extract'):
+            result['info'] = scraper.extract_clinic_info(soup, url, link_name)
+    return result
+
+
+# 子プロセスごとのスクレイパー（抽出メソッドを上書きしたサブクラスごとに1つ）
+_worker_scrapers = {}
+
+
+def _process_in_worker(scraper_class, content, url, kind, link_name):
+    scraper = _worker_scrapers.get(scraper_class)
+    if scraper is None:
+        scraper = _worker_scrapers[scraper_class] = scraper_class()
+    with metrics.capture_stages() as observations:
+        result = process_page(scraper, content, url, kind, link_name)
+    result['stages'] = observations
+    return result
+
+
+class ParsePool:
+    """解析・抽出を子プロセスで実行する（子プロセスは最初の呼び出し時に起動）"""
+
+    def __init__(self, processes=PARSE_PROCESSES):
+        self.processes = max(0, processes)
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # 取得スレッドが動いているプロセスで fork しないよう spawn で起動する
+                self._executor = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context('spawn'))
+                logger.info("parse pool started processes=%d", self.processes)
+            return self._executor
+
+    def process(self, scraper, content, url, kind, link_name=''):
+        """process_page() を子プロセスで実行（processes=0 の場合はこのスレッドで実行）
+
+        子プロセスでは type(scraper) のインスタンスで抽出するため、抽出メソッドの上書きは有効だが
+        インスタンスの状態は引き継がない
+        """
+        if not self.processes:
+            return process_page(scraper, content, url, kind, link_name)
+        # サイズ・要素数の上限は送る前に確認する（除外したページ数をこのプロセスで数えるため）
+        check_page(content, url)
+        executor = self._get_executor()
+        try:
+            result = executor.submit(_process_in_worker, type(scraper), content, url, kind, link_name).result()
+        except BrokenProcessPool:
+            # 子プロセスが異常終了した場合は次の呼び出しで作り直す
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False)
+            raise
+        metrics.record_stages(result.pop('stages'))
+        return result
+
+    def resize(self, processes):
+        """子プロセス数を変更（実行中の子プロセスは処理中のページを終えてから終了）"""
+        self.shutdown()
+        self.processes = max(0, processes)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+parse_pool = ParsePool()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+上限付きキューでつないだ段階的な処理（discover → fetch → extract → sink）
+各ステージは指定した数のワーカースレッドで動き、次のステージのキューが一杯の間は待つ（背圧）。
+遅いステージがあっても他のステージは自分のキューが空になるか一杯になるまで処理を続けるため、
+ネットワーク待ちとCPU処理が重なる
+
+ステージごとに処理件数・失敗件数・処理時間（busy）・キューの深さ（現在値と最大値）・
+次のキューへの投入待ち時間を集計し、snapshot() で取得できる
+
+プロファイルを取得中のジョブ（job_profiler.JobProfiler）から run() した場合は、ワーカースレッドも計測する
+
+使い方:
+    pipe = Pipeline('job-1', cancel_event)
+    pipe.add_stage('fetch', fetch_link, workers=2)
+    pipe.add_stage('extract', extract_page, workers=2)
+    pipe.run(links, sink=record)   # sink は呼び出したスレッドで1件ずつ実行
+"""
+
+import os
+import queue
+import threading
+import time
+
+import job_profiler
+from scraper_log import get_logger
+
+
+# scrape_clinics のステージごとのデフォルトのワーカー数
+FETCH_WORKERS = int(os.environ.get('SCRAPER_FETCH_WORKERS', '1'))
+EXTRACT_WORKERS = int(os.environ.get('SCRAPER_EXTRACT_WORKERS', '1'))
+
+# ステージ間のキューの長さ（超えると前のステージが待つ）
+QUEUE_SIZE = int(os.environ.get('SCRAPER_PIPELINE_QUEUE', '8'))
+
+logger = get_logger(__name__)
+
+# ワーカーの終了を次のステージに伝える印
+_DONE = object()
+
+
+class StageStats:
+    """1ステージの集計（ワーカーから更新される）"""
+
+    def __init__(self, name, workers, input_queue=None):
+        self.name = name
+        self.workers = workers
+        self.input_queue = input_queue
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.put_wait_seconds = 0.0
+        self.max_queue_depth = 0
+        self._lock = threading.Lock()
+
+    def record(self, busy, failed=False):
+        with self._lock:
+            self.busy_seconds += busy
+            if failed:
+                self.failed += 1
+            else:
+                self.processed += 1
+
+    def record_put(self, waited):
+        with self._lock:
+            self.put_wait_seconds += waited
+
+    def record_depth(self, depth):
+        with self._lock:
+            if depth > self.max_queue_depth:
+                self.max_queue_depth = depth
+
+    def snapshot(self, elapsed):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'processed': self.processed,
+                'failed': self.failed,
+                'busy_sec': round(self.busy_seconds, 3),
+                # ワーカーが処理中だった時間の割合（1 に近いステージが律速）
+                'utilization': round(self.busy_seconds / (elapsed * self.workers), 3) if elapsed > 0 else 0.0,
+                'put_wait_sec': round(self.put_wait_seconds, 3),
+                'queue_depth': self.input_queue.qsize() if self.input_queue is not None else 0,
+                'max_queue_depth': self.max_queue_depth
+            }
+
+
+class Pipeline:
+    """上限付きキューでつないだステージをワーカースレッドで実行する"""
+
+    def __init__(self, name, cancel_event=None, queue_size=QUEUE_SIZE):
+        self.name = name
+        self.cancel_event = cancel_event or threading.Event()
+        self.queue_size = max(1, queue_size)
+        self._stages = []
+        self._stats = {}
+        self._stop = threading.Event()
+        self._started = None
+        self._finished = None
+
+    def add_stage(self, name, func, workers=1, on_error=None):
+        """func(item) の戻り値を次のステージに渡す
+
+        func が例外を送出した項目は次のステージに渡さず、on_error(item, exc) を呼ぶ（省略時はログのみ）
+        """
+        self._stages.append((name, func, max(1, workers), on_error))
+        return self
+
+    @property
+    def stopping(self):
+        return self._stop.is_set() or self.cancel_event.is_set()
+
+    def _put(self, stats, next_stats, out_queue, item):
+        start = time.perf_counter()
+        out_queue.put(item)
+        stats.record_put(time.perf_counter() - start)
+        next_stats.record_depth(out_queue.qsize())
+
+    def _discover(self, source, stats, next_stats, out_queue, next_workers):
+        try:
+            iterator = iter(source)
+            while not self.stopping:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                stats.record(time.perf_counter() - start)
+                self._put(stats, next_stats, out_queue, item)
+        except Exception as e:
+            logger.warning("pipeline %s discover failed: %s", self.name, e)
+            self._stop.set()
+        finally:
+            for _ in range(next_workers):
+                out_queue.put(_DONE)
+
+    def _work(self, name, func, on_error, stats, next_stats, in_queue, out_queue, remaining, next_workers):
+        try:
+            while True:
+                item = in_queue.get()
+                if item is _DONE:
+                    break
+                # キャンセル後は残りの項目を処理せずに読み捨てる
+                if self.stopping:
+                    continue
+                start = time.perf_counter()
+                try:
+                    result = func(item)
+                except Exception as e:
+                    stats.record(time.perf_counter() - start, failed=True)
+                    if on_error:
+                        on_error(item, e)
+                    else:
+                        logger.warning("pipeline %s stage %s failed: %s", self.name, name, e)
+                    continue
+                stats.record(time.perf_counter() - start)
+                self._put(stats, next_stats, out_queue, result)
+        finally:
+            # 最後に終了したワーカーが次のステージに終了を伝える
+            with remaining['lock']:
+                remaining['count'] -= 1
+                last = remaining['count'] == 0
+            if last:
+                for _ in range(next_workers):
+                    out_queue.put(_DONE)
+
+    @staticmethod
+    def _profiled(profiler, target, *args):
+        with profiler.thread():
+            target(*args)
+
+    def _thread(self, profiler, name, target, args):
+        if profiler is not None:
+            target, args = self._profiled, (profiler, target) + args
+        return threading.Thread(target=target, name=name, daemon=True, args=args)
+
+    def run(self, source, sink):
+        """source の各項目をステージに流し、最後のステージの結果を sink(result) に渡す
+
+        sink が例外を送出した場合は残りの処理を止めてから送出する
+        """
+        queues = [queue.Queue(self.queue_size) for _ in range(len(self._stages) + 1)]
+        worker_counts = [workers for _, _, workers, _ in self._stages] + [1]
+        # ステージの集計（queue_depth / max_queue_depth はそのステージの入力キュー）
+        stats = [StageStats('discover', 1)]
+        stats += [StageStats(name, workers, queues[index]) for index, (name, _, workers, _) in enumerate(self._stages)]
+        stats.append(StageStats('sink', 1, queues[-1]))
+        self._stats = {stage.name: stage for stage in stats}
+
+        profiler = job_profiler.current()
+        threads = [self._thread(profiler, f"{self.name}-discover", self._discover,
+                                (source, stats[0], stats[1], queues[0], worker_counts[0]))]
+        for index, (name, func, workers, on_error) in enumerate(self._stages):
+            remaining = {'count': workers, 'lock': threading.Lock()}
+            for number in range(workers):
+                threads.append(self._thread(
+                    profiler, f"{self.name}-{name}-{number}", self._work,
+                    (name, func, on_error, stats[index + 1], stats[index + 2], queues[index], queues[index + 1],
+                     remaining, worker_counts[index + 1])))
+        sink_stats = stats[-1]
+
+        self._started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                result = queues[-1].get()
+                if result is _DONE:
+                    break
+                start = time.perf_counter()
+                sink(result)
+                sink_stats.record(time.perf_counter() - start)
+        except BaseException:
+            # 残りのワーカーが投入待ちで止まらないよう最後のキューを読み捨てる
+            self._stop.set()
+            while queues[-1].get() is not _DONE:
+                pass
+            raise
+        finally:
+            for thread in threads:
+                thread.join()
+            self._finished = time.perf_counter()
+            logger.info("pipeline %s finished %s", self.name, self.format_summary())
+
+    def elapsed(self):
+        if self._started is None:
+            return 0.0
+        return (self._finished or time.perf_counter()) - self._started
+
+    def snapshot(self):
+        """ステージ名 -> 集計（実行中も取得できる）"""
+        elapsed = self.elapsed()
+        return {name: stats.snapshot(elapsed) for name, stats in self._stats.items()}
+
+    def format_summary(self):
+        parts = []
+        for name, stats in self.snapshot().items():
+            parts.append(f"{name}[n={stats['processed']} fail={stats['failed']} busy={stats['busy_sec']}s "
+                         f"util={stats['utilization']} maxq={stats['max_queue_depth']}]")
+        return ' '.join(parts)
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+正規表現ごとのコスト計測
+抽出モジュール（universal_scraper / clinic_info_scraper）が参照する re モジュールと
+patterns のコンパイル済みパターンを計測用の代理オブジェクトに差し替え、パターンごとの呼び出し回数・合計時間・マッチ数・
+最悪ケース（最も遅かった1回の時間と入力）を集計してランキングを出力する
+
+差し替えは profile_modules() の範囲内のみで、それ以外の処理には影響しない
+
+使い方:
+    python regex_profile.py https://dioclinic.jp/clinic/ --limit 20
+    python benchmarks/bench_extraction.py --regex-profile
+"""
+
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import re
+import sys
+import threading
+import time
+
+
+DEFAULT_MODULES = ('universal_scraper', 'clinic_info_scraper')
+
+# 読み込み時に正規表現をまとめてコンパイルするモジュール
+DEFAULT_PATTERN_MODULES = ('patterns',)
+
+# 最悪ケースとして保存する入力の先頭文字数
+SAMPLE_CHARS = 120
+
+
+class RegexProfiler:
+    """パターンごとの計測結果を集計する"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, pattern, flags, op, caller, text, elapsed, matches):
+        key = (pattern, flags)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = {
+                    'pattern': pattern,
+                    'flags': flags,
+                    'calls': 0,
+                    'total_sec': 0.0,
+                    'matches': 0,
+                    'max_sec': 0.0,
+                    'max_input_len': 0,
+                    'max_input_sample': '',
+                    'ops': set(),
+                    'callers': set()
+                }
+            stats['calls'] += 1
+            stats['total_sec'] += elapsed
+            stats['matches'] += matches
+            stats['ops'].add(op)
+            stats['callers'].add(caller)
+            if elapsed > stats['max_sec']:
+                stats['max_sec'] = elapsed
+                stats['max_input_len'] = len(text) if isinstance(text, str) else 0
+                stats['max_input_sample'] = text[:SAMPLE_CHARS] if isinstance(text, str) else ''
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def report(self, limit=None):
+        """合計時間の降順に並べたパターンごとの集計結果"""
+        with self._lock:
+            entries = []
+            for stats in self._stats.values():
+                entries.append({
+                    'pattern': stats['pattern'],
+                    'flags': stats['flags'],
+                    'calls': stats['calls'],
+                    'total_ms': round(stats['total_sec'] * 1000, 3),
+                    'mean_us': round(stats['total_sec'] / stats['calls'] * 1e6, 1),
+                    'max_ms': round(stats['max_sec'] * 1000, 3),
+                    'matches': stats['matches'],
+                    'max_input_len': stats['max_input_len'],
+                    'max_input_sample': stats['max_input_sample'],
+                    'ops': sorted(stats['ops']),
+                    'callers': sorted(stats['callers'])
+                })
+        entries.sort(key=lambda entry: entry['total_ms'], reverse=True)
+        return entries[:limit] if limit else entries
+
+    def format_report(self, limit=20):
+        return format_report(self.report(), limit)
+
+
+def format_report(entries, limit=20):
+    """report() の結果を表形式の文字列にする"""
+    total_ms = sum(entry['total_ms'] for entry in entries)
+    lines = [
+        f"正規表現の計測結果（{len(entries)}パターン、合計 {total_ms:.1f}ms）",
+        f"{'#':>3} {'total ms':>10} {'share':>6} {'calls':>7} {'mean us':>9} {'max ms':>9} {'matches':>8}  pattern / callers"
+    ]
+    for rank, entry in enumerate(entries[:limit] if limit else entries, 1):
+        share = entry['total_ms'] / total_ms * 100 if total_ms else 0.0
+        pattern = entry['pattern'] if len(entry['pattern']) <= 80 else entry['pattern'][:77] + '...'
+        lines.append(f"{rank:>3} {entry['total_ms']:>10.2f} {share:>5.1f}% {entry['calls']:>7} "
+                     f"{entry['mean_us']:>9.1f} {entry['max_ms']:>9.2f} {entry['matches']:>8}  {pattern}")
+        lines.append(f"{'':>57}  {', '.join(entry['callers'])}（最悪ケースの入力長: {entry['max_input_len']}）")
+    return '\n'.join(lines)
+
+
+def _pattern_key(pattern, flags):
+    # str のパターンはコンパイル時に re.UNICODE が付くため、呼び出し方によらず同じキーにする
+    if isinstance(pattern, re.Pattern):
+        return pattern.pattern, pattern.flags & ~re.UNICODE
+    return pattern, int(flags) & ~re.UNICODE
+
+
+def _count_matches(op, result):
+    if result is None:
+        return 0
+    if op in ('findall', 'finditer'):
+        return len(result)
+    if op == 'split':
+        return len(result) - 1
+    if op == 'subn':
+        return result[1]
+    return 1
+
+
+class _Recorder:
+    """呼び出しを計測して RegexProfiler に記録する"""
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+
+    def call(self, op, pattern, flags, text, func):
+        caller = sys._getframe(2)
+        start = time.perf_counter()
+        result = func()
+        if op == 'finditer':
+            # 遅延評価されるため、マッチをすべて取り出すまでを計測
+            result = list(result)
+        elapsed = time.perf_counter() - start
+        key, key_flags = _pattern_key(pattern, flags)
+        self.profiler.record(key, key_flags, op, f"{caller.f_globals.get('__name__')}.{caller.f_code.co_name}",
+                             text, elapsed, _count_matches(op, result))
+        return iter(result) if op == 'finditer' else result
+
+
+class _ProfiledPattern:
+    """re.compile() の結果を包み、メソッド呼び出しを計測する"""
+
+    def __init__(self, compiled, recorder):
+        self._compiled = compiled
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        return getattr(self._compiled, name)
+
+    def search(self, string, *args):
+        return self._recorder.call('search', self._compiled, 0, string, lambda: self._compiled.search(string, *args))
+
+    def match(self, string, *args):
+        return self._recorder.call('match', self._compiled, 0, string, lambda: self._compiled.match(string, *args))
+
+    def fullmatch(self, string, *args):
+        return self._recorder.call('fullmatch', self._compiled, 0, string, lambda: self._compiled.fullmatch(string, *args))
+
+    def findall(self, string, *args):
+        return self._recorder.call('findall', self._compiled, 0, string, lambda: self._compiled.findall(string, *args))
+
+    def finditer(self, string, *args):
+        return self._recorder.call('finditer', self._compiled, 0, string, lambda: self._compiled.finditer(string, *args))
+
+    def split(self, string, maxsplit=0):
+        return self._recorder.call('split', self._compiled, 0, string, lambda: self._compiled.split(string, maxsplit))
+
+    def sub(self, repl, string, count=0):
+        return self._recorder.call('subn', self._compiled, 0, string,
+                                   lambda: self._compiled.subn(repl, string, count))[0]
+
+    def subn(self, repl, string, count=0):
+        return self._recorder.call('subn', self._compiled, 0, string, lambda: self._compiled.subn(repl, string, count))
+
+
+class _ProfiledRe:
+    """対象モジュールの re を置き換える代理オブジェクト（定数などは本物の re を参照）"""
+
+    def __init__(self, profiler):
+        self._recorder = _Recorder(profiler)
+
+    def __getattr__(self, name):
+        return getattr(re, name)
+
+    def search(self, pattern, string, flags=0):
+        return self._recorder.call('search', pattern, flags, string, lambda: re.search(pattern, string, flags))
+
+    def match(self, pattern, string, flags=0):
+        return self._recorder.call('match', pattern, flags, string, lambda: re.match(pattern, string, flags))
+
+    def fullmatch(self, pattern, string, flags=0):
+        return self._recorder.call('fullmatch', pattern, flags, string, lambda: re.fullmatch(pattern, string, flags))
+
+    def findall(self, pattern, string, flags=0):
+        return self._recorder.call('findall', pattern, flags, string, lambda: re.findall(pattern, string, flags))
+
+    def finditer(self, pattern, string, flags=0):
+        return self._recorder.call('finditer', pattern, flags, string, lambda: re.finditer(pattern, string, flags))
+
+    def split(self, pattern, string, maxsplit=0, flags=0):
+        return self._recorder.call('split', pattern, flags, string, lambda: re.split(pattern, string, maxsplit, flags))
+
+    def sub(self, pattern, repl, string, count=0, flags=0):
+        return self._recorder.call('subn', pattern, flags, string,
+                                   lambda: re.subn(pattern, repl, string, count, flags))[0]
+
+    def subn(self, pattern, repl, string, count=0, flags=0):
+        return self._recorder.call('subn', pattern, flags, string, lambda: re.subn(pattern, repl, string, count, flags))
+
+    def compile(self, pattern, flags=0):
+        return _ProfiledPattern(re.compile(pattern, flags), self._recorder)
+
+
+def _wrap_compiled(value, recorder):
+    """コンパイル済みのパターン（リストや (パターン, 信頼度) の中にあるものも含む）を計測用に包む"""
+    if isinstance(value, re.Pattern):
+        return _ProfiledPattern(value, recorder)
+    if isinstance(value, list):
+        return [_wrap_compiled(item, recorder) for item in value]
+    if isinstance(value, tuple):
+        return tuple(_wrap_compiled(item, recorder) for item in value)
+    return value
+
+
+@contextlib.contextmanager
+def profile_modules(profiler, modules=DEFAULT_MODULES, pattern_modules=DEFAULT_PATTERN_MODULES):
+    """範囲内で modules の re を計測用に差し替える（モジュール名またはモジュールオブジェクト）
+
+    pattern_modules（読み込み時にパターンをコンパイルするモジュール）はコンパイル済みのパターンを
+    包んだものに属性を差し替える。それ以外のモジュールで読み込み時にコンパイルしたパターンは対象外
+    """
+    targets = [importlib.import_module(module) if isinstance(module, str) else module for module in modules]
+    pattern_targets = [importlib.import_module(module) if isinstance(module, str) else module
+                       for module in pattern_modules]
+    proxy = _ProfiledRe(profiler)
+    originals = [(module, 're', module.re) for module in targets if hasattr(module, 're')]
+    for module in pattern_targets:
+        for name, value in list(vars(module).items()):
+            if name.startswith('_') or name == 're':
+                continue
+            wrapped = _wrap_compiled(value, proxy._recorder)
+            if wrapped != value:
+                originals.append((module, name, value))
+                setattr(module, name, wrapped)
+    for module in targets:
+        if hasattr(module, 're'):
+            module.re = proxy
+    try:
+        yield profiler
+    finally:
+        for module, name, original in originals:
+            setattr(module, name, original)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='クロール中の正規表現ごとのコストを計測')
+    parser.add_argument('url', help='店舗一覧ページまたは店舗ページのURL')
+    parser.add_argument('--limit', type=int, default=20, help='表示するパターン数')
+    parser.add_argument('--interval', type=float, default=1.0, help='店舗ページ取得の間隔（秒）')
+    parser.add_argument('--output', help='全パターンの集計結果をJSONで保存')
+    args = parser.parse_args()
+
+    from clinic_info_scraper import ClinicInfoScraper
+
+    scraper = ClinicInfoScraper()
+    scraper.request_interval = args.interval
+    profiler = RegexProfiler()
+    with profile_modules(profiler), contextlib.redirect_stdout(io.StringIO()):
+        scraper.scrape_clinics(args.url)
+
+    print(f"取得店舗数: {len(scraper.clinic_data)}\n")
+    print(profiler.format_report(args.limit))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(profiler.report(), f, ensure_ascii=False, indent=2)
+        print(f"\n結果を保存しました: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+ドメインごとの公平な取得スケジューラー
+取得要求をドメイン（ホスト）ごとの待ち行列に並べ、全体の同時取得数の上限内で
+ドメインを順番に回して枠を渡す（deficit round robin）。店舗数の多いチェーンの取得が
+待ち行列を埋めていても、店舗数の少ないチェーンは自分の番に1件ずつ取得できる
+
+ドメインごとに重み（1回りで渡す枠の数）を設定でき、取得の完了件数から求めた
+ドメインごとのスループットと、残りページ数を渡した場合の完了見込み時刻を snapshot() で取得できる
+
+使い方:
+    scheduler = DomainScheduler(limit=16)
+    with scheduler.slot('example.com', cancel_event):
+        response = requests.get(url)
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from concurrency import AdmissionCancelled
+
+
+# スループットの計算に使う直近の時間（秒）
+RATE_WINDOW_SECONDS = 60.0
+
+
+class _Waiter:
+    __slots__ = ('granted',)
+
+    def __init__(self):
+        self.granted = False
+
+
+class _Domain:
+    """1ドメインの待ち行列と集計"""
+
+    def __init__(self, weight=1.0):
+        self.weight = weight
+        self.deficit = 0.0
+        self.waiters = deque()
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_seconds = 0.0
+        self.first_started = None
+        self.last_finished = None
+        # 直近 RATE_WINDOW_SECONDS 秒に完了した時刻
+        self.recent = deque()
+
+    def rate(self, now):
+        """ページ/秒（直近の完了件数から。直近に完了がなければ開始からの平均）
+
+        待ち・取得中の要求がないドメインは最後に完了した時点までで計算する
+        """
+        while self.recent and now - self.recent[0] > RATE_WINDOW_SECONDS:
+            self.recent.popleft()
+        end = now if self.waiters or self.in_flight else (self.last_finished or now)
+        if len(self.recent) >= 2:
+            span = max(end - self.recent[0], 1e-6)
+            return len(self.recent) / span
+        if self.first_started is None or not self.completed:
+            return 0.0
+        return self.completed / max((self.last_finished or now) - self.first_started, 1e-6)
+
+
+class DomainScheduler:
+    """ドメインごとの待ち行列を重み付きで順番に回し、全体の同時取得数を limit 以下に保つ"""
+
+    def __init__(self, limit=16):
+        self.limit = max(1, limit)
+        self._cond = threading.Condition()
+        self._domains = {}
+        # 待っている要求のあるドメイン（先頭から順に枠を渡す）
+        self._ring = OrderedDict()
+        self._in_flight = 0
+
+    def set_weight(self, domain, weight):
+        """1回りでこのドメインに渡す枠の数（デフォルト1）"""
+        with self._cond:
+            self._domain(domain).weight = max(0.01, float(weight))
+
+    def _domain(self, domain):
+        state = self._domains.get(domain)
+        if state is None:
+            state = self._domains[domain] = _Domain()
+        return state
+
+    def _dispatch(self):
+        """空いている枠を待っているドメインに順番に渡す（_cond を保持して呼ぶ）"""
+        granted = False
+        while self._in_flight < self.limit and self._ring:
+            domain = next(iter(self._ring))
+            state = self._domains[domain]
+            if state.deficit < 1:
+                state.deficit += state.weight
+            if state.deficit >= 1:
+                waiter = state.waiters.popleft()
+                waiter.granted = True
+                state.deficit -= 1
+                state.in_flight += 1
+                self._in_flight += 1
+                granted = True
+            if not state.waiters:
+                # 待ちがなくなったドメインは持ち越しを捨てて外す
+                state.deficit = 0.0
+                del self._ring[domain]
+            elif state.deficit < 1:
+                # このドメインの番は終わり。末尾に回す
+                self._ring.move_to_end(domain)
+        if granted:
+            self._cond.notify_all()
+
+    def acquire(self, domain, cancel_event=None):
+        start = time.monotonic()
+        waiter = _Waiter()
+        with self._cond:
+            state = self._domain(domain)
+            state.waiters.append(waiter)
+            self._ring.setdefault(domain, None)
+            self._dispatch()
+            while not waiter.granted:
+                if cancel_event is not None and cancel_event.is_set():
+                    state.waiters.remove(waiter)
+                    if not state.waiters:
+                        state.deficit = 0.0
+                        self._ring.pop(domain, None)
+                    raise AdmissionCancelled(domain)
+                self._cond.wait(0.5)
+            now = time.monotonic()
+            state.wait_seconds += now - start
+            if state.first_started is None:
+                state.first_started = now
+
+    def release(self, domain, failed=False):
+        with self._cond:
+            state = self._domains[domain]
+            state.in_flight -= 1
+            self._in_flight -= 1
+            now = time.monotonic()
+            state.last_finished = now
+            if failed:
+                state.failed += 1
+            else:
+                state.completed += 1
+                state.recent.append(now)
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, domain, cancel_event=None):
+        """domain の順番が来るまで待ってから枠を1つ確保して処理を実行"""
+        self.acquire(domain, cancel_event)
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self.release(domain, failed)
+
+    def snapshot(self, remaining=None):
+        """ドメイン -> 集計
+
+        remaining（ドメイン -> 残りページ数）を渡すと、現在のスループットから求めた
+        残り時間（eta_sec）と完了見込み時刻（eta_at、UNIX時刻）を含める
+        """
+        remaining = remaining or {}
+        with self._cond:
+            now = time.monotonic()
+            wall = time.time()
+            result = {}
+            for domain, state in self._domains.items():
+                rate = state.rate(now)
+                entry = {
+                    'weight': state.weight,
+                    'queued': len(state.waiters),
+                    'in_flight': state.in_flight,
+                    'completed': state.completed,
+                    'failed': state.failed,
+                    'pages_per_sec': round(rate, 3),
+                    'wait_sec': round(state.wait_seconds, 3)
+                }
+                if domain in remaining:
+                    left = remaining[domain]
+                    entry['remaining'] = left
+                    eta = left / rate if rate > 0 else None
+                    entry['eta_sec'] = round(eta, 1) if eta is not None else None
+                    entry['eta_at'] = round(wall + eta, 1) if eta is not None else None
+                result[domain] = entry
+            return result
+
+    def format_report(self, remaining=None):
+        """ドメインごとの1行の要約（スループットの高い順）"""
+        lines = []
+        snapshot = self.snapshot(remaining)
+        for domain, entry in sorted(snapshot.items(), key=lambda item: -item[1]['pages_per_sec']):
+            line = (f"{domain}: {entry['completed']}件完了 失敗{entry['failed']} 待ち{entry['queued']} "
+                    f"取得中{entry['in_flight']} {entry['pages_per_sec']:.2f}ページ/秒")
+            if 'remaining' in entry:
+                eta = entry['eta_sec']
+                line += f" 残り{entry['remaining']}件" + (f" 約{eta:.0f}秒" if eta is not None else '')
+            lines.append(line)
+        return lines
@@ -1,6 +1,7 @@
 // クリニック店舗情報スクレイパー メインスクリプト
 
 let currentSessionId = null;
+let currentRequesterId = null;
 let progressInterval = null;
 
 // フォーム送信処理
@@ -31,6 +32,7 @@ document.getElementById('scrapeForm').addEventListener('submit', async (e) => {
         
         if (data.success) {
             currentSessionId = data.session_id;
+            currentRequesterId = data.requester_id;
             showProgressArea();
             startProgressTracking();
         } else {
@@ -45,6 +47,39 @@ document.getElementById('scrapeForm').addEventListener('submit', async (e) => {
     }
 });
 
+// キャンセル処理（取得済みの店舗情報はCSVに保存される）
+document.getElementById('cancelBtn').addEventListener('click', async () => {
+    if (!currentSessionId) return;
+    
+    const cancelBtn = document.getElementById('cancelBtn');
+    cancelBtn.disabled = true;
+    cancelBtn.innerHTML = '<span class="spinner-border spinner-border-sm me-2"></span>キャンセル中...';
+    
+    try {
+        const response = await fetch(`/api/cancel/${currentSessionId}`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ requester_id: currentRequesterId })
+        });
+        const data = await response.json();
+        
+        if (!data.success) {
+            console.error('キャンセルエラー:', data.error);
+        } else if (data.detached) {
+            // 同じURLを取得中の他の利用者がいるため、この画面だけ追跡をやめる
+            clearInterval(progressInterval);
+            progressInterval = null;
+            currentSessionId = null;
+            currentRequesterId = null;
+            showCancelled();
+        }
+    } catch (error) {
+        console.error('キャンセルエラー:', error);
+    }
+});
+
 // 進捗状況を追跡
 function startProgressTracking() {
     progressInterval = setInterval(async () => {
@@ -152,6 +187,8 @@ function showResult(result) {
     if (clinicCount === 0) {
         console.error('⚠️ WARNING: clinic_count is 0! Full result:', JSON.stringify(result, null, 2));
         resultMessage.innerHTML = `<strong>警告:</strong> ${clinicCount} 件の店舗情報を取得しました！<br><small class="text-muted">${debugInfo}</small><br><small class="text-warning">完全なレスポンス: ${JSON.stringify(result)}</small>`;
+    } else if (result.cancelled) {
+        resultMessage.textContent = `キャンセルしました。取得済みの ${clinicCount} 件の店舗情報を保存しました。`;
     } else {
         console.log(`✅ SUCCESS: Showing ${clinicCount} stores`);
         resultMessage.textContent = `${clinicCount} 件の店舗情報を取得しました！`;
@@ -177,6 +214,19 @@ function showResult(result) {
     cleanupOldFiles();
 }
 
+// 追跡をやめたことを表示（ジョブは他の利用者のために続行）
+function showCancelled() {
+    const resultArea = document.getElementById('resultArea');
+    const resultMessage = document.getElementById('resultMessage');
+    const downloadBtn = document.getElementById('downloadBtn');
+    
+    resultMessage.textContent = 'キャンセルしました。同じURLを取得中の他の利用者がいるため、処理は続行されます。';
+    downloadBtn.style.display = 'none';
+    
+    hideProgressArea();
+    resultArea.style.display = 'block';
+}
+
 // エラーを表示
 function showError(message) {
     const errorArea = document.getElementById('errorArea');
@@ -210,6 +260,11 @@ function resetUI() {
     progressBar.style.width = '0%';
     progressText.textContent = '0%';
     
+    // キャンセルボタンをリセット
+    const cancelBtn = document.getElementById('cancelBtn');
+    cancelBtn.disabled = false;
+    cancelBtn.innerHTML = '<i class="bi bi-x-circle"></i> キャンセル';
+    
     // インターバルをクリア
     if (progressInterval) {
         clearInterval(progressInterval);
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Vercel用API（api/app.py）の /api/scrape のテスト（ローカルのHTTPサーバーを使うためネットワーク不要）
+取得を打ち切った理由がエラーメッセージで分かること、再試行の待ち時間や Retry-After によるホストの停止で
+実行時間の上限を超えないことを確認する
+
+使い方:
+    python -m pytest -q test_api_scrape.py
+"""
+
+import importlib.util
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+import retry
+from stub_site import StubChainSite, StubConfig
+
+# ルートの app.py と区別するため、別のモジュール名で読み込む
+_spec = importlib.util.spec_from_file_location(
+    'api_app', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api', 'app.py'))
+api_app = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(api_app)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        status, content_type = self.server.reply
+        body = b'%PDF-1.4' if content_type == 'application/pdf' else b''
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _start_server(status, content_type):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    server.reply = (status, content_type)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/"
+
+
+def test_not_html_page_returns_reason():
+    server, url = _start_server(200, 'application/pdf')
+    try:
+        response = api_app.app.test_client().post('/api/scrape', json={'url': url}).get_json()
+    finally:
+        server.shutdown()
+    assert response == {'success': False, 'error': api_app.ABORT_MESSAGES['not_html']}
+
+
+def test_retry_backoff_is_capped_by_request_budget(monkeypatch):
+    server, url = _start_server(503, 'text/html')
+    monkeypatch.setattr(api_app, 'REQUEST_BUDGET', 2)
+    # 上限がなければ再試行ごとに10秒待つ
+    monkeypatch.setattr(retry, 'backoff_delay', lambda attempt: 10)
+    try:
+        started = time.monotonic()
+        response = api_app.app.test_client().post('/api/scrape', json={'url': url}).get_json()
+        elapsed = time.monotonic() - started
+    finally:
+        server.shutdown()
+    assert response['success'] is False
+    assert elapsed < 3
+
+
+def test_retry_after_beyond_budget_fails_fast(monkeypatch):
+    # 常に 429 / 503 + Retry-After: 12 を返すサイト
+    site = StubChainSite(StubConfig(branches=5, error_rate=1.0, retry_after=12, seed=1)).start()
+    monkeypatch.setattr(api_app, 'REQUEST_BUDGET', 3)
+    try:
+        started = time.monotonic()
+        response = api_app.app.test_client().post('/api/scrape', json={'url': site.list_url}).get_json()
+        elapsed = time.monotonic() - started
+    finally:
+        site.stop()
+    assert response['success'] is False
+    assert 'アクセス制限' in response['error']
+    assert elapsed < 3
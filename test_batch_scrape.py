@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+URLリストの一括取得（batch_scrape）の出力のテスト
+中断で途中まで書かれた最後の行の店舗が、--resume で再び書き出されることを確認する
+
+使い方:
+    python -m pytest -q test_batch_scrape.py
+"""
+
+import csv
+import json
+import os
+import tempfile
+
+import record_stream
+from batch_scrape import RecordWriter
+
+
+def _clinic(number):
+    return {
+        'name': f'渋谷{number}号院',
+        'address': f'東京都渋谷区神南1-2-{number}',
+        'access': '渋谷駅から徒歩5分',
+        'url': f'https://example.com/clinic/{number}/'
+    }
+
+
+def test_resume_rewrites_truncated_csv_row():
+    path = os.path.join(tempfile.mkdtemp(), 'stores.csv')
+    writer = RecordWriter(path, 'csv')
+    writer.write(_clinic(1), 'https://example.com/')
+    writer.write(_clinic(2), 'https://example.com/')
+    writer.close()
+    # URL列まで書いたところで中断（行末の改行がない）
+    with open(path, 'a', encoding='utf-8', newline='') as f:
+        f.write(record_stream.csv_line(_clinic(3)).rstrip('\r\n'))
+
+    writer = RecordWriter(path, 'csv', resume=True)
+    assert not writer.write(_clinic(1), 'https://example.com/')
+    assert writer.write(_clinic(3), 'https://example.com/')
+    writer.close()
+
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        urls = [row['URL'] for row in csv.DictReader(f)]
+    assert urls == [_clinic(number)['url'] for number in (1, 2, 3)]
+
+
+def test_resume_rewrites_truncated_ndjson_line():
+    path = os.path.join(tempfile.mkdtemp(), 'stores.ndjson')
+    writer = RecordWriter(path, 'ndjson')
+    writer.write(_clinic(1), 'https://example.com/')
+    writer.close()
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(record_stream.ndjson_line(record_stream.to_record(_clinic(2))).rstrip('\n'))
+
+    writer = RecordWriter(path, 'ndjson', resume=True)
+    assert writer.write(_clinic(2), 'https://example.com/')
+    writer.close()
+
+    with open(path, encoding='utf-8') as f:
+        urls = [json.loads(line)['url'] for line in f]
+    assert urls == [_clinic(number)['url'] for number in (1, 2)]
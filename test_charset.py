@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+HTMLの文字コードの判定（charset）のテスト
+同じドメインに Shift_JIS（cp932）と UTF-8 のページが混在していても、宣言のない UTF-8 のページが
+ドメインの判定結果で化けないことを確認する
+
+使い方:
+    python -m pytest -q test_charset.py
+"""
+
+import charset
+
+
+def _page(text):
+    return f'<html><body><h1>{text}</h1></body></html>'
+
+
+def test_utf8_page_is_not_decoded_with_cached_domain_encoding():
+    domain = 'mixed.example.com'
+    text, encoding = charset.decode_html(_page('渋谷院のご案内').encode('cp932'), domain)
+    assert (text, encoding) == (_page('渋谷院のご案内'), 'cp932')
+
+    # この UTF-8 のバイト列は cp932 としてもデコードできる（「譁ｰ螳ｿ髯｢」に化ける）
+    content = _page('東京都 新宿院').encode('utf-8')
+    assert content.decode('cp932') != _page('東京都 新宿院')
+    assert charset.decode_html(content, domain) == (_page('東京都 新宿院'), 'utf-8')
+
+
+def test_cached_domain_encoding_resolves_euc_jp():
+    domain = 'euc.example.com'
+    page = _page('池袋院のご案内')
+    assert charset.decode_html(page.encode('euc_jp'), domain) == (page, 'euc_jp')
+    before = charset.snapshot()['resolved'].get(charset.SOURCE_CACHE, 0)
+    assert charset.decode_html(page.encode('euc_jp'), domain) == (page, 'euc_jp')
+    assert charset.snapshot()['resolved'][charset.SOURCE_CACHE] == before + 1
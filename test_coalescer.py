@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+同一URLの要求の集約とキャンセルのテスト（スタブサイトを使うためネットワーク不要）
+同じジョブに合流した要求元の1つがキャンセルしても、他の要求元が残っている間はジョブを止めないことを確認する
+再起動前にキャンセルしたジョブの進捗が「キャンセル」として返ることも確認する
+
+使い方:
+    python -m pytest -q test_coalescer.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+os.environ.setdefault('SCRAPER_JOB_DB', os.path.join(tempfile.mkdtemp(), 'jobs.sqlite3'))
+
+from coalescer import RequestCoalescer
+from stub_site import StubChainSite, StubConfig
+
+
+def test_detach_counts_each_requester_once():
+    coalescer = RequestCoalescer()
+    job_id, coalesced, first = coalescer.attach_or_start('http://example.com/clinic/', lambda: 'job-1')
+    assert (job_id, coalesced) == ('job-1', False)
+    job_id, coalesced, second = coalescer.attach_or_start('http://EXAMPLE.com/clinic', lambda: 'job-2')
+    assert (job_id, coalesced) == ('job-1', True)
+    assert first != second
+
+    assert coalescer.detach('job-1', first) is False
+    # 同じ要求元のキャンセルの繰り返しや不明なトークンでは、残っている要求元のジョブを止めない
+    assert coalescer.detach('job-1', first) is False
+    assert coalescer.detach('job-1', None) is False
+    assert coalescer.detach('job-1', second) is True
+    # 最後の要求元が外れたジョブには合流しない
+    assert coalescer.attach_or_start('http://example.com/clinic/', lambda: 'job-3')[:2] == ('job-3', False)
+    # 合流の対象ではないジョブ
+    assert coalescer.detach('unknown', None) is True
+
+
+def test_resumed_job_is_not_counted_as_requester():
+    coalescer = RequestCoalescer()
+    assert coalescer.attach_or_start('http://example.com/', lambda: 'job-1', attach=False) == ('job-1', False, None)
+    job_id, coalesced, token = coalescer.attach_or_start('http://example.com/', lambda: 'job-2')
+    assert (job_id, coalesced) == ('job-1', True)
+    assert coalescer.detach('job-1', token) is True
+
+
+def test_cancel_by_one_of_two_clients_keeps_job_running(monkeypatch):
+    import app
+
+    monkeypatch.chdir(tempfile.mkdtemp())
+    os.makedirs('downloads')
+    site = StubChainSite(StubConfig(branches=40, latency_ms=50)).start()
+    try:
+        client = app.app.test_client()
+        first = client.post('/api/scrape', json={'url': site.list_url}).get_json()
+        second = client.post('/api/scrape', json={'url': site.list_url}).get_json()
+        assert second['session_id'] == first['session_id']
+        assert second['coalesced'] is True
+        session_id = first['session_id']
+        scraper = app.scrapers[session_id]
+
+        # 1つ目の要求元がキャンセルを2回押しても、2つ目の要求元のジョブは止まらない
+        for _ in range(2):
+            response = client.post(f'/api/cancel/{session_id}',
+                                   json={'requester_id': first['requester_id']}).get_json()
+            assert response == {'success': True, 'cancelled': False, 'detached': True}
+            assert not scraper.cancelled
+
+        response = client.post(f'/api/cancel/{session_id}', json={'requester_id': second['requester_id']}).get_json()
+        assert response == {'success': True, 'cancelled': True}
+        assert scraper.cancelled
+
+        deadline = time.monotonic() + 30
+        while not client.get(f'/api/progress/{session_id}').get_json()['completed']:
+            assert time.monotonic() < deadline
+            time.sleep(0.1)
+        assert app.scrapers[session_id]['result']['cancelled'] is True
+    finally:
+        site.stop()
+
+
+def test_restored_cancelled_job_reports_cancelled():
+    import app
+    from job_store import STATUS_CANCELLED
+
+    # 再起動前にキャンセルされたジョブ（このプロセスの scrapers にはない）
+    app.job_store.create_job('restored-1', 'http://example.com/')
+    app.job_store.finish_job('restored-1', STATUS_CANCELLED, {'success': True, 'cancelled': True, 'clinic_count': 2})
+    progress = app.app.test_client().get('/api/progress/restored-1').get_json()
+    assert progress['status'] == 'キャンセル'
+    assert progress['completed'] is True
+    assert progress['clinic_count'] == 2
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+ホストごとの同時取得数の調整（concurrency.AdaptiveHostLimiter）のテスト（スタブサイトを使うためネットワーク不要）
+ヘッダーはすぐに返し本文を少しずつ送るホストでも、応答時間の急増として同時取得数を減らすことを確認する
+
+使い方:
+    python -m pytest -q test_concurrency.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+from concurrency import AdaptiveHostLimiter
+from fetcher import fetch_page
+from stub_site import StubChainSite, StubConfig
+
+
+def test_slow_body_counts_as_latency_spike():
+    site = StubChainSite(StubConfig(branches=5, slow_body_seconds=1.0)).start()
+    limiter = AdaptiveHostLimiter(initial=4)
+    host = site.base_url.split('//', 1)[1]
+    try:
+        # 平常時の応答時間を覚える
+        for _ in range(3):
+            with limiter.slot(site.list_url) as slot:
+                slot.response = fetch_page(site.list_url)
+        assert limiter.snapshot()[host]['decreases'] == 0
+
+        site.config.slow_body_rate = 1.0
+        with limiter.slot(site.list_url) as slot:
+            slot.response = fetch_page(site.list_url)
+        assert slot.latency >= 0.9
+        assert slot.response.elapsed.total_seconds() < 0.5
+    finally:
+        site.stop()
+    state = limiter.snapshot()[host]
+    assert state['decreases'] == 1
+    assert state['limit'] < 4
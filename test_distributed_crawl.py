@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+共有の作業キューを使ったクロール（distributed_crawl）のテスト（ネットワーク不要）
+リースの期限より長くかかるタスクも、処理中は期限が延長されて他のワーカーに渡らないことを確認する
+
+使い方:
+    python -m pytest -q test_distributed_crawl.py
+"""
+
+import os
+import tempfile
+import threading
+import time
+
+from distributed_crawl import Worker
+from work_queue import KIND_DETAIL, WorkQueue
+
+
+def test_heartbeat_keeps_slow_task_leased():
+    queue = WorkQueue(os.path.join(tempfile.mkdtemp(), 'queue.sqlite3'), visibility_timeout=0.3)
+    url = 'https://example.com/clinic/1/'
+    queue.enqueue([{'url': url, 'kind': KIND_DETAIL, 'source': 'https://example.com/'}])
+    worker = Worker(queue, threads=1, interval=0)
+    stolen = []
+
+    def process(scraper, task):
+        # リースの期限（0.3秒）を何度も超える間、他のワーカーが借りられないか確かめる
+        deadline = time.monotonic() + 1.2
+        while time.monotonic() < deadline:
+            stolen.extend(queue.lease('other'))
+            time.sleep(0.05)
+        return [{'name': '渋谷院', 'url': url}], []
+
+    worker.process = process
+    # 他のワーカーが借りたまま完了しないタスクがあると終わらないため、待つ時間に上限を設ける
+    thread = threading.Thread(target=worker.run, daemon=True)
+    thread.start()
+    thread.join(10)
+    worker.stop_event.set()
+
+    assert stolen == []
+    assert (worker.processed, worker.lost) == (1, 0)
+    assert [clinic['url'] for _, clinic in queue.iter_records()] == [url]
+    queue.close()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+ジョブ単位のプロファイルのテスト（スタブサイトを使うためネットワーク不要）
+店舗ページの取得・抽出は Pipeline のワーカースレッドで実行されるため、
+それらの関数がプロファイルに含まれることを確認する
+
+使い方:
+    python -m pytest -q test_job_profiler.py
+"""
+
+import os
+import pstats
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+from clinic_info_scraper import ClinicInfoScraper
+from job_profiler import JobProfiler
+from stub_site import StubChainSite, StubConfig
+
+
+def test_profile_includes_pipeline_workers():
+    site = StubChainSite(StubConfig(branches=6, latency_ms=20)).start()
+    try:
+        scraper = ClinicInfoScraper()
+        scraper.request_interval = 0
+        with tempfile.TemporaryDirectory() as output_dir:
+            # サンプリング間隔を短くして、ワーカーのスタックを確実に拾う
+            with JobProfiler('test', output_dir, interval=0.001) as profiler:
+                assert scraper.scrape_clinics(site.list_url)
+            assert len(scraper.clinic_data) == 6
+
+            stats = pstats.Stats(os.path.join(output_dir, 'profile_test.pstats'))
+            functions = {name for _, _, name in stats.stats}
+            assert 'fetch_link' in functions
+            assert 'extract_link' in functions
+            calls = {name: entry[1] for (_, _, name), entry in stats.stats.items()}
+            assert calls['fetch_link'] == 6
+
+            with open(os.path.join(output_dir, 'profile_test.collapsed'), encoding='utf-8') as f:
+                collapsed = f.read()
+            assert ':fetch_link' in collapsed
+            assert ':extract_link' in collapsed
+            assert profiler.files == ['profile_test.pstats', 'profile_test.collapsed']
+    finally:
+        site.stop()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+店舗レコードのストリーミング出力（record_stream）のテスト
+途中で取得に失敗した出力が、完全な出力と区別できることを確認する
+
+使い方:
+    python -m pytest -q test_record_stream.py
+"""
+
+import csv
+import io
+import json
+
+import record_stream
+
+
+def _clinics(fail):
+    yield {'name': '渋谷院', 'address': '東京都渋谷区神南1-2-3', 'url': 'https://example.com/clinic/1/'}
+    if fail:
+        raise RuntimeError('接続が切れました')
+
+
+def test_iter_csv_ends_with_error_row_on_failure():
+    rows = list(csv.reader(io.StringIO(''.join(record_stream.iter_csv(_clinics(True), bom=False)))))
+    assert rows[0] == record_stream.FIELDNAMES
+    assert rows[1][0] == '渋谷院'
+    assert rows[-1] == ['# error: 接続が切れました（1件取得済み）']
+
+    rows = list(csv.reader(io.StringIO(''.join(record_stream.iter_csv(_clinics(False), bom=False)))))
+    assert len(rows) == 2
+    assert not rows[-1][0].startswith('# error:')
+
+
+def test_iter_ndjson_ends_with_error_line_on_failure():
+    lines = [json.loads(line) for line in record_stream.iter_ndjson(_clinics(True))]
+    assert [line['type'] for line in lines] == ['store', 'error']
+    assert lines[-1]['clinic_count'] == 1
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+ドメインごとの取得スケジューラーのテスト（ローカルのHTTPサーバーを使うためネットワーク不要）
+Retry-After で止まっているホストへの取得がスケジューラーの枠を持ったまま待ち、
+他のドメインの取得を止めないことを確認する
+
+使い方:
+    python -m pytest -q test_scheduler.py
+"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from clinic_info_scraper import ClinicInfoScraper
+from scheduler import DomainScheduler
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.server.busy:
+            self.send_response(429)
+            self.send_header('Retry-After', '5')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = '<html><body><h1>渋谷院</h1></body></html>'.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _start_server(busy):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    server.busy = busy
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def test_blocked_host_does_not_hold_scheduler_slots():
+    blocked_server, blocked = _start_server(busy=True)
+    healthy_server, healthy = _start_server(busy=False)
+    scraper = ClinicInfoScraper()
+    scraper.scheduler = DomainScheduler(limit=1)
+    waiters = []
+    try:
+        # 429 + Retry-After でホストを5秒間止める
+        try:
+            scraper._request(f"{blocked}/clinic/0", 'test')
+        except Exception as e:
+            assert e.response.status_code == 429
+
+        def wait_blocked(number):
+            try:
+                scraper.fetch(f"{blocked}/clinic/{number}", 'test')
+            except Exception:
+                pass
+
+        waiters = [threading.Thread(target=wait_blocked, args=(number,)) for number in (1, 2)]
+        for thread in waiters:
+            thread.start()
+        time.sleep(0.3)
+
+        # 止まっているホストの取得が待っている間も、他のドメインは枠を受け取れる
+        start = time.monotonic()
+        for number in range(4):
+            response = scraper.fetch(f"{healthy}/clinic/{number}", 'test')
+            assert response.status_code == 200
+        assert time.monotonic() - start < 2.0
+        assert scraper.scheduler.snapshot().get(blocked[len('http://'):], {}).get('in_flight', 0) == 0
+    finally:
+        scraper.cancel_event.set()
+        for thread in waiters:
+            thread.join()
+        blocked_server.shutdown()
+        healthy_server.shutdown()
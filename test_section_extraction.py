@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+汎用抽出（universal_scraper）のセクション単位の再抽出のテスト（ネットワーク不要）
+セクションの抽出で例外が発生しても、解析し直したセクションの木を解放することを確認する
+
+使い方:
+    python -m pytest -q test_section_extraction.py
+"""
+
+import pytest
+from bs4 import BeautifulSoup
+
+from universal_scraper import UniversalStoreScraper
+
+
+def test_section_soup_is_released_when_extraction_fails(monkeypatch):
+    scraper = UniversalStoreScraper()
+    extractor = scraper.intelligent_extractor
+    soup = BeautifulSoup('<html><body><div class="shop-info"><p>営業時間 10:00〜19:00</p></div></body></html>',
+                         'html.parser')
+    original = extractor.extract_all_info
+    sections = []
+
+    def extract_all_info(section_soup, url):
+        if section_soup is soup:
+            result = original(section_soup, url)
+            # 信頼度が低い場合にセクションごとに抽出し直す
+            result['confidence_scores']['overall'] = 0
+            return result
+        sections.append(section_soup)
+        raise RuntimeError('抽出に失敗しました')
+
+    monkeypatch.setattr(extractor, 'extract_all_info', extract_all_info)
+    monkeypatch.setattr(extractor.structural_analyzer, 'find_info_sections',
+                        lambda page: [{'element': page.find('div')}])
+    with pytest.raises(RuntimeError):
+        scraper.extract_store_info(soup, 'https://example.com/shop/1/')
+
+    assert len(sections) == 1
+    assert sections[0].decomposed
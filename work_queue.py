@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+複数プロセス・複数ノードで共有する作業キュー（SQLite）
+店舗一覧ページと店舗ページのURLをタスクとして保存し、ワーカーはタスクを期限付きで借りる（リース）。
+期限（visibility timeout）までに完了しなかったタスクは他のワーカーが再び借りられる。
+完了時はリースの識別子を確認してから、抽出結果を共有の records テーブルに店舗URLを主キーとして
+同じトランザクションで保存するため、同じ店舗が重複して出力されることはない（期限切れ後に
+元のワーカーが完了しようとした場合は拒否される）
+
+複数ノードで共有する場合は、SQLiteのファイルロックが正しく動作する共有ストレージに置く
+（NFS などロックが不完全なファイルシステムは不可）
+
+使い方:
+    queue = WorkQueue('data/queue.sqlite3')
+    queue.enqueue([{'url': list_url, 'kind': KIND_LIST, 'source': list_url}])
+    for task in queue.lease('worker-1', limit=1):
+        ...
+        queue.complete(task, record)
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+
+DEFAULT_QUEUE_PATH = os.environ.get('SCRAPER_QUEUE_DB', os.path.join('data', 'queue.sqlite3'))
+
+# リースの期限（秒）
+VISIBILITY_TIMEOUT = float(os.environ.get('SCRAPER_QUEUE_VISIBILITY', '120'))
+
+# タスクを失敗とするまでの試行回数
+MAX_ATTEMPTS = int(os.environ.get('SCRAPER_QUEUE_MAX_ATTEMPTS', '3'))
+
+# タスクの種類
+KIND_LIST = 'list'
+KIND_DETAIL = 'detail'
+
+# タスクの状態
+TASK_PENDING = 'pending'
+TASK_LEASED = 'leased'
+TASK_DONE = 'done'
+TASK_FAILED = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    url TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    source TEXT NOT NULL,
+    name TEXT NOT NULL DEFAULT '',
+    state TEXT NOT NULL,
+    lease_id TEXT,
+    lease_owner TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS records (
+    url TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    data TEXT NOT NULL,
+    worker TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_state ON tasks (state, lease_until);
+"""
+
+
+class WorkQueue:
+    """SQLiteによるリース付きの作業キューと共有の抽出結果"""
+
+    def __init__(self, path=None, visibility_timeout=VISIBILITY_TIMEOUT, max_attempts=MAX_ATTEMPTS):
+        self.path = path or DEFAULT_QUEUE_PATH
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max(1, max_attempts)
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        # 他のプロセスが書き込み中の場合は timeout 秒まで待つ。トランザクションは明示的に開始する
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(SCHEMA)
+
+    def _transaction(self, func):
+        """書き込みロックを取ってから func(conn) を実行（BEGIN IMMEDIATE）"""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = func(self._conn)
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+            return result
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def enqueue(self, tasks):
+        """タスク（url, kind, source, name）を追加（同じURLが既にある場合は追加しない）。追加した件数を返す"""
+        now = time.time()
+        rows = [(task['url'], task.get('kind', KIND_DETAIL), task.get('source') or task['url'],
+                 task.get('name', ''), TASK_PENDING, now, now) for task in tasks]
+
+        def insert(conn):
+            before = conn.total_changes
+            conn.executemany(
+                'INSERT OR IGNORE INTO tasks (url, kind, source, name, state, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            return conn.total_changes - before
+        return self._transaction(insert)
+
+    def lease(self, owner, limit=1, visibility_timeout=None):
+        """未処理または期限切れのタスクを最大 limit 件借りる
+
+        一覧ページのタスクを先に渡す（店舗ページのタスクを早く増やして他のワーカーに配る）
+        """
+        timeout = self.visibility_timeout if visibility_timeout is None else visibility_timeout
+
+        def take(conn):
+            now = time.time()
+            rows = conn.execute(
+                'SELECT url, kind, source, name, attempts FROM tasks '
+                'WHERE state = ? OR (state = ? AND lease_until < ?) '
+                'ORDER BY kind = ? DESC, created_at LIMIT ?',
+                (TASK_PENDING, TASK_LEASED, now, KIND_LIST, limit)
+            ).fetchall()
+            tasks = []
+            for row in rows:
+                task = dict(row)
+                task['attempts'] += 1
+                task['lease_id'] = uuid.uuid4().hex
+                conn.execute(
+                    'UPDATE tasks SET state = ?, lease_id = ?, lease_owner = ?, lease_until = ?, attempts = ?, '
+                    'updated_at = ? WHERE url = ?',
+                    (TASK_LEASED, task['lease_id'], owner, now + timeout, task['attempts'], now, task['url'])
+                )
+                tasks.append(task)
+            return tasks
+        return self._transaction(take)
+
+    def extend(self, task, visibility_timeout=None):
+        """リースの期限を延長（リースを失っていた場合は False）"""
+        timeout = self.visibility_timeout if visibility_timeout is None else visibility_timeout
+
+        def update(conn):
+            now = time.time()
+            cursor = conn.execute(
+                'UPDATE tasks SET lease_until = ?, updated_at = ? WHERE url = ? AND lease_id = ? AND state = ?',
+                (now + timeout, now, task['url'], task['lease_id'], TASK_LEASED)
+            )
+            return cursor.rowcount == 1
+        return self._transaction(update)
+
+    def complete(self, task, records=(), new_tasks=(), worker=''):
+        """タスクを完了にし、抽出結果と見つかったタスクを同じトランザクションで保存
+
+        リースを失っていた場合（期限切れ後に他のワーカーが借りた場合など）は何も保存せず False を返す
+        """
+        def finish(conn):
+            now = time.time()
+            cursor = conn.execute(
+                'UPDATE tasks SET state = ?, lease_id = NULL, error = NULL, updated_at = ? '
+                'WHERE url = ? AND lease_id = ? AND state = ?',
+                (TASK_DONE, now, task['url'], task['lease_id'], TASK_LEASED)
+            )
+            if cursor.rowcount != 1:
+                return False
+            conn.executemany(
+                'INSERT OR IGNORE INTO records (url, source, data, worker, created_at) VALUES (?, ?, ?, ?, ?)',
+                [(record['url'], task['source'], json.dumps(record, ensure_ascii=False), worker, now)
+                 for record in records]
+            )
+            conn.executemany(
+                'INSERT OR IGNORE INTO tasks (url, kind, source, name, state, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(new['url'], new.get('kind', KIND_DETAIL), task['source'], new.get('name', ''), TASK_PENDING, now, now)
+                 for new in new_tasks]
+            )
+            return True
+        return self._transaction(finish)
+
+    def fail(self, task, error):
+        """タスクの失敗を記録（試行回数が max_attempts 未満なら未処理に戻す）"""
+        def update(conn):
+            now = time.time()
+            state = TASK_FAILED if task['attempts'] >= self.max_attempts else TASK_PENDING
+            cursor = conn.execute(
+                'UPDATE tasks SET state = ?, lease_id = NULL, error = ?, updated_at = ? '
+                'WHERE url = ? AND lease_id = ? AND state = ?',
+                (state, str(error)[:500], now, task['url'], task['lease_id'], TASK_LEASED)
+            )
+            return cursor.rowcount == 1
+        return self._transaction(update)
+
+    def defer(self, task, delay):
+        """リースを返し、試行回数を使わずに delay 秒後まで他のワーカーにも渡さない
+
+        ドメインのブレーカーが開いていて取得しなかったタスクに使う（期限切れのリースと同じ扱いで再び借りられる）
+        """
+        def update(conn):
+            now = time.time()
+            cursor = conn.execute(
+                'UPDATE tasks SET lease_id = NULL, lease_owner = NULL, lease_until = ?, attempts = MAX(0, attempts - 1), '
+                'updated_at = ? WHERE url = ? AND lease_id = ? AND state = ?',
+                (now + delay, now, task['url'], task['lease_id'], TASK_LEASED)
+            )
+            return cursor.rowcount == 1
+        return self._transaction(update)
+
+    def retry_failed(self):
+        """失敗したタスクを未処理に戻す（試行回数もリセット）。戻した件数を返す"""
+        def update(conn):
+            cursor = conn.execute(
+                'UPDATE tasks SET state = ?, attempts = 0, updated_at = ? WHERE state = ?',
+                (TASK_PENDING, time.time(), TASK_FAILED)
+            )
+            return cursor.rowcount
+        return self._transaction(update)
+
+    def counts(self):
+        """状態 -> タスク数（期限切れのリースは pending として数える）"""
+        now = time.time()
+        rows = self._query(
+            'SELECT CASE WHEN state = ? AND lease_until < ? THEN ? ELSE state END AS state, COUNT(*) AS n '
+            'FROM tasks GROUP BY 1', (TASK_LEASED, now, TASK_PENDING)
+        )
+        counts = {state: 0 for state in (TASK_PENDING, TASK_LEASED, TASK_DONE, TASK_FAILED)}
+        counts.update({row['state']: row['n'] for row in rows})
+        return counts
+
+    def drained(self):
+        """未処理・処理中のタスクが残っていないか"""
+        counts = self.counts()
+        return counts[TASK_PENDING] == 0 and counts[TASK_LEASED] == 0
+
+    def source_counts(self):
+        """一覧ページのURL -> {状態: タスク数, 'records': 抽出件数}"""
+        result = {}
+        for row in self._query('SELECT source, state, COUNT(*) AS n FROM tasks GROUP BY source, state'):
+            result.setdefault(row['source'], {'records': 0})[row['state']] = row['n']
+        for row in self._query('SELECT source, COUNT(*) AS n FROM records GROUP BY source'):
+            result.setdefault(row['source'], {'records': 0})['records'] = row['n']
+        return result
+
+    def failed_tasks(self):
+        rows = self._query('SELECT url, kind, source, attempts, error FROM tasks WHERE state = ? ORDER BY url',
+                           (TASK_FAILED,))
+        return [dict(row) for row in rows]
+
+    def iter_records(self):
+        """共有の抽出結果を (一覧ページのURL, 店舗情報) の順に返す"""
+        rows = self._query('SELECT source, data FROM records ORDER BY source, created_at')
+        for row in rows:
+            yield row['source'], json.loads(row['data'])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()